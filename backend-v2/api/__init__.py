@@ -1,4 +1,5 @@
 """API routes module"""
 from .chat import router
+from .admin import router as admin_router
 
-__all__ = ["router"]
+__all__ = ["router", "admin_router"]
@@ -0,0 +1,54 @@
+"""
+Admin API endpoints (knowledge-base ingestion)
+"""
+import logging
+import secrets
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+
+from config.settings import settings
+from models.schemas import IngestRequest, IngestJobResponse
+from services.ingestion import ingestion_service, SourceDocument
+
+logger = logging.getLogger(__name__)
+
+
+def require_admin(x_admin_token: Optional[str] = Header(default=None)) -> None:
+    """Check the X-Admin-Token header against ADMIN_API_TOKEN"""
+    if not settings.admin_api_token:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Admin API disabled (ADMIN_API_TOKEN not set)",
+        )
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, settings.admin_api_token):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid admin token")
+
+
+router = APIRouter(prefix="/api/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+
+@router.post("/ingest", response_model=IngestJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def ingest(request: IngestRequest):
+    """
+    Ingest text/markdown documents into an agent's knowledge base in the background
+
+    Unchanged documents and chunks are skipped; poll GET /api/admin/ingest/{job_id}
+    for progress. Large corpora and PDFs are better served by the CLI
+    (python -m services.ingestion).
+    """
+    documents = [
+        SourceDocument(document.filename, lambda content=document.content: iter([content]))
+        for document in request.documents
+    ]
+    job = ingestion_service.start_job(request.agent, documents, request.force)
+    logger.info(f"Ingestion job {job.id} started: {len(documents)} documents for {request.agent}")
+    return IngestJobResponse(**job.to_dict())
+
+
+@router.get("/ingest/{job_id}", response_model=IngestJobResponse)
+async def ingest_status(job_id: str):
+    """Status and counts of an ingestion job"""
+    job = ingestion_service.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown ingestion job")
+    return IngestJobResponse(**job.to_dict())
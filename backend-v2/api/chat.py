@@ -1,11 +1,16 @@
 """
 Chat API endpoints
 """
+import json
 import logging
-import asyncio
+import time
 from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 
+from config.settings import settings
 from models.schemas import (
     ChatRequest,
     ChatResponse,
@@ -13,13 +18,158 @@ from models.schemas import (
     ErrorResponse,
 )
 from services.openrouter_client import openrouter_client
-from services.rag_service import rag_service
+from services.rag_service import rag_service, is_grounded, QueryContext
 from services.conversation_service import conversation_service
+from services.speculative_rag import SpeculativeRetrieval
+from services.semantic_cache import semantic_cache
+from services.fast_router import fast_router
+from services.rate_limiter import rate_limiter
+from services.message_writer import message_writer
+from services.conversation_summarizer import conversation_summarizer
+from services.answer_bank import answer_bank
+from services.metrics import span, observe_stage, start_trace, format_trace
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api", tags=["chat"])
 
+ESCALATION_MESSAGE = (
+    "Je ne suis pas sûre de bien comprendre votre besoin. "
+    "Pourriez-vous reformuler ou préciser ce que vous recherchez ? "
+    "Cela m'aidera à vous diriger vers la bonne experte (Audrey pour l'automatisation ou Carole pour la création de contenu)."
+)
+
+
+async def _route_message(
+    request: ChatRequest,
+    query_context: QueryContext,
+) -> Tuple[List[Dict[str, str]], Dict[str, Any], Optional[SpeculativeRetrieval]]:
+    """
+    Shared front half of the chat pipeline: rate limit, conversation,
+    history and orchestrator decision
+
+    When speculative RAG is enabled, retrieval for both agents starts right
+    after the rate limit check and runs alongside history and routing.
+
+    Returns:
+        Tuple of (history, decision, speculation or None)
+    """
+    # Step 1: Rate limit check (in-process, reconciled with Supabase in the background)
+    with span("rate_limit"):
+        allowed, remaining = rate_limiter.acquire(request.conversation_id, request.user_id)
+    if not allowed:
+        logger.warning(f"Rate limit exceeded for conversation {request.conversation_id}")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Rate limit exceeded. Please wait before sending more messages. Remaining: {remaining}"
+        )
+
+    speculation = SpeculativeRetrieval(query_context) if settings.speculative_rag_enabled else None
+
+    try:
+        # Step 2: Ensure conversation exists (off the critical path; the message writer awaits it)
+        if not conversation_service.is_known_conversation(request.conversation_id):
+            conversation_service.start_conversation(request.conversation_id, request.user_id)
+
+        # Step 3: Load conversation history (async)
+        with span("load_history"):
+            history = await conversation_service.load_history(request.conversation_id)
+
+        # Step 4: Banked answer for frequent first-turn questions, sticky agent on
+        # follow-ups, then fast local router, then LLM orchestrator
+        logger.info(f"Processing message for conversation {request.conversation_id}")
+        decision = None
+        if settings.answer_bank_enabled and not history:
+            with span("answer_bank"):
+                decision = await answer_bank.decision(query_context)
+            source = "answer_bank"
+        if decision is None and settings.sticky_routing_enabled and history:
+            decision = fast_router.sticky_decision(
+                request.message,
+                conversation_service.last_routing(request.conversation_id),
+            )
+            source = "sticky"
+        if decision is None and settings.fast_router_enabled:
+            with span("fast_router"):
+                decision = await fast_router.route(
+                    request.message,
+                    embed=lambda: rag_service.embed_query(query_context),
+                )
+            source = "fast_router"
+        if decision is None:
+            with span("orchestrate", model=settings.orchestrator_model):
+                decision = await openrouter_client.orchestrate(
+                    user_message=request.message,
+                    history=history,
+                )
+            source = "llm"
+
+        decision["source"] = source
+        logger.info(f"Routing decided by {source}: {decision['agent']} (confidence: {decision['confidence']})")
+        conversation_service.remember_routing(
+            request.conversation_id,
+            decision["agent"],
+            decision["confidence"],
+            sticky=source == "sticky",
+        )
+
+    except BaseException:
+        if speculation:
+            speculation.cancel()
+        raise
+
+    if speculation and (decision["agent"] == "escalate" or decision["source"] == "answer_bank"):
+        speculation.cancel()
+
+    return history, decision, speculation
+
+
+async def _retrieve_context(
+    query_context: QueryContext,
+    agent: str,
+    speculation: Optional[SpeculativeRetrieval],
+) -> str:
+    """Agent RAG context, from the speculative branch when one is running"""
+    with span("retrieval", agent=agent):
+        if speculation:
+            return await speculation.resolve(agent)
+        return await rag_service.rag_pipeline(query_context, agent)
+
+
+async def _semantic_lookup(
+    query_context: QueryContext,
+    agent: str,
+    history: List[Dict[str, str]],
+) -> Optional[str]:
+    """Cached answer for a near-identical first-turn question, if enabled"""
+    # History can change the right answer, so only history-free turns are served
+    if not settings.semantic_cache_enabled or history:
+        return None
+    with span("semantic_cache", agent=agent):
+        try:
+            embedding = await rag_service.embed_query(query_context)
+        except Exception as e:
+            logger.error(f"Semantic cache lookup skipped: {str(e)}")
+            return None
+        return semantic_cache.lookup(agent, embedding)
+
+
+async def _semantic_store(
+    query_context: QueryContext,
+    agent: str,
+    history: List[Dict[str, str]],
+    rag_context: str,
+    response_text: str,
+) -> None:
+    """Remember a first-turn answer that was grounded in retrieved context"""
+    if not settings.semantic_cache_enabled or history or not is_grounded(rag_context):
+        return
+    try:
+        embedding = await rag_service.embed_query(query_context)
+    except Exception:
+        return
+    semantic_cache.store(agent, embedding, response_text)
+
 
 @router.post(
     "/chat",
@@ -36,80 +186,73 @@ async def chat(request: ChatRequest) -> ChatResponse:
     Process:
     1. Rate limit check
     2. Load conversation history
-    3. Orchestrator decides which agent
-    4. Agent-specific RAG retrieval
-    5. Generate response with context
-    6. Save messages asynchronously
+    3. Answer bank (frequent first-turn questions, if enabled), else orchestrator decides which agent
+    4. Semantic cache lookup (first-turn questions, if enabled)
+    5. Agent-specific RAG retrieval
+    6. Generate response with context
+    7. Save messages asynchronously
 
     Returns:
         ChatResponse with agent's message and metadata
     """
+    trace = start_trace()
+    speculation: Optional[SpeculativeRetrieval] = None
     try:
-        # Step 1: Rate limit check
-        rate_status = await conversation_service.check_rate_limit(request.conversation_id)
-        if not rate_status["allowed"]:
-            logger.warning(f"Rate limit exceeded for conversation {request.conversation_id}")
-            raise HTTPException(
-                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                detail=f"Rate limit exceeded. Please wait before sending more messages. Remaining: {rate_status['remaining']}"
-            )
-
-        # Step 2: Ensure conversation exists
-        await conversation_service.ensure_conversation_exists(
-            conversation_id=request.conversation_id,
-            user_id=request.user_id,
-        )
-
-        # Step 3: Load conversation history (async)
-        history = await conversation_service.load_history(request.conversation_id)
-
-        # Step 4: Orchestrator decides which agent
-        logger.info(f"Processing message for conversation {request.conversation_id}")
-        decision = await openrouter_client.orchestrate(
-            user_message=request.message,
-            history=history,
-        )
+        query_context = QueryContext(request.message)
+        history, decision, speculation = await _route_message(request, query_context)
 
         # Handle escalation
         if decision["agent"] == "escalate":
             logger.info(f"Message escalated (low confidence: {decision['confidence']})")
-            response_text = (
-                "Je ne suis pas sûre de bien comprendre votre besoin. "
-                "Pourriez-vous reformuler ou préciser ce que vous recherchez ? "
-                "Cela m'aidera à vous diriger vers la bonne experte (Audrey pour l'automatisation ou Carole pour la création de contenu)."
-            )
+            response_text = ESCALATION_MESSAGE
             agent_used = "escalate"
             rag_context = ""
 
+        elif decision["source"] == "answer_bank":
+            # Pre-generated answer from the answer bank: no retrieval or generation
+            agent_used = decision["agent"]
+            response_text = decision["answer"]
+
         else:
-            # Step 5: Agent-specific RAG retrieval
-            if decision["agent"] == "audrey":
-                rag_context = await rag_service.rag_audrey(request.message)
-                response_text = await openrouter_client.audrey_response(
-                    user_message=request.message,
-                    history=history,
-                    rag_context=rag_context,
-                )
-                agent_used = "audrey"
+            agent_used = "audrey" if decision["agent"] == "audrey" else "carole"
 
-            else:  # carole
-                rag_context = await rag_service.rag_carole(request.message)
-                response_text = await openrouter_client.carole_response(
-                    user_message=request.message,
-                    history=history,
-                    rag_context=rag_context,
-                )
-                agent_used = "carole"
+            # Step 5: Semantic cache for near-identical first-turn questions
+            cached_text = await _semantic_lookup(query_context, agent_used, history)
+            if cached_text is not None:
+                if speculation:
+                    speculation.cancel()
+                response_text = cached_text
 
-        # Step 6: Save messages (fire-and-forget async)
-        asyncio.create_task(
-            _save_conversation_messages(
-                conversation_id=request.conversation_id,
-                user_message=request.message,
-                assistant_message=response_text,
-                agent=agent_used,
-            )
+            else:
+                # Step 6: Agent-specific RAG retrieval and generation
+                rag_context = await _retrieve_context(query_context, agent_used, speculation)
+                with span("generation", agent=agent_used, model=openrouter_client.models[agent_used]):
+                    if agent_used == "audrey":
+                        response_text = await openrouter_client.audrey_response(
+                            user_message=request.message,
+                            history=history,
+                            rag_context=rag_context,
+                        )
+                    else:  # carole
+                        response_text = await openrouter_client.carole_response(
+                            user_message=request.message,
+                            history=history,
+                            rag_context=rag_context,
+                        )
+
+                await _semantic_store(query_context, agent_used, history, rag_context, response_text)
+
+        # Step 7: Queue messages for the batched background writer
+        await _save_conversation_messages(
+            conversation_id=request.conversation_id,
+            user_id=request.user_id,
+            user_message=request.message,
+            assistant_message=response_text,
+            agent=agent_used,
         )
+        if settings.conversation_summary_enabled:
+            conversation_summarizer.schedule(request.conversation_id, history)
+        logger.info(f"Trace for conversation {request.conversation_id}: {format_trace(trace)}")
 
         # Return response
         return ChatResponse(
@@ -118,6 +261,7 @@ async def chat(request: ChatRequest) -> ChatResponse:
             agent=agent_used,
             confidence=decision["confidence"],
             reasoning=decision["reasoning"],
+            routing_source=decision["source"],
             timestamp=datetime.now(timezone.utc).isoformat(),
         )
 
@@ -129,33 +273,156 @@ async def chat(request: ChatRequest) -> ChatResponse:
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"An error occurred processing your message: {str(e)}"
         )
+    finally:
+        # Client gone (request cancelled) or generation failed: stop speculative searches
+        if speculation:
+            speculation.cancel()
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    """Format one Server-Sent Event frame"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post(
+    "/chat/stream",
+    responses={
+        200: {"content": {"text/event-stream": {}}, "description": "Server-Sent Events stream"},
+        429: {"model": ErrorResponse, "description": "Rate limit exceeded"},
+        500: {"model": ErrorResponse, "description": "Internal server error"},
+    },
+)
+async def chat_stream(request: ChatRequest) -> StreamingResponse:
+    """
+    Streaming variant of the chat endpoint (Server-Sent Events)
+
+    Events, in order:
+    - ``decision``: routing decision (agent, confidence, reasoning)
+    - ``delta``: one per chunk of generated text
+    - ``done``: end of stream, with the full message and timestamp
+    - ``error``: sent instead of ``done`` if generation fails mid-stream
+
+    Messages are saved once the stream has finished.
+    """
+    trace = start_trace()
+    try:
+        query_context = QueryContext(request.message)
+        history, decision, speculation = await _route_message(request, query_context)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Chat stream routing error: {str(e)}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"An error occurred processing your message: {str(e)}"
+        )
+
+    async def event_stream() -> AsyncIterator[str]:
+        try:
+            agent_used = decision["agent"]
+            yield _sse("decision", {
+                "conversation_id": request.conversation_id,
+                "agent": agent_used,
+                "confidence": decision["confidence"],
+                "reasoning": decision["reasoning"],
+                "routing_source": decision["source"],
+            })
+
+            parts: List[str] = []
+            try:
+                if agent_used == "escalate":
+                    logger.info(f"Message escalated (low confidence: {decision['confidence']})")
+                    parts.append(ESCALATION_MESSAGE)
+                    yield _sse("delta", {"text": ESCALATION_MESSAGE})
+
+                elif decision["source"] == "answer_bank":
+                    parts.append(decision["answer"])
+                    yield _sse("delta", {"text": decision["answer"]})
+
+                else:
+                    cached_text = await _semantic_lookup(query_context, agent_used, history)
+                    if cached_text is not None:
+                        if speculation:
+                            speculation.cancel()
+                        parts.append(cached_text)
+                        yield _sse("delta", {"text": cached_text})
+
+                    else:
+                        rag_context = await _retrieve_context(query_context, agent_used, speculation)
+
+                        model = openrouter_client.models[agent_used]
+                        with span("generation", agent=agent_used, model=model):
+                            started = time.perf_counter()
+                            async for delta in openrouter_client.stream_agent_response(
+                                agent=agent_used,
+                                user_message=request.message,
+                                history=history,
+                                rag_context=rag_context,
+                            ):
+                                if not parts:
+                                    observe_stage("first_token", time.perf_counter() - started, agent_used, model)
+                                parts.append(delta)
+                                yield _sse("delta", {"text": delta})
+
+                        await _semantic_store(query_context, agent_used, history, rag_context, "".join(parts))
+
+            except Exception as e:
+                logger.error(f"Chat stream generation error: {str(e)}", exc_info=True)
+                yield _sse("error", {"detail": "An error occurred while generating the response"})
+                return
+
+            response_text = "".join(parts)
+            yield _sse("done", {
+                "conversation_id": request.conversation_id,
+                "message": response_text,
+                "agent": agent_used,
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+            })
+
+            # Queue the assembled messages once the stream has finished
+            await _save_conversation_messages(
+                conversation_id=request.conversation_id,
+                user_id=request.user_id,
+                user_message=request.message,
+                assistant_message=response_text,
+                agent=agent_used,
+            )
+            if settings.conversation_summary_enabled:
+                conversation_summarizer.schedule(request.conversation_id, history)
+            logger.info(f"Trace for conversation {request.conversation_id}: {format_trace(trace)}")
+        finally:
+            # Client gone mid-stream, or a branch the answer did not use: stop speculative searches
+            if speculation:
+                speculation.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        },
+        # Also runs when the client disconnects before event_stream() has started
+        background=BackgroundTask(speculation.cancel) if speculation else None,
+    )
 
 
 async def _save_conversation_messages(
     conversation_id: str,
+    user_id: str,
     user_message: str,
     assistant_message: str,
     agent: str,
 ) -> None:
     """
     Helper to save both user and assistant messages
-    Runs asynchronously without blocking the response
+    Queues them for the write-behind writer; only waits when the queue is full
     """
     try:
-        # Save user message
-        await conversation_service.save_message(
-            conversation_id=conversation_id,
-            role="user",
-            content=user_message,
-        )
-
-        # Save assistant message
-        await conversation_service.save_message(
-            conversation_id=conversation_id,
-            role="assistant",
-            content=assistant_message,
-            agent=agent,
-        )
+        await message_writer.enqueue(user_id, [
+            conversation_service.record_message(conversation_id, "user", user_message),
+            conversation_service.record_message(conversation_id, "assistant", assistant_message, agent),
+        ])
 
     except Exception as e:
         logger.error(f"Failed to save conversation messages: {str(e)}")
@@ -176,10 +443,12 @@ async def check_rate_limit(conversation_id: str) -> RateLimitResponse:
         RateLimitResponse with current limit status
     """
     try:
-        status = await conversation_service.check_rate_limit(conversation_id)
+        remaining = rate_limiter.remaining(conversation_id)
         return RateLimitResponse(
-            allowed=status["allowed"],
-            remaining=status["remaining"],
+            allowed=remaining >= 1,
+            remaining=remaining,
+            limit=settings.rate_limit_messages,
+            window_seconds=settings.rate_limit_window_seconds,
         )
 
     except Exception as e:
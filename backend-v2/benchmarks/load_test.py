@@ -0,0 +1,345 @@
+"""
+Load test of /api/chat against local stub upstreams, at rising concurrency
+
+Starts the stub upstreams (stub_upstreams.py) in-process, launches the
+backend with uvicorn pointed at them, then replays conversation mixes with
+an increasing number of concurrent virtual users. For each level it reports
+throughput, client-side latency percentiles, per-stage latency percentiles
+(from the backend's /metrics histograms) and upstream calls per request.
+
+Conversations come from a JSONL file (one conversation per line) or from a
+built-in mix of first-turn questions, follow-ups and popular repeats:
+
+    {"turns": ["Comment créer un tunnel de vente ?", "et pour les emails ?"]}
+
+Backend settings can be overridden per run to compare configurations:
+
+    python benchmarks/load_test.py --profile realistic --concurrency 1,8,32 \\
+        --env HISTORY_CACHE_ENABLED=true --env FAST_ROUTER_ENABLED=true
+
+At high concurrency, run the stubs in their own process so they do not
+share an event loop with the load generator:
+
+    python benchmarks/stub_upstreams.py --port 8911 --profile realistic &
+    python benchmarks/load_test.py --stub-url http://127.0.0.1:8911
+
+Usage (from backend-v2/):
+
+    python benchmarks/load_test.py [--profile instant|realistic|degraded]
+        [--concurrency 1,4,16,32] [--requests 100] [--stream-ratio 0.0]
+        [--scenarios conversations.jsonl] [--env KEY=VALUE ...] [--json results.json]
+        [--stub-url http://127.0.0.1:8911]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import uvicorn
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_upstreams import PROFILES, StubState, create_app  # noqa: E402
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_CONVERSATIONS: List[List[str]] = [
+    ["Comment créer un tunnel de vente sur Systeme.io ?", "et pour la séquence email après l'achat ?"],
+    ["Donne-moi des idées de reels pour lancer mon offre", "et pour les stories ?", "merci, et le hook ?"],
+    ["Comment connecter Kajabi à Zapier ?"],
+    ["Quelle fréquence de publication sur Instagram ?", "et combien de carrousels par semaine ?"],
+    ["Comment améliorer le taux de conversion de ma page de vente ?"],
+    ["J'ai besoin d'aide pour mon business en ligne", "je vends des formations"],
+    # Popular first-turn questions, asked again and again by different users
+    ["C'est quoi un tunnel de vente ?"],
+    ["Comment trouver mon style visuel sur Instagram ?"],
+]
+
+STAGE_LINE = re.compile(
+    r'^chat_stage_duration_seconds_bucket\{stage="([^"]*)",agent="[^"]*",model="[^"]*",le="([^"]+)"\} (\d+)$'
+)
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))]
+
+
+def parse_stage_buckets(text: str) -> Dict[str, Dict[float, int]]:
+    """Cumulative bucket counts per stage, summed over agent/model labels"""
+    stages: Dict[str, Dict[float, int]] = defaultdict(lambda: defaultdict(int))
+    for line in text.splitlines():
+        match = STAGE_LINE.match(line)
+        if match:
+            stage, le, count = match.groups()
+            stages[stage][float(le)] += int(count)
+    return stages
+
+
+def bucket_quantile(buckets: List[Tuple[float, int]], q: float) -> Optional[float]:
+    """Quantile from cumulative (upper bound, count) pairs, like histogram_quantile()"""
+    total = buckets[-1][1] if buckets else 0
+    if not total:
+        return None
+    target = q * total
+    previous_bound, previous_count = 0.0, 0
+    for bound, count in buckets:
+        if count >= target:
+            if bound == float("inf"):
+                return previous_bound
+            span = count - previous_count
+            fraction = (target - previous_count) / span if span else 1.0
+            return previous_bound + (bound - previous_bound) * fraction
+        previous_bound, previous_count = bound, count
+    return previous_bound
+
+
+def stage_percentiles(before: str, after: str) -> Dict[str, Dict[str, float]]:
+    """p50/p95/p99 (ms) per stage for the observations between two scrapes"""
+    start, end = parse_stage_buckets(before), parse_stage_buckets(after)
+    result = {}
+    for stage, buckets in end.items():
+        delta = sorted((le, count - start.get(stage, {}).get(le, 0)) for le, count in buckets.items())
+        if not delta or not delta[-1][1]:
+            continue
+        result[stage] = {
+            "count": delta[-1][1],
+            **{
+                name: round(bucket_quantile(delta, q) * 1000, 1)
+                for name, q in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99))
+            },
+        }
+    return result
+
+
+def load_conversations(path: Optional[str]) -> List[List[str]]:
+    if not path:
+        return DEFAULT_CONVERSATIONS
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line)["turns"] for line in f if line.strip()]
+
+
+class LevelResult:
+    def __init__(self):
+        self.latencies_ms: List[float] = []
+        self.first_delta_ms: List[float] = []
+        self.statuses: Counter = Counter()
+
+
+async def send_turn(client: httpx.AsyncClient, payload: dict, stream: bool, result: LevelResult) -> None:
+    started = time.perf_counter()
+    try:
+        if not stream:
+            response = await client.post("/api/chat", json=payload)
+            result.statuses[response.status_code] += 1
+        else:
+            async with client.stream("POST", "/api/chat/stream", json=payload) as response:
+                result.statuses[response.status_code] += 1
+                first_delta = None
+                async for line in response.aiter_lines():
+                    if first_delta is None and line == "event: delta":
+                        first_delta = (time.perf_counter() - started) * 1000
+                        result.first_delta_ms.append(first_delta)
+    except httpx.HTTPError:
+        result.statuses["network"] += 1
+    result.latencies_ms.append((time.perf_counter() - started) * 1000)
+
+
+async def virtual_user(
+    client: httpx.AsyncClient,
+    conversations: List[List[str]],
+    budget: List[int],
+    stream_ratio: float,
+    rnd: random.Random,
+    result: LevelResult,
+) -> None:
+    """Run whole conversations (turns in order) until the level's request budget is spent"""
+    while budget[0] > 0:
+        conversation_id = str(uuid.uuid4())
+        user_id = f"load-{uuid.uuid4().hex[:12]}"
+        for message in rnd.choice(conversations):
+            if budget[0] <= 0:
+                return
+            budget[0] -= 1
+            payload = {"user_id": user_id, "conversation_id": conversation_id, "message": message}
+            await send_turn(client, payload, rnd.random() < stream_ratio, result)
+
+
+async def wait_for_backend(client: httpx.AsyncClient, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Backend exited with code {process.returncode}")
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("Backend did not become healthy in time")
+
+
+def backend_env(stub_url: str, overrides: List[str], spill_dir: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "SUPABASE_URL": stub_url,
+        "SUPABASE_SERVICE_KEY": "stub-key",
+        "OPENROUTER_API_KEY": "stub-key",
+        "OPENROUTER_BASE_URL": f"{stub_url}/openrouter/api/v1",
+        "OPENAI_API_KEY": "stub-key",
+        "OPENAI_BASE_URL": f"{stub_url}/openai/v1",
+        "COHERE_API_KEY": "stub-key",
+        "CO_API_URL": f"{stub_url}/cohere",
+        "MESSAGE_SPILL_PATH": os.path.join(spill_dir, "message_spill.jsonl"),
+        # Load users send more than a human would; limits are not what is measured
+        "RATE_LIMIT_MESSAGES": "1000",
+        "RATE_LIMIT_USER_MESSAGES": "1000",
+    })
+    for override in overrides:
+        key, _, value = override.partition("=")
+        env[key] = value
+    return env
+
+
+def print_level(concurrency: int, summary: dict) -> None:
+    print(f"\n=== concurrency {concurrency}: {summary['requests']} requests in {summary['elapsed_s']:.1f}s ===")
+    print(
+        f"throughput {summary['throughput_rps']:.1f} req/s, errors {summary['error_rate'] * 100:.1f}%, "
+        f"latency p50 {summary['p50_ms']:.0f}ms p95 {summary['p95_ms']:.0f}ms p99 {summary['p99_ms']:.0f}ms"
+    )
+    if summary.get("first_delta_p50_ms") is not None:
+        print(f"stream first delta p50 {summary['first_delta_p50_ms']:.0f}ms p95 {summary['first_delta_p95_ms']:.0f}ms")
+
+    print(f"\n{'stage':<22}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, values in sorted(summary["stages"].items(), key=lambda item: -item[1]["p50"]):
+        print(f"{stage:<22}{values['count']:>8}{values['p50']:>10.1f}{values['p95']:>10.1f}{values['p99']:>10.1f}")
+
+    print(f"\n{'upstream call':<36}{'per request':>12}")
+    for name, per_request in sorted(summary["upstream_calls_per_request"].items()):
+        print(f"{name:<36}{per_request:>12.2f}")
+
+
+async def run(args: argparse.Namespace) -> List[dict]:
+    stub, stub_task = None, None
+    stub_url = args.stub_url
+    if not stub_url:
+        stub_url = f"http://127.0.0.1:{args.stub_port}"
+        stub = uvicorn.Server(uvicorn.Config(
+            create_app(StubState(args.profile)), host="127.0.0.1", port=args.stub_port, log_level="warning",
+        ))
+        stub_task = asyncio.create_task(stub.serve())
+
+    spill_dir = tempfile.mkdtemp(prefix="load-test-")
+    log = open(os.path.join(spill_dir, "backend.log"), "w")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+         "--port", str(args.app_port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=backend_env(stub_url, args.env, spill_dir),
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    print(f"Profile {args.profile if not args.stub_url else 'external'}, backend log: {log.name}")
+
+    conversations = load_conversations(args.scenarios)
+    rnd = random.Random(args.seed)
+    results = []
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    try:
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{args.app_port}", timeout=120.0, limits=limits,
+        ) as client, httpx.AsyncClient(base_url=stub_url, timeout=10.0) as stubs:
+            await wait_for_backend(client, process)
+
+            for concurrency in args.concurrency:
+                await stubs.post("/_reset")
+                before = (await client.get("/metrics")).text
+                result = LevelResult()
+                budget = [args.requests]
+
+                started = time.perf_counter()
+                await asyncio.gather(*[
+                    virtual_user(client, conversations, budget, args.stream_ratio, rnd, result)
+                    for _ in range(concurrency)
+                ])
+                elapsed = time.perf_counter() - started
+
+                # Let background writes of this level land before counting upstream calls
+                await asyncio.sleep(args.settle_seconds)
+                after = (await client.get("/metrics")).text
+                calls = (await stubs.get("/_stats")).json()
+
+                requests = len(result.latencies_ms)
+                errors = requests - result.statuses.get(200, 0)
+                summary = {
+                    "concurrency": concurrency,
+                    "requests": requests,
+                    "elapsed_s": round(elapsed, 3),
+                    "throughput_rps": round(requests / elapsed, 2) if elapsed else 0.0,
+                    "error_rate": round(errors / requests, 4) if requests else 0.0,
+                    "statuses": {str(code): count for code, count in result.statuses.items()},
+                    "p50_ms": percentile(result.latencies_ms, 0.50),
+                    "p95_ms": percentile(result.latencies_ms, 0.95),
+                    "p99_ms": percentile(result.latencies_ms, 0.99),
+                    "mean_ms": statistics.mean(result.latencies_ms),
+                    "first_delta_p50_ms": percentile(result.first_delta_ms, 0.50) if result.first_delta_ms else None,
+                    "first_delta_p95_ms": percentile(result.first_delta_ms, 0.95) if result.first_delta_ms else None,
+                    "stages": stage_percentiles(before, after),
+                    "upstream_calls_per_request": {
+                        name: round(count / requests, 3) for name, count in calls.items()
+                    },
+                }
+                results.append(summary)
+                print_level(concurrency, summary)
+
+    finally:
+        # SIGTERM lets the backend drain its queues like a normal shutdown
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        log.close()
+        if stub is not None:
+            stub.should_exit = True
+            await stub_task
+
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="realistic")
+    parser.add_argument("--concurrency", default="1,4,16,32",
+                        type=lambda value: [int(level) for level in value.split(",")])
+    parser.add_argument("--requests", type=int, default=100, help="Requests per concurrency level")
+    parser.add_argument("--stream-ratio", type=float, default=0.0, help="Share of turns sent to /api/chat/stream")
+    parser.add_argument("--scenarios", help="JSONL file of conversations ({\"turns\": [...]})")
+    parser.add_argument("--env", action="append", default=[], help="Backend setting override KEY=VALUE")
+    parser.add_argument("--app-port", type=int, default=8811)
+    parser.add_argument("--stub-port", type=int, default=8911)
+    parser.add_argument("--stub-url", help="Use stubs already running there (stub_upstreams.py)")
+    parser.add_argument("--settle-seconds", type=float, default=1.5)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="Write per-level results to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"profile": args.profile, "env": args.env, "levels": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
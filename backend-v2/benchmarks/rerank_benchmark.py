@@ -0,0 +1,141 @@
+"""
+Compare reranker backends (quality and latency) on labelled queries
+
+Each line of the input JSONL file is one labelled query:
+
+    {"query": "comment créer un tunnel de vente", "agent": "audrey", "relevant": ["tunnel-systeme-io.pdf"]}
+    {"query": "idées de reels", "agent": "carole", "relevant": ["reels-100-idees.pdf"]}
+
+`relevant` lists the filenames (as returned by match_documents_{agent}) of
+the chunks that should come first. Candidates are retrieved once per query
+through the normal embedding + vector search path, then every backend
+reranks the same candidates.
+
+Usage (from backend-v2/, with a configured .env):
+
+    python benchmarks/rerank_benchmark.py queries.jsonl [--top-n 3] [--backends vector,hybrid,cohere,skip+cohere]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from typing import List, Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import settings  # noqa: E402
+from services.http_clients import http_clients  # noqa: E402
+from services.rag_service import rag_service  # noqa: E402
+from services.rerankers import (  # noqa: E402
+    Reranker,
+    CohereReranker,
+    HybridReranker,
+    DecisiveSkipReranker,
+)
+
+
+class VectorOnly(Reranker):
+    """Baseline: keep the vector search order"""
+
+    name = "vector"
+
+    async def rerank(self, query, documents, similarities, top_n):
+        return [
+            {"text": documents[i], "score": similarities[i], "index": i}
+            for i in range(min(top_n, len(documents)))
+        ]
+
+
+def build_backends(names: List[str]) -> Dict[str, Reranker]:
+    def base(name: str) -> Reranker:
+        if name == "vector":
+            return VectorOnly()
+        if name == "hybrid":
+            return HybridReranker(alpha=settings.rerank_hybrid_alpha)
+        if name == "cohere":
+            return CohereReranker(rag_service.cohere_client)
+        raise ValueError(f"Unknown backend: {name}")
+
+    backends = {}
+    for name in names:
+        if name.startswith("skip+"):
+            backends[name] = DecisiveSkipReranker(
+                inner=base(name[len("skip+"):]),
+                min_top_similarity=settings.rerank_skip_min_similarity,
+                min_margin=settings.rerank_skip_min_margin,
+            )
+        else:
+            backends[name] = base(name)
+    return backends
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))]
+
+
+async def run(path: str, backend_names: List[str], top_n: int) -> None:
+    with open(path, encoding="utf-8") as f:
+        queries = [json.loads(line) for line in f if line.strip()]
+
+    backends = build_backends(backend_names)
+    results: Dict[str, Dict[str, List[float]]] = {
+        name: {"rr": [], "hit": [], "latency_ms": []} for name in backends
+    }
+
+    for item in queries:
+        embedding = await rag_service.generate_embedding(item["query"])
+        chunks = await rag_service.vector_search(embedding, item["agent"])
+        if not chunks:
+            print(f"  (no candidates) {item['query']}")
+            continue
+
+        documents = [chunk["content"] for chunk in chunks]
+        similarities = [chunk.get("similarity", 0.0) for chunk in chunks]
+        relevant = set(item["relevant"])
+
+        for name, backend in backends.items():
+            started = time.perf_counter()
+            ranked = await backend.rerank(item["query"], documents, similarities, top_n)
+            results[name]["latency_ms"].append((time.perf_counter() - started) * 1000)
+
+            filenames = [chunks[r["index"]].get("filename") for r in ranked]
+            rank = next((i for i, filename in enumerate(filenames, 1) if filename in relevant), None)
+            results[name]["rr"].append(1.0 / rank if rank else 0.0)
+            results[name]["hit"].append(1.0 if rank else 0.0)
+
+    await http_clients.shutdown()
+
+    print(f"\n{len(queries)} queries, top_n={top_n}\n")
+    print(f"{'backend':<16}{'MRR':>8}{'hit@n':>8}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, metrics in results.items():
+        if not metrics["latency_ms"]:
+            continue
+        print(
+            f"{name:<16}"
+            f"{statistics.mean(metrics['rr']):>8.3f}"
+            f"{statistics.mean(metrics['hit']):>8.3f}"
+            f"{percentile(metrics['latency_ms'], 0.50):>10.1f}"
+            f"{percentile(metrics['latency_ms'], 0.95):>10.1f}"
+        )
+        backend = backends[name]
+        if isinstance(backend, DecisiveSkipReranker):
+            total = backend.skipped + backend.delegated
+            print(f"{'':<16}skipped {backend.skipped}/{total} queries")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("queries", help="JSONL file of labelled queries")
+    parser.add_argument("--top-n", type=int, default=settings.rag_rerank_top_n)
+    parser.add_argument("--backends", default="vector,hybrid,cohere,skip+cohere")
+    args = parser.parse_args()
+
+    asyncio.run(run(args.queries, args.backends.split(","), args.top_n))
+
+
+if __name__ == "__main__":
+    main()
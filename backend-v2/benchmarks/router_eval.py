@@ -0,0 +1,112 @@
+"""
+Offline evaluation of the fast local router against labelled transcripts
+
+Each line of the input JSONL file is one user message with its expected agent:
+
+    {"message": "Comment connecter Kajabi à Zapier ?", "agent": "audrey"}
+    {"message": "et pour les stories ?", "agent": "carole"}
+
+`body` is accepted instead of `message`, and `expected_agent` instead of
+`agent`. Lines without a label are still counted for coverage.
+
+Reports coverage (share decided locally), accuracy of local decisions and
+router latency. With --with-llm, the LLM orchestrator is also run on every
+message to measure agreement and the latency the fast path avoids.
+
+Usage (from backend-v2/):
+
+    python benchmarks/router_eval.py transcripts.jsonl [--with-llm] [--centroids]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import settings  # noqa: E402
+from services.http_clients import http_clients  # noqa: E402
+from services.rag_service import rag_service  # noqa: E402
+from services.fast_router import fast_router  # noqa: E402
+from services.local_vector_index import local_vector_index  # noqa: E402
+from services.openrouter_client import openrouter_client  # noqa: E402
+
+
+async def run(path: str, with_llm: bool, centroids: bool) -> None:
+    with open(path, encoding="utf-8") as f:
+        items = [json.loads(line) for line in f if line.strip()]
+
+    if centroids:
+        for agent in ("audrey", "carole"):
+            await local_vector_index.full_load(agent)
+
+    decided = correct = labelled_decided = 0
+    agree = llm_compared = 0
+    confusion: Counter = Counter()
+    router_ms, llm_ms = [], []
+
+    for item in items:
+        message = item.get("message") or item.get("body", "")
+        expected: Optional[str] = item.get("agent") or item.get("expected_agent")
+
+        async def embed():
+            return await rag_service.generate_embedding(message)
+
+        started = time.perf_counter()
+        decision = await fast_router.route(message, embed=embed if centroids else None)
+        router_ms.append((time.perf_counter() - started) * 1000)
+
+        if decision is not None:
+            decided += 1
+            if expected:
+                labelled_decided += 1
+                correct += decision["agent"] == expected
+                confusion[(expected, decision["agent"])] += 1
+
+        if with_llm:
+            started = time.perf_counter()
+            llm_decision = await openrouter_client.orchestrate(user_message=message, history=[])
+            llm_ms.append((time.perf_counter() - started) * 1000)
+            if decision is not None:
+                llm_compared += 1
+                agree += decision["agent"] == llm_decision["agent"]
+
+    await http_clients.shutdown()
+
+    total = len(items)
+    print(f"\n{total} messages")
+    print(f"Coverage (decided locally): {decided}/{total} = {decided / total:.1%}" if total else "No messages")
+    if labelled_decided:
+        print(f"Accuracy on local decisions: {correct}/{labelled_decided} = {correct / labelled_decided:.1%}")
+        print("Confusion (expected -> routed):")
+        for (expected, routed), count in sorted(confusion.items()):
+            print(f"  {expected:>8} -> {routed:<8} {count}")
+    if router_ms:
+        print(f"Fast router latency: p50 {statistics.median(router_ms):.2f}ms, max {max(router_ms):.2f}ms")
+    if llm_ms:
+        print(f"LLM orchestrator latency: p50 {statistics.median(llm_ms):.0f}ms")
+        if llm_compared:
+            print(f"Agreement with LLM on local decisions: {agree}/{llm_compared} = {agree / llm_compared:.1%}")
+        saved = statistics.mean(llm_ms) * decided / total
+        print(f"Estimated orchestration time saved per message: {saved:.0f}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("transcripts", help="JSONL file of labelled messages")
+    parser.add_argument("--with-llm", action="store_true", help="Also run the LLM orchestrator for comparison")
+    parser.add_argument("--centroids", action="store_true", help="Load knowledge-base centroids from Supabase")
+    args = parser.parse_args()
+
+    if args.centroids:
+        settings.local_index_enabled = True
+    asyncio.run(run(args.transcripts, args.with_llm, args.centroids))
+
+
+if __name__ == "__main__":
+    main()
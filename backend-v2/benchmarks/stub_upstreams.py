@@ -0,0 +1,389 @@
+"""
+Local stand-ins for the backend's upstreams, with latency and error-rate profiles
+
+One FastAPI app serves all of them on a single port:
+
+    /openrouter/api/v1/chat/completions   OpenRouter (JSON and SSE streaming)
+    /openai/v1/embeddings                 OpenAI embeddings
+    /cohere/v1/rerank                     Cohere rerank
+    /rest/v1/...                          Supabase REST and RPC
+
+Point the backend at it with SUPABASE_URL=http://host:port,
+OPENROUTER_BASE_URL=http://host:port/openrouter/api/v1,
+OPENAI_BASE_URL=http://host:port/openai/v1 and CO_API_URL=http://host:port/cohere
+(see load_test.py, which does this for you). GET /_stats returns call counts
+per upstream endpoint and POST /_reset clears them.
+
+Standalone usage (from backend-v2/):
+
+    python benchmarks/stub_upstreams.py [--port 8900] [--profile realistic]
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import struct
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+UPSTREAMS = ("openrouter", "openai", "cohere", "supabase")
+
+
+@dataclass
+class UpstreamProfile:
+    """Latency (lognormal around a median) and error rate of one upstream"""
+
+    median_ms: float
+    sigma: float = 0.3
+    error_rate: float = 0.0
+    # OpenRouter only: delay between streamed chunks
+    chunk_ms: float = 0.0
+
+
+PROFILES: Dict[str, Dict[str, UpstreamProfile]] = {
+    # No artificial latency: measures the backend's own overhead
+    "instant": {name: UpstreamProfile(0.0, 0.0) for name in UPSTREAMS},
+    # Typical public-cloud latencies from a European server
+    "realistic": {
+        "openrouter": UpstreamProfile(900.0, 0.4, chunk_ms=25.0),
+        "openai": UpstreamProfile(120.0, 0.3),
+        "cohere": UpstreamProfile(180.0, 0.3),
+        "supabase": UpstreamProfile(35.0, 0.3),
+    },
+    # Slow, flaky upstreams: exercises fallbacks, retries and spill paths
+    "degraded": {
+        "openrouter": UpstreamProfile(2500.0, 0.6, error_rate=0.05, chunk_ms=60.0),
+        "openai": UpstreamProfile(400.0, 0.5, error_rate=0.02),
+        "cohere": UpstreamProfile(600.0, 0.5, error_rate=0.05),
+        "supabase": UpstreamProfile(150.0, 0.6, error_rate=0.02),
+    },
+}
+
+ORCHESTRATOR_MARKER = "orchestrateur"
+SUMMARY_MARKER = "résumé d'une conversation"
+CAROLE_WORDS = ("reel", "instagram", "story", "stories", "post", "contenu", "carrousel", "hashtag", "feed")
+
+ANSWER = (
+    "Voici une réponse détaillée et structurée pour t'aider à avancer concrètement "
+    "sur ton projet, avec des étapes claires, des exemples adaptés à ton activité "
+    "et quelques conseils pour mesurer les résultats dans les prochaines semaines. "
+) * 4
+
+
+class StubState:
+    """Profiles in effect, call counters and the fake Supabase tables"""
+
+    def __init__(self, profile: str = "instant", dimension: int = 1536, seed: int = 42):
+        self.profile = dict(PROFILES[profile])
+        self.dimension = dimension
+        self.random = random.Random(seed)
+        self.calls: Counter = Counter()
+        self.messages: Dict[str, List[dict]] = {}
+        self.conversations: Dict[str, dict] = {}
+        # (agent, filename) -> {"hash", "chunks": {chunk_index: hash}} (ingestion RPCs)
+        self.documents: Dict[tuple, dict] = {}
+        # Prompt prefixes marked with cache_control already seen (emulated provider cache)
+        self.cached_prefixes: set = set()
+
+    def reset_counters(self) -> None:
+        self.calls.clear()
+
+    async def delay(self, upstream: str) -> bool:
+        """Sleep for the upstream's sampled latency; True if this call should fail"""
+        profile = self.profile[upstream]
+        if profile.median_ms > 0:
+            await asyncio.sleep(profile.median_ms * self.random.lognormvariate(0.0, profile.sigma) / 1000)
+        return self.random.random() < profile.error_rate
+
+
+def _error(upstream: str) -> JSONResponse:
+    return JSONResponse({"error": {"message": f"stub {upstream} error"}}, status_code=503)
+
+
+def _text(content) -> str:
+    """Message content as text (plain string or list of text blocks)"""
+    if isinstance(content, str):
+        return content
+    return "\n\n".join(block.get("text", "") for block in content)
+
+
+def _cache_min_tokens(model: str) -> int:
+    """Smallest cacheable prefix, as on Anthropic (2048 tokens on Haiku, 1024 otherwise)"""
+    return 2048 if "haiku" in model else 1024
+
+
+def _cached_tokens(state: StubState, messages: List[dict], model: str) -> int:
+    """Tokens of cache_control blocks already seen, like a provider prompt cache"""
+    cached = 0
+    for message in messages:
+        if isinstance(message["content"], str):
+            continue
+        for block in message["content"]:
+            if "cache_control" not in block or len(block["text"]) // 4 < _cache_min_tokens(model):
+                continue
+            if block["text"] in state.cached_prefixes:
+                cached += len(block["text"]) // 4
+            state.cached_prefixes.add(block["text"])
+    return cached
+
+
+def _embedding(text: str, dimension: int) -> List[float]:
+    """Deterministic pseudo-embedding: same text, same vector"""
+    seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+    rnd = random.Random(seed)
+    return [rnd.gauss(0.0, 1.0) for _ in range(dimension)]
+
+
+def create_app(state: StubState) -> FastAPI:
+    app = FastAPI(title="Stub upstreams")
+
+    @app.get("/_stats")
+    async def stats():
+        """Upstream call counts since the last reset, as {"upstream endpoint": count}"""
+        return {f"{upstream} {endpoint}": count for (upstream, endpoint), count in state.calls.items()}
+
+    @app.post("/_reset")
+    async def reset():
+        state.reset_counters()
+        return {"reset": True}
+
+    @app.post("/openrouter/api/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        system = _text(body["messages"][0]["content"]) if body["messages"] else ""
+        is_orchestrator = ORCHESTRATOR_MARKER in system
+        is_summary = SUMMARY_MARKER in system
+        kind = "orchestrate" if is_orchestrator else "summarize" if is_summary else "generate"
+        state.calls[("openrouter", kind)] += 1
+        if await state.delay("openrouter"):
+            return _error("openrouter")
+
+        if is_orchestrator:
+            message = _text(body["messages"][-1]["content"]).lower()
+            agent = "carole" if any(word in message for word in CAROLE_WORDS) else "audrey"
+            content = json.dumps({
+                "agent": agent,
+                "confidence": 0.9,
+                "primary_need": "stub",
+                "reasoning": "Décision du stub",
+            })
+        elif is_summary:
+            content = ANSWER[:300]
+        else:
+            content = ANSWER
+
+        prompt_tokens = sum(len(_text(m["content"])) for m in body["messages"]) // 4
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(content) // 4,
+            "total_tokens": prompt_tokens + len(content) // 4,
+            "prompt_tokens_details": {"cached_tokens": _cached_tokens(state, body["messages"], body["model"])},
+        }
+
+        if not body.get("stream"):
+            return {
+                "id": "stub",
+                "model": body["model"],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage,
+            }
+
+        chunk_delay = state.profile["openrouter"].chunk_ms / 1000
+
+        async def events():
+            words = content.split(" ")
+            for start in range(0, len(words), 4):
+                delta = " ".join(words[start:start + 4]) + " "
+                yield f"data: {json.dumps({'choices': [{'index': 0, 'delta': {'content': delta}}]})}\n\n"
+                if chunk_delay:
+                    await asyncio.sleep(chunk_delay)
+            yield f"data: {json.dumps({'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}], 'usage': usage})}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/openai/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        state.calls[("openai", "embeddings")] += 1
+        if await state.delay("openai"):
+            return _error("openai")
+
+        data = []
+        for i, text in enumerate(inputs):
+            vector = _embedding(str(text), body.get("dimensions") or state.dimension)
+            if body.get("encoding_format") == "base64":
+                vector = base64.b64encode(struct.pack(f"<{len(vector)}f", *vector)).decode("ascii")
+            data.append({"object": "embedding", "index": i, "embedding": vector})
+        return {
+            "object": "list",
+            "data": data,
+            "model": body["model"],
+            "usage": {"prompt_tokens": 8 * len(inputs), "total_tokens": 8 * len(inputs)},
+        }
+
+    @app.post("/cohere/v1/rerank")
+    async def rerank(request: Request):
+        body = await request.json()
+        state.calls[("cohere", "rerank")] += 1
+        if await state.delay("cohere"):
+            return _error("cohere")
+
+        count = len(body["documents"])
+        top_n = body.get("top_n") or count
+        # Slightly shuffled order so reranking is visible, but deterministic per query
+        rnd = random.Random(body["query"])
+        order = sorted(range(count), key=lambda i: i + rnd.uniform(0, 3))[:top_n]
+        return {
+            "id": "stub",
+            "results": [
+                {"index": index, "relevance_score": round(0.99 - rank * 0.05, 4)}
+                for rank, index in enumerate(order)
+            ],
+            "meta": {"api_version": {"version": "1"}},
+        }
+
+    @app.post("/rest/v1/rpc/{function}")
+    async def rpc(function: str, request: Request):
+        body = await request.json()
+        state.calls[("supabase", f"rpc/{function}")] += 1
+        if await state.delay("supabase"):
+            return _error("supabase")
+
+        if function.startswith("match_documents_"):
+            agent = function[len("match_documents_"):]
+            return [
+                {
+                    "id": f"{agent}-{i}",
+                    "content": f"Extrait {i} de la base {agent}: {ANSWER[:400]}",
+                    "similarity": round(0.92 - i * 0.01, 4),
+                    "filename": f"{agent}-guide-{i % 5}.pdf",
+                    "agent_owner": agent,
+                }
+                for i in range(body.get("match_count", 20))
+            ]
+        if function == "sync_rate_limits":
+            return {"remote": {}, "synced_until": datetime.now(timezone.utc).isoformat()}
+        if function == "check_rate_limit":
+            return {"allowed": True, "remaining": body.get("p_max_messages", 10)}
+        if function in ("export_document_chunks", "export_document_chunk_texts", "frequent_questions"):
+            return []
+        if function == "knowledge_base_version":
+            return "0:"
+        if function == "document_chunk_hashes":
+            rows = []
+            for filename in body.get("p_filenames", []):
+                document = state.documents.get((body["p_agent"], filename))
+                if document is None:
+                    continue
+                chunks = document["chunks"].items() or [(None, None)]
+                for index, chunk_hash in chunks:
+                    rows.append({
+                        "filename": filename,
+                        "document_hash": document["hash"],
+                        "chunk_index": index,
+                        "chunk_hash": chunk_hash,
+                    })
+            return rows
+        if function == "upsert_document_chunks":
+            written = removed = 0
+            for doc in body.get("p_documents", []):
+                document = state.documents.setdefault((body["p_agent"], doc["filename"]), {"chunks": {}})
+                document["hash"] = doc["content_hash"]
+                stored_hashes = set(document["chunks"].values())
+                for chunk in doc["chunks"]:
+                    # Moved chunks reuse the embedding stored for the same content
+                    if chunk["embedding"] is None and chunk["content_hash"] not in stored_hashes:
+                        return JSONResponse({"message": "null embedding for an unknown chunk"}, status_code=400)
+                    document["chunks"][chunk["chunk_index"]] = chunk["content_hash"]
+                    written += 1
+                stale = [index for index in document["chunks"] if index >= doc["chunk_count"]]
+                for index in stale:
+                    del document["chunks"][index]
+                removed += len(stale)
+            return {"written": written, "removed": removed}
+        return JSONResponse({"message": f"unknown function {function}"}, status_code=404)
+
+    @app.get("/rest/v1/answer_bank")
+    async def list_answers():
+        state.calls[("supabase", "GET answer_bank")] += 1
+        if await state.delay("supabase"):
+            return _error("supabase")
+        return []
+
+    @app.get("/rest/v1/messages")
+    async def list_messages(request: Request):
+        state.calls[("supabase", "GET messages")] += 1
+        if await state.delay("supabase"):
+            return _error("supabase")
+
+        conversation_id = request.query_params.get("conversation_id", "").removeprefix("eq.")
+        rows = state.messages.get(conversation_id, [])
+        # created_at=gt.X / created_at=lte.Y filters (summaries)
+        for condition in request.query_params.getlist("created_at"):
+            operator, value = condition.split(".", 1)
+            rows = [row for row in rows if (row["created_at"] > value if operator == "gt" else row["created_at"] <= value)]
+        if request.query_params.get("order", "created_at.desc").endswith(".desc"):
+            rows = list(reversed(rows))
+        offset = int(request.query_params.get("offset", 0))
+        rows = rows[offset:offset + int(request.query_params.get("limit", 100))]
+        if request.query_params.get("select") == "created_at":
+            rows = [{"created_at": row["created_at"]} for row in rows]
+        return rows
+
+    @app.get("/rest/v1/conversations")
+    async def get_conversation(request: Request):
+        state.calls[("supabase", "GET conversations")] += 1
+        if await state.delay("supabase"):
+            return _error("supabase")
+
+        conversation = state.conversations.get(request.query_params.get("id", "").removeprefix("eq."))
+        return [conversation] if conversation else []
+
+    @app.patch("/rest/v1/conversations")
+    async def update_conversation(request: Request):
+        state.calls[("supabase", "PATCH conversations")] += 1
+        if await state.delay("supabase"):
+            return _error("supabase")
+
+        conversation_id = request.query_params.get("id", "").removeprefix("eq.")
+        state.conversations.setdefault(conversation_id, {}).update(await request.json())
+        return Response(status_code=204)
+
+    @app.post("/rest/v1/{table}")
+    async def insert(table: str, request: Request):
+        body = await request.json()
+        state.calls[("supabase", f"POST {table}")] += 1
+        if await state.delay("supabase"):
+            return _error("supabase")
+
+        if table == "messages":
+            for row in body if isinstance(body, list) else [body]:
+                state.messages.setdefault(row["conversation_id"], []).append(row)
+        return Response(status_code=201)
+
+    return app
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="realistic")
+    args = parser.parse_args()
+
+    uvicorn.run(create_app(StubState(args.profile)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -22,31 +22,175 @@ class Settings(BaseSettings):
     embedding_model: str = "text-embedding-3-small"
     embedding_dimension: int = 1536
 
+    # Embedding Cache (LRU + TTL, optional memory-mapped file shared across workers)
+    embedding_cache_enabled: bool = True
+    embedding_cache_max_entries: int = 10000
+    embedding_cache_ttl_seconds: int = 7 * 24 * 3600
+    embedding_cache_path: Optional[str] = None
+    embedding_cache_disk_slots: int = 65536
+
     # Cohere Configuration (for reranking)
     cohere_api_key: str = os.getenv("COHERE_API_KEY", "")
     rerank_model: str = "rerank-multilingual-v3.0"
 
+    # Reranker Backend: "cohere" or "hybrid" (local BM25 fused with vector similarity)
+    rerank_backend: str = "cohere"
+    rerank_hybrid_alpha: float = 0.5  # Weight of vector similarity in hybrid scoring
+    rerank_skip_enabled: bool = False  # Skip reranking when the top similarity is decisive
+    rerank_skip_min_similarity: float = 0.85  # Also the adaptive retrieval clear-head thresholds
+    rerank_skip_min_margin: float = 0.05
+
     # Model Configuration
     orchestrator_model: str = "anthropic/claude-3-haiku"
     audrey_model: str = "anthropic/claude-3.5-sonnet"
     carole_model: str = "anthropic/claude-3.5-sonnet"
     fallback_model: str = "openai/gpt-4o-mini"
 
+    # Model Failover (hedged requests on the fallback model, per-model circuit breakers)
+    failover_hedge_enabled: bool = True
+    failover_hedge_percentile: float = 0.95  # Hedge once the primary is slower than this latency percentile
+    failover_hedge_min_seconds: float = 1.0
+    failover_hedge_default_seconds: float = 15.0  # Until failover_min_samples latencies are known
+    failover_stats_window: int = 200  # Recent calls per model kept for latency / error stats
+    failover_min_samples: int = 20
+    circuit_breaker_failure_threshold: int = 5  # Consecutive failures before the circuit opens
+    circuit_breaker_cooldown_seconds: float = 30.0  # Before a half-open probe is let through
+    openrouter_max_retries: int = 2  # Retries on 429 (jittered exponential backoff)
+    openrouter_retry_base_seconds: float = 0.5
+    openrouter_retry_max_seconds: float = 8.0
+
+    # Prompt Caching (cache_control breakpoint after the static system prompt prefix)
+    prompt_caching_enabled: bool = True
+    prompt_cache_default_min_tokens: int = 1024  # Shorter prefixes are not cached by the provider (Sonnet)
+    prompt_cache_min_tokens: dict = {"anthropic/claude-3-haiku": 2048}  # Per-model minimums
+
+    # Context Budget (token-budgeted prompts; tiktoken counts if installed, else a local estimate)
+    context_default_budget_tokens: int = 8000  # Prompt tokens per call: system + context + history + message
+    context_budget_tokens: dict = {}  # Per-model overrides, e.g. {"anthropic/claude-3-haiku": 4000}
+    context_rag_max_tokens: int = 2500  # Retrieved chunks, best first
+    context_orchestrator_message_tokens: int = 40  # Per history message shown to the orchestrator
+    context_token_cache_entries: int = 50000  # Memoized per-message token counts
+    context_tiktoken_encoding: Optional[str] = "cl100k_base"
+
+    # Fast Local Router (lexicons + knowledge-base centroids before the LLM orchestrator)
+    fast_router_enabled: bool = False
+    fast_router_min_margin: float = 0.5  # Below this margin the LLM orchestrator decides
+    fast_router_min_lexical_score: float = 2.0  # Lexicon weight the winner needs to decide without centroids
+    fast_router_lexical_weight: float = 0.6  # Weight of lexicon vs. centroid margin
+    fast_router_centroid_scale: float = 0.1  # Centroid similarity gap treated as fully decisive
+
+    # Sticky Routing (reuse the previous agent on follow-ups)
+    sticky_routing_enabled: bool = False
+    sticky_min_confidence: float = 0.7  # Previous decision must be at least this confident
+    sticky_max_turns: int = 5  # Re-route after this many consecutive sticky turns
+    sticky_topic_shift_margin: float = 2.0  # Lexicon lead of the other agent that forces re-routing
+    sticky_max_conversations: int = 10000
+
     # RAG Configuration
     rag_similarity_threshold: float = 0.7
     rag_initial_results: int = 20
     rag_rerank_top_n: int = 3
 
+    # Adaptive Retrieval (candidate count and rerank depth from the similarity distribution)
+    rag_adaptive_enabled: bool = False
+    rag_adaptive_initial_results: int = 10  # First page of vector candidates
+    rag_adaptive_max_results: int = 40  # Widened search when the first page is flat
+    rag_adaptive_depth_window: float = 0.1  # Rerank candidates within this similarity of the top
+    rag_adaptive_flat_spread: float = 0.03  # Top-to-last spread of a flat first page
+    rag_adaptive_agent_thresholds: dict = {}  # Per-agent overrides, e.g. {"carole": {"head_similarity": 0.8}}
+
+    # Hybrid Retrieval (local BM25 inverted index fused with vector search by reciprocal rank fusion)
+    rag_hybrid_enabled: bool = False
+    rag_hybrid_lexical_results: int = 20  # BM25 candidates per query
+    rag_hybrid_rrf_k: int = 60
+    rag_hybrid_rerank_candidates: int = 10  # Fused candidates sent to the reranker
+    lexical_index_refresh_seconds: int = 300
+    lexical_index_full_reload_seconds: int = 24 * 3600
+    lexical_index_page_size: int = 5000
+    lexical_index_compact_ratio: float = 0.25  # Tombstoned share of rows that triggers compaction
+
+    # Local Vector Index (in-process replica of the knowledge bases, Supabase as fallback)
+    local_index_enabled: bool = False
+    local_index_snapshot_dir: Optional[str] = None
+    local_index_refresh_seconds: int = 300
+    local_index_full_reload_seconds: int = 24 * 3600
+    local_index_page_size: int = 1000
+
+    # Speculative RAG
+    speculative_rag_enabled: bool = False  # Retrieve for both agents while the orchestrator decides
+
+    # Semantic Response Cache (opt-in, first-turn questions only)
+    semantic_cache_enabled: bool = False
+    semantic_cache_max_distance: float = 0.05  # Max cosine distance to reuse an answer
+    semantic_cache_max_entries: int = 1000  # Per agent
+    semantic_cache_ttl_seconds: int = 24 * 3600
+
+    # Answer Bank (pre-generated answers to frequent first-turn questions, served before routing)
+    answer_bank_enabled: bool = False
+    answer_bank_min_similarity: float = 0.95  # Question embedding match needed to serve an answer
+    answer_bank_refresh_seconds: int = 600  # Reload answers and check knowledge-base versions
+    answer_bank_regenerate: bool = False  # Regenerate stale answers in this process (one worker only)
+    answer_bank_mining_seconds: int = 24 * 3600  # Re-mine frequent questions this often
+    answer_bank_mining_days: int = 30  # Messages considered when mining
+    answer_bank_min_count: int = 5  # Occurrences before a question is banked
+    answer_bank_max_questions: int = 300
+    answer_bank_generation_concurrency: int = 2
+
     # Conversation Configuration
     max_history_messages: int = 10
+    conversation_cache_max_entries: int = 10000  # Conversation IDs known to exist
     rate_limit_messages: int = 10
     rate_limit_window_seconds: int = 60
+    rate_limit_user_messages: int = 30  # Across all of a user's conversations
+    rate_limit_sync_seconds: float = 5.0  # Batched reconciliation with Supabase (0 = local only)
+
+    # History Cache (recent messages served from memory, write-behind)
+    history_cache_enabled: bool = False
+    history_cache_max_chars: int = 50_000_000  # Total cached message characters
+    # "ttl": serve from cache, checking Supabase for a newer message at most every HISTORY_CACHE_TTL_SECONDS
+    # "version": check Supabase for a newer message before every cache hit
+    # "sticky": conversations are pinned to one worker (or a single worker), cache is authoritative
+    history_cache_mode: str = "ttl"
+    history_cache_ttl_seconds: float = 30.0
+
+    # Conversation Summaries (turns older than the history window, folded in the background)
+    conversation_summary_enabled: bool = False
+    conversation_summary_model: Optional[str] = None  # Defaults to the orchestrator model
+    conversation_summary_min_messages: int = 2  # Unsummarised messages outside the window before folding
+    conversation_summary_batch_messages: int = 20  # Max messages folded per call
+    conversation_summary_max_tokens: int = 300
+
+    # Message Write-Behind Queue (batched inserts, local spill file when Supabase is down)
+    message_queue_max_size: int = 10000
+    message_flush_batch_size: int = 500
+    message_flush_interval_seconds: float = 0.5
+    message_spill_path: Optional[str] = "message_spill.jsonl"
+    message_spill_max_attempts: int = 5  # Rejections (4xx) before a row moves to <spill path>.dead
+    message_spill_replay_seconds: float = 30.0  # Replay interval of the spill file while no message is written
+
+    # Knowledge-Base Ingestion (python -m services.ingestion, POST /api/admin/ingest)
+    ingest_chunk_tokens: int = 500
+    ingest_chunk_overlap_tokens: int = 50  # Trailing paragraphs/sentences repeated at the next chunk's start
+    ingest_embedding_batch_size: int = 256  # Texts per embeddings.create call
+    ingest_embedding_concurrency: int = 4  # Embedding batches in flight
+    ingest_group_documents: int = 20  # Documents per hash lookup / bulk upsert
+    ingest_max_jobs: int = 100  # Admin API jobs kept for polling
+    admin_api_token: str = os.getenv("ADMIN_API_TOKEN", "")  # Admin API disabled when empty
 
     # API Configuration
     api_host: str = "0.0.0.0"
     api_port: int = 8000
     cors_origins: list = ["*"]
 
+    # Request Coalescing (identical in-flight embeddings, retrievals, reranks and history-free completions)
+    request_coalescing_enabled: bool = True
+
+    # HTTP Connection Pooling (shared clients per upstream)
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 20
+    http_keepalive_expiry: float = 30.0
+    http2_enabled: bool = True
+
     # Temperature Settings
     orchestrator_temperature: float = 0.3
     agent_temperature: float = 0.7
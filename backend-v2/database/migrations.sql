@@ -232,6 +232,351 @@ COMMENT ON FUNCTION match_documents_carole IS 'Vector similarity search for Caro
 COMMENT ON FUNCTION check_rate_limit IS 'Check if conversation is within rate limits';
 COMMENT ON FUNCTION tag_documents_by_keywords IS 'Bulk tag documents by keyword matching';
 
+-- ============================================================================
+-- STEP 10: Export chunks for the backend's local vector index replica
+-- ============================================================================
+
+-- Track chunk changes so the replica can refresh incrementally
+ALTER TABLE document_chunks
+ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+
+CREATE INDEX IF NOT EXISTS idx_document_chunks_updated ON document_chunks(updated_at, id);
+
+CREATE OR REPLACE FUNCTION touch_document_chunk_updated_at()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  NEW.updated_at := NOW();
+  RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_document_chunks_updated_at ON document_chunks;
+CREATE TRIGGER trg_document_chunks_updated_at
+  BEFORE UPDATE ON document_chunks
+  FOR EACH ROW EXECUTE FUNCTION touch_document_chunk_updated_at();
+
+-- Keyset-paginated export of an agent's chunks (own + shared) changed since a cursor
+CREATE OR REPLACE FUNCTION export_document_chunks(
+  agent_filter text,
+  updated_since timestamptz DEFAULT 'epoch',
+  after_id uuid DEFAULT '00000000-0000-0000-0000-000000000000',
+  page_size int DEFAULT 1000
+)
+RETURNS TABLE (
+  id uuid,
+  content text,
+  embedding real[],
+  filename text,
+  agent_owner text,
+  updated_at timestamptz
+)
+LANGUAGE sql STABLE
+AS $$
+  SELECT
+    dc.id,
+    dc.content,
+    dc.embedding::real[],
+    d.filename,
+    d.agent_owner,
+    dc.updated_at
+  FROM document_chunks dc
+  JOIN documents d ON dc.document_id = d.id
+  WHERE (d.agent_owner = agent_filter OR d.agent_owner = 'shared')
+    AND (dc.updated_at, dc.id) > (updated_since, after_id)
+  ORDER BY dc.updated_at, dc.id
+  LIMIT page_size;
+$$;
+
+COMMENT ON FUNCTION export_document_chunks IS 'Paginated chunk export for the backend local vector index';
+
+-- ============================================================================
+-- STEP 11: Rate limit reconciliation (in-process limiters on each worker)
+-- ============================================================================
+
+-- Message counts reported by each backend worker, one row per sync batch
+CREATE TABLE IF NOT EXISTS rate_limit_usage (
+  id bigserial PRIMARY KEY,
+  key text NOT NULL,
+  worker_id text NOT NULL,
+  count int NOT NULL,
+  synced_at timestamptz NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_rate_limit_usage_synced_at ON rate_limit_usage (synced_at);
+
+-- Record a worker's usage since its last sync and return what the other
+-- workers used since then, as {"remote": {key: count}, "synced_until": ts}
+CREATE OR REPLACE FUNCTION sync_rate_limits(
+  p_worker_id text,
+  p_counts jsonb,
+  p_since timestamptz DEFAULT NULL
+)
+RETURNS jsonb
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_now timestamptz := clock_timestamp();
+  v_remote jsonb;
+BEGIN
+  INSERT INTO rate_limit_usage (key, worker_id, count, synced_at)
+  SELECT c.key, p_worker_id, c.value::int, v_now
+  FROM jsonb_each_text(p_counts) AS c;
+
+  SELECT COALESCE(jsonb_object_agg(r.key, r.total), '{}'::jsonb)
+  INTO v_remote
+  FROM (
+    SELECT key, SUM(count) AS total
+    FROM rate_limit_usage
+    WHERE worker_id <> p_worker_id
+      AND synced_at > COALESCE(p_since, v_now)
+      AND synced_at <= v_now
+    GROUP BY key
+  ) r;
+
+  -- Rows older than any rate limit window are no longer needed
+  DELETE FROM rate_limit_usage WHERE synced_at < v_now - INTERVAL '1 hour';
+
+  RETURN jsonb_build_object('remote', v_remote, 'synced_until', v_now);
+END;
+$$;
+
+COMMENT ON FUNCTION sync_rate_limits IS 'Batched rate limit reconciliation between backend workers';
+
+-- ============================================================================
+-- STEP 12: Rolling conversation summaries
+-- ============================================================================
+
+-- Summary of the turns older than the backend's history window, and the
+-- created_at of the last message folded into it
+ALTER TABLE conversations
+ADD COLUMN IF NOT EXISTS summary TEXT,
+ADD COLUMN IF NOT EXISTS summary_until TIMESTAMPTZ;
+
+COMMENT ON COLUMN conversations.summary IS 'Running summary of turns older than the history window';
+COMMENT ON COLUMN conversations.summary_until IS 'created_at of the last message folded into summary';
+
+-- ============================================================================
+-- STEP 13: Incremental knowledge-base ingestion (services/ingestion.py)
+-- ============================================================================
+
+-- Content hashes let re-ingestion skip unchanged documents and chunks
+ALTER TABLE documents
+ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+ALTER TABLE document_chunks
+ADD COLUMN IF NOT EXISTS chunk_index INTEGER,
+ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_documents_filename_agent ON documents(filename, agent_owner);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_document_chunks_position ON document_chunks(document_id, chunk_index);
+
+-- Stored document and chunk hashes for a batch of filenames
+CREATE OR REPLACE FUNCTION document_chunk_hashes(
+  p_agent text,
+  p_filenames text[]
+)
+RETURNS TABLE (
+  filename text,
+  document_hash text,
+  chunk_index integer,
+  chunk_hash text
+)
+LANGUAGE sql STABLE
+AS $$
+  SELECT d.filename, d.content_hash, dc.chunk_index, dc.content_hash
+  FROM documents d
+  LEFT JOIN document_chunks dc ON dc.document_id = d.id
+  WHERE d.agent_owner = p_agent
+    AND d.filename = ANY(p_filenames);
+$$;
+
+-- Bulk upsert of documents and their changed chunks, in one transaction
+-- p_documents: [{filename, content_hash, chunk_count, chunks: [{chunk_index, content, content_hash, embedding}]}]
+-- A chunk sent with a null embedding was moved: it reuses the embedding stored for the same content hash
+CREATE OR REPLACE FUNCTION upsert_document_chunks(
+  p_agent text,
+  p_documents jsonb
+)
+RETURNS jsonb
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  doc jsonb;
+  doc_id uuid;
+  written integer := 0;
+  removed integer := 0;
+  n integer;
+BEGIN
+  FOR doc IN SELECT * FROM jsonb_array_elements(p_documents)
+  LOOP
+    INSERT INTO documents (filename, agent_owner, content_hash)
+    VALUES (doc->>'filename', p_agent, doc->>'content_hash')
+    ON CONFLICT (filename, agent_owner) DO UPDATE SET content_hash = EXCLUDED.content_hash
+    RETURNING id INTO doc_id;
+
+    INSERT INTO document_chunks (document_id, chunk_index, content, content_hash, embedding)
+    SELECT
+      doc_id,
+      (c->>'chunk_index')::integer,
+      c->>'content',
+      c->>'content_hash',
+      COALESCE(
+        (c->>'embedding')::vector,
+        -- Read from the snapshot taken before this statement's own writes
+        (SELECT old.embedding FROM document_chunks old
+         WHERE old.document_id = doc_id AND old.content_hash = c->>'content_hash'
+         LIMIT 1)
+      )
+    FROM jsonb_array_elements(doc->'chunks') AS c
+    ON CONFLICT (document_id, chunk_index) DO UPDATE SET
+      content = EXCLUDED.content,
+      content_hash = EXCLUDED.content_hash,
+      embedding = EXCLUDED.embedding;
+    GET DIAGNOSTICS n = ROW_COUNT;
+    written := written + n;
+
+    -- Chunks past the new end of the document (or from before chunk_index existed)
+    DELETE FROM document_chunks
+    WHERE document_id = doc_id
+      AND (chunk_index >= (doc->>'chunk_count')::integer OR chunk_index IS NULL);
+    GET DIAGNOSTICS n = ROW_COUNT;
+    removed := removed + n;
+  END LOOP;
+
+  RETURN jsonb_build_object('written', written, 'removed', removed);
+END;
+$$;
+
+COMMENT ON COLUMN documents.content_hash IS 'sha256 of the ingested document text';
+COMMENT ON COLUMN document_chunks.content_hash IS 'sha256 of the chunk text (unchanged chunks are not re-embedded)';
+COMMENT ON FUNCTION document_chunk_hashes IS 'Stored hashes for incremental ingestion';
+COMMENT ON FUNCTION upsert_document_chunks IS 'Bulk upsert of ingested documents and chunks';
+
+-- ============================================================================
+-- STEP 14: Export chunk texts for the backend's lexical (BM25) index
+-- ============================================================================
+
+-- Same paging as export_document_chunks, without the embeddings
+CREATE OR REPLACE FUNCTION export_document_chunk_texts(
+  agent_filter text,
+  updated_since timestamptz DEFAULT 'epoch',
+  after_id uuid DEFAULT '00000000-0000-0000-0000-000000000000',
+  page_size int DEFAULT 5000
+)
+RETURNS TABLE (
+  id uuid,
+  content text,
+  filename text,
+  agent_owner text,
+  updated_at timestamptz
+)
+LANGUAGE sql STABLE
+AS $$
+  SELECT
+    dc.id,
+    dc.content,
+    d.filename,
+    d.agent_owner,
+    dc.updated_at
+  FROM document_chunks dc
+  JOIN documents d ON dc.document_id = d.id
+  WHERE (d.agent_owner = agent_filter OR d.agent_owner = 'shared')
+    AND (dc.updated_at, dc.id) > (updated_since, after_id)
+  ORDER BY dc.updated_at, dc.id
+  LIMIT page_size;
+$$;
+
+COMMENT ON FUNCTION export_document_chunk_texts IS 'Paginated chunk text export for the backend lexical index';
+
+-- ============================================================================
+-- STEP 15: Answer bank (pre-generated answers to frequent first-turn questions)
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS answer_bank (
+  id bigserial PRIMARY KEY,
+  agent TEXT NOT NULL CHECK (agent IN ('audrey', 'carole')),
+  question TEXT NOT NULL,
+  question_key TEXT NOT NULL,
+  frequency INTEGER NOT NULL DEFAULT 0,
+  embedding vector(1536),
+  answer TEXT,
+  kb_version TEXT,
+  generated_at TIMESTAMPTZ,
+  UNIQUE (agent, question_key)
+);
+
+-- Speeds up the first-turn check in frequent_questions()
+CREATE INDEX IF NOT EXISTS idx_messages_conversation_created ON messages(conversation_id, created_at);
+
+-- First-turn user questions asked at least p_min_count times since p_since,
+-- grouped by normalised text, with the agent that answered them most often
+CREATE OR REPLACE FUNCTION frequent_questions(
+  p_since timestamptz,
+  p_min_count int DEFAULT 5,
+  p_limit int DEFAULT 300
+)
+RETURNS TABLE (
+  question_key text,
+  question text,
+  agent text,
+  frequency bigint
+)
+LANGUAGE sql STABLE
+AS $$
+  WITH first_turns AS (
+    SELECT
+      trim(regexp_replace(lower(q.content), '[[:space:][:punct:]]+', ' ', 'g')) AS question_key,
+      q.content,
+      a.agent
+    FROM messages q
+    JOIN LATERAL (
+      SELECT m.agent
+      FROM messages m
+      WHERE m.conversation_id = q.conversation_id
+        AND m.role = 'assistant'
+        AND m.created_at >= q.created_at
+      ORDER BY m.created_at
+      LIMIT 1
+    ) a ON TRUE
+    WHERE q.role = 'user'
+      AND q.created_at >= p_since
+      AND a.agent IN ('audrey', 'carole')
+      AND NOT EXISTS (
+        SELECT 1 FROM messages earlier
+        WHERE earlier.conversation_id = q.conversation_id
+          AND earlier.created_at < q.created_at
+      )
+  )
+  SELECT
+    question_key,
+    mode() WITHIN GROUP (ORDER BY content) AS question,
+    mode() WITHIN GROUP (ORDER BY agent) AS agent,
+    COUNT(*) AS frequency
+  FROM first_turns
+  WHERE question_key <> ''
+  GROUP BY question_key
+  HAVING COUNT(*) >= p_min_count
+  ORDER BY frequency DESC
+  LIMIT p_limit;
+$$;
+
+-- Changes whenever an agent's chunks (own + shared) are added, updated or deleted
+CREATE OR REPLACE FUNCTION knowledge_base_version(agent_filter text)
+RETURNS text
+LANGUAGE sql STABLE
+AS $$
+  SELECT COUNT(*)::text || ':' || COALESCE(MAX(dc.updated_at)::text, '')
+  FROM document_chunks dc
+  JOIN documents d ON dc.document_id = d.id
+  WHERE d.agent_owner = agent_filter OR d.agent_owner = 'shared';
+$$;
+
+COMMENT ON TABLE answer_bank IS 'Pre-generated answers to frequent first-turn questions (services/answer_bank.py)';
+COMMENT ON FUNCTION frequent_questions IS 'Most frequent first-turn questions, for the answer bank';
+COMMENT ON FUNCTION knowledge_base_version IS 'Knowledge-base version per agent, answers from older versions are regenerated';
+
 -- ============================================================================
 -- VERIFICATION QUERIES
 -- ============================================================================
@@ -2,14 +2,32 @@
 FastAPI main application for L'Agence des Copines chatbot v2
 """
 import logging
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
 from fastapi import FastAPI, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 
 from config.settings import settings
 from models.schemas import HealthResponse
 from api.chat import router as chat_router
+from api.admin import router as admin_router
+from services.http_clients import http_clients
+from services.rag_service import rag_service
+from services.local_vector_index import local_vector_index
+from services.lexical_index import lexical_index
+from services.adaptive_retrieval import adaptive_retrieval
+from services.semantic_cache import semantic_cache
+from services.rate_limiter import rate_limiter
+from services.conversation_service import conversation_service
+from services.message_writer import message_writer
+from services.model_failover import model_failover
+from services.context_assembler import context_assembler
+from services.conversation_summarizer import conversation_summarizer
+from services.ingestion import ingestion_service
+from services.answer_bank import answer_bank
+from services.single_flight import coalescing_stats
+from services.metrics import metrics
 
 # Configure logging
 logging.basicConfig(
@@ -18,11 +36,41 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open shared upstream resources on startup and release them on shutdown"""
+    await http_clients.startup()
+    if settings.local_index_enabled:
+        await local_vector_index.startup()
+    if settings.rag_hybrid_enabled:
+        await lexical_index.startup()
+    if settings.answer_bank_enabled:
+        await answer_bank.startup()
+    await rate_limiter.startup()
+    await message_writer.startup()
+    try:
+        yield
+    finally:
+        # Drain queued messages while the HTTP clients are still open
+        await ingestion_service.shutdown()
+        await conversation_summarizer.shutdown()
+        await answer_bank.shutdown()
+        await message_writer.shutdown()
+        await rate_limiter.shutdown()
+        await local_vector_index.shutdown()
+        await lexical_index.shutdown()
+        await http_clients.shutdown()
+        if rag_service.embedding_cache is not None:
+            rag_service.embedding_cache.flush()
+
+
 # Create FastAPI app
 app = FastAPI(
     title="L'Agence des Copines Chatbot v2",
     description="Intelligent dual-agent chatbot with RAG for L'Agence des Copines",
     version="2.0.0",
+    lifespan=lifespan,
 )
 
 # CORS middleware
@@ -36,6 +84,70 @@ app.add_middleware(
 
 # Include routers
 app.include_router(chat_router)
+app.include_router(admin_router)
+
+
+def _cache_stats() -> dict:
+    """Counters of the enabled caches, keyed by cache name"""
+    caches = {}
+    if rag_service.embedding_cache is not None:
+        caches["embedding"] = rag_service.embedding_cache.stats()
+    if settings.semantic_cache_enabled:
+        caches["semantic"] = semantic_cache.stats()
+    if conversation_service.history_cache is not None:
+        caches["history"] = conversation_service.history_cache.stats()
+    caches["token_counts"] = context_assembler.stats()
+    if settings.request_coalescing_enabled:
+        caches.update({f"coalescing_{kind}": stats for kind, stats in coalescing_stats().items()})
+    if settings.rag_hybrid_enabled:
+        caches["lexical_index"] = lexical_index.stats()
+    if settings.conversation_summary_enabled:
+        caches["summaries"] = conversation_summarizer.stats()
+    if settings.answer_bank_enabled:
+        caches["answer_bank"] = answer_bank.stats()
+    return caches
+
+
+def _numeric_samples(groups: dict) -> dict:
+    """{(group, key): value} for the numeric entries of nested stats dicts"""
+    return {
+        (group, key): value
+        for group, stats in groups.items()
+        for key, value in stats.items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+    }
+
+
+metrics.gauge(
+    "cache_stats",
+    "Cache counters and sizes (see /health caches)",
+    ("cache", "stat"),
+    lambda: _numeric_samples(_cache_stats()),
+)
+metrics.gauge(
+    "message_writer_stats",
+    "Message write-behind queue depth, counters and flush latency (ms)",
+    ("queue", "stat"),
+    lambda: _numeric_samples({"messages": message_writer.stats()}),
+)
+metrics.gauge(
+    "rate_limiter_active_keys",
+    "Token buckets currently held in memory",
+    ("scope",),
+    lambda: {("conversation",): len(rate_limiter.conversations), ("user",): len(rate_limiter.users)},
+)
+metrics.gauge(
+    "rag_adaptive_thresholds",
+    "Adaptive retrieval thresholds in effect per agent (see rag_adaptive_decisions_total)",
+    ("agent", "threshold"),
+    lambda: adaptive_retrieval.threshold_samples() if settings.rag_adaptive_enabled else {},
+)
+metrics.gauge(
+    "openrouter_model_health",
+    "Per-model circuit state (0 closed, 1 half-open, 2 open), rolling error rate and p95 latency",
+    ("model", "stat"),
+    lambda: _numeric_samples(model_failover.snapshot()),
+)
 
 
 @app.get("/health", response_model=HealthResponse)
@@ -59,9 +171,20 @@ async def health_check() -> HealthResponse:
         status="healthy" if all_healthy else "degraded",
         timestamp=datetime.now(timezone.utc).isoformat(),
         services=services,
+        caches=_cache_stats(),
+        queues={"messages": message_writer.stats()},
     )
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics() -> PlainTextResponse:
+    """
+    Prometheus metrics: per-stage latency histograms (stage, agent, model),
+    OpenRouter token usage and failover, cache and queue gauges
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/")
 async def root():
     """Root endpoint with API information"""
@@ -75,7 +198,9 @@ async def root():
         },
         "endpoints": {
             "health": "/health",
+            "metrics": "/metrics",
             "chat": "/api/chat",
+            "chat_stream": "/api/chat/stream",
             "rate_limit": "/api/rate-limit/{conversation_id}",
             "docs": "/docs",
         },
@@ -6,6 +6,9 @@ from .schemas import (
     RateLimitResponse,
     HealthResponse,
     ErrorResponse,
+    IngestDocument,
+    IngestRequest,
+    IngestJobResponse,
 )
 
 __all__ = [
@@ -15,4 +18,7 @@ __all__ = [
     "RateLimitResponse",
     "HealthResponse",
     "ErrorResponse",
+    "IngestDocument",
+    "IngestRequest",
+    "IngestJobResponse",
 ]
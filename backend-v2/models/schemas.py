@@ -1,7 +1,7 @@
 """
 Pydantic models for API request/response schemas
 """
-from typing import Optional, Literal
+from typing import List, Optional, Literal
 from pydantic import BaseModel, Field
 from datetime import datetime
 
@@ -32,6 +32,9 @@ class ChatResponse(BaseModel):
     agent: Literal["audrey", "carole", "escalate"]
     confidence: float
     reasoning: str
+    routing_source: Optional[Literal["answer_bank", "sticky", "fast_router", "llm"]] = Field(
+        default=None, description="Which path decided the agent"
+    )
     timestamp: str
 
 
@@ -50,6 +53,35 @@ class HealthResponse(BaseModel):
     status: str
     timestamp: str
     services: dict
+    caches: dict = Field(default_factory=dict, description="Cache hit/miss counters")
+    queues: dict = Field(default_factory=dict, description="Background queue depth and flush latency")
+
+
+class IngestDocument(BaseModel):
+    """Inline text or markdown document to ingest"""
+
+    filename: str = Field(..., min_length=1, description="Document name (identifies it across re-ingestions)")
+    content: str = Field(..., min_length=1, description="Document text")
+
+
+class IngestRequest(BaseModel):
+    """Request model for the admin ingestion endpoint"""
+
+    agent: Literal["audrey", "carole", "shared"]
+    documents: List[IngestDocument] = Field(..., min_length=1)
+    force: bool = Field(default=False, description="Re-embed unchanged documents too")
+
+
+class IngestJobResponse(BaseModel):
+    """Background ingestion job status"""
+
+    id: str
+    agent: str
+    status: Literal["running", "done", "failed"]
+    report: dict
+    error: Optional[str] = None
+    started_at: str
+    finished_at: Optional[str] = None
 
 
 class ErrorResponse(BaseModel):
@@ -1,9 +1,11 @@
 """Services module"""
+from .http_clients import http_clients
 from .openrouter_client import openrouter_client
 from .rag_service import rag_service
 from .conversation_service import conversation_service
 
 __all__ = [
+    "http_clients",
     "openrouter_client",
     "rag_service",
     "conversation_service",
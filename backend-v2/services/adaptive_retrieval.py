@@ -0,0 +1,129 @@
+"""
+Adaptive candidate count and rerank depth from the shape of the similarity scores
+"""
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from config.settings import settings
+from services.metrics import metrics
+from services.rerankers import clear_head
+
+logger = logging.getLogger(__name__)
+
+AGENTS = ("audrey", "carole")
+
+# Decisions, from cheapest to most expensive
+SKIP, TRIM, FULL, WIDEN = "skip", "trim", "full", "widen"
+
+DECISION_LABELS = ("agent", "decision")
+
+
+@dataclass
+class Thresholds:
+    head_similarity: float  # Top similarity for a clear head
+    head_margin: float  # Lead over the runner-up that makes reranking unnecessary
+    depth_window: float  # Rerank candidates within this similarity of the top
+    flat_spread: float  # Top-to-last spread at or below which the ranking is flat
+
+
+@dataclass
+class RerankPlan:
+    decision: str
+    depth: int  # Candidates to send to the reranker (0 when skipped)
+
+
+class AdaptiveRetrieval:
+    """
+    Sizes retrieval and reranking from the similarity distribution
+
+    - clear head (top similarity high, well ahead of the runner-up): skip the
+      reranker and keep the vector order;
+    - otherwise rerank only the candidates within `depth_window` of the top
+      (at least RAG_RERANK_TOP_N);
+    - flat distribution filling the whole first page: search again with
+      RAG_ADAPTIVE_MAX_RESULTS candidates.
+
+    The clear-head rule and its defaults are the decisive-skip reranker's
+    (RERANK_SKIP_MIN_SIMILARITY / RERANK_SKIP_MIN_MARGIN), which is not used
+    in adaptive mode; the other defaults come from RAG_ADAPTIVE_*.
+    RAG_ADAPTIVE_AGENT_THRESHOLDS overrides any of them per agent, e.g.
+    {"carole": {"head_similarity": 0.8}}.
+    """
+
+    def thresholds(self, agent: str) -> Thresholds:
+        overrides = settings.rag_adaptive_agent_thresholds.get(agent, {})
+        return Thresholds(
+            head_similarity=float(overrides.get("head_similarity", settings.rerank_skip_min_similarity)),
+            head_margin=float(overrides.get("head_margin", settings.rerank_skip_min_margin)),
+            depth_window=float(overrides.get("depth_window", settings.rag_adaptive_depth_window)),
+            flat_spread=float(overrides.get("flat_spread", settings.rag_adaptive_flat_spread)),
+        )
+
+    def should_widen(self, agent: str, similarities: List[float], requested: int) -> bool:
+        """Whether a first page of `requested` results is too flat to pick from"""
+        if len(similarities) < requested or requested >= settings.rag_adaptive_max_results:
+            return False
+        spread = max(similarities) - min(similarities)
+        if spread > self.thresholds(agent).flat_spread:
+            return False
+        self._record(agent, WIDEN)
+        return True
+
+    def plan(self, agent: str, similarities: List[Optional[float]]) -> RerankPlan:
+        """
+        Rerank depth for candidates ranked best first
+
+        Args:
+            agent: Agent the candidates were retrieved for
+            similarities: Vector similarity of each candidate (None for lexical-only hits)
+
+        Returns:
+            Decision and number of leading candidates to rerank
+        """
+        if not similarities:
+            return RerankPlan(FULL, 0)
+        if any(similarity is None for similarity in similarities):
+            # Fused hybrid lists: lexical-only hits have no similarity to compare
+            return self._record(agent, FULL, len(similarities))
+
+        thresholds = self.thresholds(agent)
+        if clear_head(similarities, thresholds.head_similarity, thresholds.head_margin):
+            return self._record(agent, SKIP, 0)
+
+        top = max(similarities)
+        depth = sum(1 for similarity in similarities if similarity >= top - thresholds.depth_window)
+        depth = min(len(similarities), max(depth, settings.rag_rerank_top_n))
+        if depth < len(similarities):
+            return self._record(agent, TRIM, depth)
+        return self._record(agent, FULL, depth)
+
+    @staticmethod
+    def _record(agent: str, decision: str, depth: int = 0) -> RerankPlan:
+        metrics.inc(
+            "rag_adaptive_decisions_total",
+            "Adaptive retrieval decisions (skip/trim/full rerank, widened searches)",
+            DECISION_LABELS,
+            (agent, decision),
+        )
+        if decision != WIDEN:
+            metrics.inc(
+                "rag_rerank_candidates_total",
+                "Candidates sent to the reranker (divide by decisions for the mean depth)",
+                ("agent",),
+                (agent,),
+                depth,
+            )
+        return RerankPlan(decision, depth)
+
+    def threshold_samples(self) -> Dict[tuple, float]:
+        """Thresholds in effect per agent, for the metrics gauge"""
+        return {
+            (agent, name): value
+            for agent in AGENTS
+            for name, value in vars(self.thresholds(agent)).items()
+        }
+
+
+# Singleton instance
+adaptive_retrieval = AdaptiveRetrieval()
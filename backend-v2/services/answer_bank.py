@@ -0,0 +1,380 @@
+"""
+Answer bank: pre-generated answers to the most frequent first-turn questions
+
+Frequent questions are mined from `messages`, answered offline by the agent
+they were routed to (with its usual RAG context) and stored in `answer_bank`
+with their embedding and the knowledge-base version they were grounded in.
+Workers load the bank into memory and serve a match before routing; answers
+whose knowledge base has changed since are not served until regenerated.
+
+CLI usage (from backend-v2/):
+
+    python -m services.answer_bank [--force]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import re
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+from config.settings import settings
+from services.http_clients import http_clients
+from services.embedding_cache import normalize_text
+from services.rag_service import rag_service, is_grounded, QueryContext
+from services.openrouter_client import openrouter_client
+
+logger = logging.getLogger(__name__)
+
+AGENTS = ("audrey", "carole")
+
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def question_key(text: str) -> str:
+    """normalize_text with punctuation collapsed as well, matching frequent_questions() in SQL"""
+    return _NON_WORD.sub(" ", normalize_text(text)).strip()
+
+
+@dataclass
+class BankEntry:
+    agent: str
+    question: str
+    question_key: str
+    answer: str
+    kb_version: Optional[str]
+
+
+class AnswerPartition:
+    """One agent's banked answers with unit-normalised question embeddings"""
+
+    def __init__(self, entries: List[BankEntry], embeddings: List[List[float]], dimension: int):
+        self.entries = entries
+        matrix = np.asarray(embeddings, dtype=np.float32).reshape(len(entries), dimension)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self.matrix = matrix / np.where(norms == 0, 1.0, norms)
+
+    def nearest(self, query: np.ndarray) -> Optional[Tuple[BankEntry, float]]:
+        if not self.entries:
+            return None
+        similarities = self.matrix @ query
+        best = int(np.argmax(similarities))
+        return self.entries[best], float(similarities[best])
+
+
+class AnswerBank:
+    """In-memory answer bank, reloaded from Supabase and regenerated when the knowledge base changes"""
+
+    def __init__(self):
+        self.supabase_url = settings.supabase_url
+        self.supabase_key = settings.supabase_key
+        self.partitions: Dict[str, AnswerPartition] = {}
+        self.by_key: Dict[str, BankEntry] = {}
+        # Current knowledge-base version per agent; entries from another version are not served
+        self.kb_versions: Dict[str, str] = {}
+        self.last_mined: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.stale = 0
+        self.misses = 0
+        self.generated = 0
+        self.generation_failures = 0
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "apikey": self.supabase_key,
+            "Authorization": f"Bearer {self.supabase_key}",
+            "Content-Type": "application/json",
+        }
+
+    def _current(self, entry: BankEntry) -> bool:
+        current = entry.kb_version is not None and entry.kb_version == self.kb_versions.get(entry.agent)
+        if not current:
+            self.stale += 1
+        return current
+
+    async def match(self, context: QueryContext) -> Optional[Tuple[BankEntry, float]]:
+        """
+        Banked answer for a first-turn question: exact normalised match, else nearest embedding
+
+        Args:
+            context: Per-request query context (its embedding is reused downstream)
+
+        Returns:
+            (entry, similarity) above ANSWER_BANK_MIN_SIMILARITY, or None
+        """
+        entry = self.by_key.get(question_key(context.query))
+        if entry is not None:
+            if self._current(entry):
+                self.exact_hits += 1
+                return entry, 1.0
+            return None
+
+        if not self.partitions:
+            self.misses += 1
+            return None
+        try:
+            embedding = await rag_service.embed_query(context)
+        except Exception as e:
+            logger.error(f"Answer bank lookup skipped: {str(e)}")
+            return None
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return None
+        query /= norm
+
+        best: Optional[Tuple[BankEntry, float]] = None
+        for partition in self.partitions.values():
+            candidate = partition.nearest(query)
+            if candidate and (best is None or candidate[1] > best[1]):
+                best = candidate
+        if best is None or best[1] < settings.answer_bank_min_similarity:
+            self.misses += 1
+            return None
+        if not self._current(best[0]):
+            return None
+        self.semantic_hits += 1
+        return best
+
+    async def decision(self, context: QueryContext) -> Optional[Dict[str, Any]]:
+        """Routing decision carrying the banked answer (under 'answer'), or None"""
+        matched = await self.match(context)
+        if matched is None:
+            return None
+        entry, similarity = matched
+        logger.info(f"Answer bank hit for {entry.agent} (similarity {similarity:.3f}): {entry.question[:80]}")
+        return {
+            "agent": entry.agent,
+            "confidence": round(similarity, 4),
+            "primary_need": entry.question,
+            "reasoning": "Réponse pré-générée pour une question fréquente",
+            "answer": entry.answer,
+        }
+
+    async def _knowledge_base_version(self, agent: str) -> str:
+        response = await http_clients.supabase.post(
+            f"{self.supabase_url}/rest/v1/rpc/knowledge_base_version",
+            headers=self._headers(),
+            json={"agent_filter": agent},
+            timeout=30.0,
+        )
+        response.raise_for_status()
+        return str(response.json())
+
+    async def refresh_versions(self) -> Dict[str, str]:
+        """Fetch the knowledge-base version of every agent"""
+        for agent in AGENTS:
+            self.kb_versions[agent] = await self._knowledge_base_version(agent)
+        return self.kb_versions
+
+    async def load(self) -> None:
+        """Load generated answers from Supabase into memory"""
+        response = await http_clients.supabase.get(
+            f"{self.supabase_url}/rest/v1/answer_bank",
+            headers=self._headers(),
+            params={
+                "select": "agent,question,question_key,embedding,answer,kb_version",
+                "answer": "not.is.null",
+            },
+            timeout=60.0,
+        )
+        response.raise_for_status()
+
+        grouped: Dict[str, Tuple[List[BankEntry], List[List[float]]]] = {agent: ([], []) for agent in AGENTS}
+        by_key: Dict[str, BankEntry] = {}
+        for row in response.json():
+            if row["agent"] not in grouped or row.get("embedding") is None:
+                continue
+            embedding = row["embedding"]
+            # PostgREST returns pgvector columns as their text form
+            if isinstance(embedding, str):
+                embedding = json.loads(embedding)
+            entry = BankEntry(row["agent"], row["question"], row["question_key"], row["answer"], row.get("kb_version"))
+            grouped[entry.agent][0].append(entry)
+            grouped[entry.agent][1].append(embedding)
+            by_key[entry.question_key] = entry
+
+        self.partitions = {
+            agent: AnswerPartition(entries, embeddings, settings.embedding_dimension)
+            for agent, (entries, embeddings) in grouped.items()
+            if entries
+        }
+        self.by_key = by_key
+        logger.info(f"Answer bank: {len(by_key)} answers loaded")
+
+    async def mine(self) -> List[Dict[str, Any]]:
+        """Most frequent first-turn questions, with the agent that answered them most often"""
+        since = datetime.now(timezone.utc) - timedelta(days=settings.answer_bank_mining_days)
+        response = await http_clients.supabase.post(
+            f"{self.supabase_url}/rest/v1/rpc/frequent_questions",
+            headers=self._headers(),
+            json={
+                "p_since": since.isoformat(),
+                "p_min_count": settings.answer_bank_min_count,
+                "p_limit": settings.answer_bank_max_questions,
+            },
+            timeout=120.0,
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def _generate(self, question: Dict[str, Any]) -> Dict[str, Any]:
+        """Grounded answer for a mined question, as an answer_bank row"""
+        agent = question["agent"]
+        context = QueryContext(question["question"])
+        embedding = await rag_service.embed_query(context)
+        rag_context = await rag_service.rag_pipeline(context, agent)
+        if not is_grounded(rag_context):
+            raise RuntimeError("no knowledge-base context to ground the answer")
+        respond = openrouter_client.audrey_response if agent == "audrey" else openrouter_client.carole_response
+        answer = await respond(user_message=question["question"], history=[], rag_context=rag_context)
+        return {
+            "agent": agent,
+            "question": question["question"],
+            "question_key": question["question_key"],
+            "frequency": question["frequency"],
+            "embedding": embedding,
+            "answer": answer,
+            "kb_version": self.kb_versions[agent],
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+        }
+
+    async def _store(self, rows: List[Dict[str, Any]]) -> None:
+        response = await http_clients.supabase.post(
+            f"{self.supabase_url}/rest/v1/answer_bank",
+            headers={**self._headers(), "Prefer": "resolution=merge-duplicates,return=minimal"},
+            params={"on_conflict": "agent,question_key"},
+            json=rows,
+            timeout=60.0,
+        )
+        response.raise_for_status()
+
+    async def rebuild(self, force: bool = False) -> int:
+        """
+        Mine frequent questions and (re)generate answers that are missing or stale
+
+        Args:
+            force: Regenerate every mined question, even if its answer is current
+
+        Returns:
+            Number of answers generated
+        """
+        await self.refresh_versions()
+        mined = [row for row in await self.mine() if row["agent"] in AGENTS]
+        self.last_mined = time.monotonic()
+
+        todo = []
+        for row in mined:
+            existing = self.by_key.get(row["question_key"])
+            if force or existing is None or existing.agent != row["agent"] \
+                    or existing.kb_version != self.kb_versions[row["agent"]]:
+                todo.append(row)
+        if not todo:
+            return 0
+
+        semaphore = asyncio.Semaphore(settings.answer_bank_generation_concurrency)
+
+        async def generate(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+            async with semaphore:
+                try:
+                    return await self._generate(row)
+                except Exception as e:
+                    self.generation_failures += 1
+                    logger.error(f"Answer bank generation failed for '{row['question'][:80]}': {str(e)}")
+                    return None
+
+        rows = [row for row in await asyncio.gather(*[generate(row) for row in todo]) if row is not None]
+        if rows:
+            await self._store(rows)
+            self.generated += len(rows)
+            await self.load()
+        logger.info(f"Answer bank: {len(rows)}/{len(todo)} answers (re)generated from {len(mined)} frequent questions")
+        return len(rows)
+
+    async def startup(self) -> None:
+        """Load the bank and start the refresh loop"""
+        try:
+            await self.refresh_versions()
+            await self.load()
+        except Exception as e:
+            # Nothing is served until the next refresh succeeds
+            logger.error(f"Failed to load answer bank: {str(e)}")
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    async def shutdown(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(settings.answer_bank_refresh_seconds)
+            try:
+                previous = dict(self.kb_versions)
+                await self.refresh_versions()
+                changed = [agent for agent in AGENTS if previous.get(agent) != self.kb_versions[agent]]
+                due = self.last_mined is None \
+                    or time.monotonic() - self.last_mined >= settings.answer_bank_mining_seconds
+                if settings.answer_bank_regenerate and (changed or due):
+                    if changed:
+                        logger.info(f"Knowledge base changed for {', '.join(changed)}: regenerating answers")
+                    await self.rebuild()
+                else:
+                    # Another worker (or the CLI) regenerates; pick up its answers
+                    await self.load()
+            except Exception as e:
+                logger.error(f"Answer bank refresh failed: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.exact_hits + self.semantic_hits + self.stale + self.misses
+        return {
+            "entries": len(self.by_key),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "stale": self.stale,
+            "misses": self.misses,
+            "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+            "generated": self.generated,
+            "generation_failures": self.generation_failures,
+        }
+
+
+# Singleton instance
+answer_bank = AnswerBank()
+
+
+async def _run_cli(force: bool) -> int:
+    await http_clients.startup()
+    try:
+        try:
+            await answer_bank.load()
+        except Exception as e:
+            logger.warning(f"Could not load existing answers, generating all: {str(e)}")
+        return await answer_bank.rebuild(force)
+    finally:
+        await http_clients.shutdown()
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Mine frequent questions and pre-generate their answers")
+    parser.add_argument("--force", action="store_true", help="Regenerate answers that are still current")
+    args = parser.parse_args()
+
+    generated = asyncio.run(_run_cli(args.force))
+    print(f"{generated} answers generated")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Token counting and budgeted prompt assembly (system prompt, RAG context, history)
+"""
+import logging
+import math
+import re
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+# Pre-tokenization close to BPE tokenizers: words (with their leading space), digits, symbols
+_PIECE = re.compile(r" ?[^\W\d_]+| ?\d{1,3}| ?[^\s\w]+|\s+", re.UNICODE)
+
+# Role and separator framing added by chat templates around each message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def _piece_tokens(piece: str) -> int:
+    # Common short words are one token; longer ones split into ~4-character pieces
+    return max(1, math.ceil(len(piece.strip() or piece) / 4))
+
+
+class TokenCounter:
+    """
+    Fast local token counts (tiktoken if installed, else a BPE-like estimate)
+
+    Counts of message texts are memoized in a bounded LRU so a conversation's
+    history is not re-tokenized on every turn.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._counts: "OrderedDict[str, int]" = OrderedDict()
+        self._encoding = None
+        if TIKTOKEN_AVAILABLE and settings.context_tiktoken_encoding:
+            try:
+                self._encoding = tiktoken.get_encoding(settings.context_tiktoken_encoding)
+            except Exception as e:
+                logger.warning(f"tiktoken encoding unavailable, estimating token counts: {str(e)}")
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def backend(self) -> str:
+        return "tiktoken" if self._encoding is not None else "estimate"
+
+    def count(self, text: str) -> int:
+        """Token count of a text (not memoized)"""
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return sum(_piece_tokens(match.group()) for match in _PIECE.finditer(text))
+
+    def count_cached(self, text: str) -> int:
+        """Token count of a text that recurs across turns (history messages, chunks)"""
+        count = self._counts.get(text)
+        if count is not None:
+            self._counts.move_to_end(text)
+            self.hits += 1
+            return count
+
+        self.misses += 1
+        count = self.count(text)
+        self._counts[text] = count
+        if len(self._counts) > self.max_entries:
+            self._counts.popitem(last=False)
+        return count
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Longest prefix of `text` within `max_tokens` tokens"""
+        if max_tokens <= 0:
+            return ""
+        if self._encoding is not None:
+            tokens = self._encoding.encode(text, disallowed_special=())
+            return text if len(tokens) <= max_tokens else self._encoding.decode(tokens[:max_tokens])
+
+        used = 0
+        for match in _PIECE.finditer(text):
+            used += _piece_tokens(match.group())
+            if used > max_tokens:
+                return text[:match.start()]
+        return text
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "backend": self.backend,
+            "entries": len(self._counts),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class ContextAssembler:
+    """Fits RAG context and conversation history into per-model token budgets"""
+
+    def __init__(self):
+        self.tokens = TokenCounter(settings.context_token_cache_entries)
+
+    def budget(self, model: str) -> int:
+        """Prompt token budget of a model (CONTEXT_BUDGET_TOKENS overrides the default)"""
+        return int(settings.context_budget_tokens.get(model, settings.context_default_budget_tokens))
+
+    def message_tokens(self, message: Dict[str, Any]) -> int:
+        return self.tokens.count_cached(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+    def fit_parts(self, parts: List[str], max_tokens: int, separator: str = "\n\n---\n\n") -> List[str]:
+        """
+        Keep parts in order (best first) while they fit; the first part is truncated if needed
+
+        Args:
+            parts: Formatted context parts, most relevant first
+            max_tokens: Budget for the joined parts
+            separator: Separator the parts will be joined with
+
+        Returns:
+            Parts that fit the budget
+        """
+        separator_tokens = self.tokens.count(separator)
+        kept: List[str] = []
+        used = 0
+        for part in parts:
+            tokens = self.tokens.count_cached(part) + (separator_tokens if kept else 0)
+            if used + tokens > max_tokens:
+                if not kept:
+                    kept.append(self.tokens.truncate(part, max_tokens))
+                break
+            kept.append(part)
+            used += tokens
+        if len(kept) < len(parts):
+            logger.info(f"Context budget: kept {len(kept)}/{len(parts)} parts within {max_tokens} tokens")
+        return kept
+
+    def fit_history(
+        self,
+        history: List[Dict[str, Any]],
+        max_tokens: int,
+        max_messages: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Most recent messages that fit in `max_tokens`, in chronological order
+
+        A leading running summary ('system' message) is kept first; then the
+        oldest turns are dropped first. A dropped user message takes its reply
+        with it so the kept turns never start with an orphan assistant message.
+        """
+        pinned = [message for message in history if message["role"] == "system"]
+        turns = [message for message in history if message["role"] != "system"]
+        if max_messages is not None:
+            turns = turns[-max_messages:]
+
+        used = sum(self.message_tokens(message) for message in pinned)
+        if used > max_tokens:
+            pinned, used = [], 0
+
+        kept: List[Dict[str, Any]] = []
+        for message in reversed(turns):
+            tokens = self.message_tokens(message)
+            if used + tokens > max_tokens:
+                break
+            kept.append(message)
+            used += tokens
+        kept.reverse()
+
+        if len(kept) < len(turns):
+            while kept and kept[0]["role"] == "assistant":
+                kept.pop(0)
+            logger.info(f"Context budget: kept {len(kept)}/{len(turns)} history messages within {max_tokens} tokens")
+        return pinned + kept
+
+    def history_budget(self, model: str, *fixed_tokens: int) -> int:
+        """Tokens left for history once the system prompt, context and current message are counted"""
+        return max(0, self.budget(model) - sum(fixed_tokens))
+
+    def stats(self) -> Dict[str, Any]:
+        return self.tokens.stats()
+
+
+# Singleton instance
+context_assembler = ContextAssembler()
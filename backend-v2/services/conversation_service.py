@@ -1,12 +1,18 @@
 """
 Conversation service for managing chat history and messages in Supabase
 """
+import asyncio
 import logging
+from collections import OrderedDict
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timezone
 import httpx
 
 from config.settings import settings
+from services.http_clients import http_clients
+from services.history_cache import HistoryCache, parse_timestamp
+from services.conversation_summarizer import conversation_summarizer
+from services.metrics import span
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +23,58 @@ class ConversationService:
     def __init__(self):
         self.supabase_url = settings.supabase_url
         self.supabase_key = settings.supabase_key
+        # Last routing per conversation: agent, confidence and consecutive sticky turns
+        self._routing: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # Conversation IDs known to exist in Supabase (LRU) and upserts in flight
+        self._known_conversations: "OrderedDict[str, None]" = OrderedDict()
+        self._creating: Dict[str, asyncio.Future] = {}
+        # Messages queued for the background writer but not yet in Supabase
+        self._unwritten: Dict[str, List[Dict[str, Any]]] = {}
+        self.history_cache = (
+            HistoryCache(
+                capacity=settings.max_history_messages,
+                max_chars=settings.history_cache_max_chars,
+            )
+            if settings.history_cache_enabled
+            else None
+        )
+
+    def last_routing(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Last agent that answered a conversation in this process
+
+        Returns:
+            Dict with 'agent', 'confidence' (None if only known from the database)
+            and 'sticky_turns', or None if unknown
+        """
+        return self._routing.get(conversation_id)
+
+    def remember_routing(
+        self,
+        conversation_id: str,
+        agent: str,
+        confidence: Optional[float],
+        sticky: bool = False,
+    ) -> None:
+        """
+        Record the routing decision for a conversation
+
+        Args:
+            conversation_id: Conversation identifier
+            agent: Agent chosen for this turn
+            confidence: Decision confidence (None when recovered from stored messages)
+            sticky: Whether the previous agent was reused without re-routing
+        """
+        previous = self._routing.get(conversation_id)
+        sticky_turns = previous["sticky_turns"] + 1 if sticky and previous else 0
+        self._routing[conversation_id] = {
+            "agent": agent,
+            "confidence": confidence,
+            "sticky_turns": sticky_turns,
+        }
+        self._routing.move_to_end(conversation_id)
+        while len(self._routing) > settings.sticky_max_conversations:
+            self._routing.popitem(last=False)
 
     async def load_history(
         self,
@@ -31,41 +89,57 @@ class ConversationService:
             limit: Maximum number of messages to retrieve
 
         Returns:
-            List of messages in chronological order with 'role' and 'content'
+            List of messages in chronological order with 'role' and 'content',
+            preceded by the running summary (a 'system' message) when older
+            turns have been summarised
         """
         limit = limit or settings.max_history_messages
 
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.supabase_url}/rest/v1/messages",
-                    headers={
-                        "apikey": self.supabase_key,
-                        "Authorization": f"Bearer {self.supabase_key}",
-                    },
-                    params={
-                        "conversation_id": f"eq.{conversation_id}",
-                        "order": "created_at.desc",
-                        "limit": limit,
-                    },
-                    timeout=10.0,
-                )
-                response.raise_for_status()
-                messages = response.json()
-
-                # Reverse to get chronological order
-                messages.reverse()
-
-                # Format for LLM
-                formatted = []
-                for msg in messages:
-                    formatted.append({
-                        "role": msg["role"],  # 'user' or 'assistant'
-                        "content": msg["content"]
-                    })
+        cache = self.history_cache
+        if cache is not None and limit <= cache.capacity:
+            cached = cache.get(conversation_id, limit)
+            if cached is not None and self._needs_version_check(conversation_id):
+                if await self._is_cache_current(conversation_id):
+                    cache.mark_verified(conversation_id)
+                else:
+                    # Another worker wrote to this conversation since we cached it
+                    cache.stale += 1
+                    cache.invalidate(conversation_id)
+                    cached = None
+            if cached is not None:
+                self._recover_routing(conversation_id, cached)
+                logger.info(f"Loaded {len(cached)} messages for conversation {conversation_id} from cache")
+                return await self._with_summary(conversation_id, self._format_history(cached), limit)
 
-                logger.info(f"Loaded {len(formatted)} messages for conversation {conversation_id}")
-                return formatted
+        try:
+            client = http_clients.supabase
+            response = await client.get(
+                f"{self.supabase_url}/rest/v1/messages",
+                headers={
+                    "apikey": self.supabase_key,
+                    "Authorization": f"Bearer {self.supabase_key}",
+                },
+                params={
+                    "conversation_id": f"eq.{conversation_id}",
+                    "order": "created_at.desc",
+                    "limit": limit,
+                },
+                timeout=10.0,
+            )
+            response.raise_for_status()
+            messages = response.json()
+
+            # Reverse to get chronological order
+            messages.reverse()
+            messages = self._with_unwritten(conversation_id, messages)[-limit:]
+
+            if cache is not None:
+                cache.fill(conversation_id, messages, limit)
+
+            self._recover_routing(conversation_id, messages)
+
+            logger.info(f"Loaded {len(messages)} messages for conversation {conversation_id}")
+            return await self._with_summary(conversation_id, self._format_history(messages), limit)
 
         except httpx.HTTPStatusError as e:
             logger.error(f"Failed to load history: {e.response.status_code} - {e.response.text}")
@@ -74,6 +148,152 @@ class ConversationService:
             logger.error(f"Error loading conversation history: {str(e)}")
             return []
 
+    def track_unwritten(self, messages: List[Dict[str, Any]]) -> None:
+        """Remember queued messages so history reads see them before they are written"""
+        for message in messages:
+            self._unwritten.setdefault(message["conversation_id"], []).append(message)
+
+    def mark_written(self, messages: List[Dict[str, Any]]) -> None:
+        """Forget queued messages once written (or dead-lettered)"""
+        for message in messages:
+            pending = self._unwritten.get(message["conversation_id"])
+            if pending is None:
+                continue
+            try:
+                pending.remove(message)
+            except ValueError:
+                pass
+            if not pending:
+                del self._unwritten[message["conversation_id"]]
+
+    def _with_unwritten(
+        self,
+        conversation_id: str,
+        messages: List[Dict[str, Any]],
+    ) -> List[Dict[str, Any]]:
+        """Append this process's queued messages that Supabase does not have yet"""
+        pending = self._unwritten.get(conversation_id)
+        if not pending:
+            return messages
+        newest = parse_timestamp(messages[-1].get("created_at")) if messages else None
+        return messages + [
+            message for message in pending
+            if newest is None or parse_timestamp(message["created_at"]) > newest
+        ]
+
+    async def _with_summary(
+        self,
+        conversation_id: str,
+        history: List[Dict[str, str]],
+        limit: int,
+    ) -> List[Dict[str, str]]:
+        """Prepend the running summary when the history fills the window (only then can older turns exist)"""
+        if not settings.conversation_summary_enabled or len(history) < limit:
+            return history
+        summary = await conversation_summarizer.summary_message(conversation_id)
+        return [summary] + history if summary else history
+
+    @staticmethod
+    def _format_history(messages: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """Format stored messages for the LLM"""
+        return [
+            {
+                "role": msg["role"],  # 'user' or 'assistant'
+                "content": msg["content"]
+            }
+            for msg in messages
+        ]
+
+    def _recover_routing(self, conversation_id: str, messages: List[Dict[str, Any]]) -> None:
+        """Recover the last agent from the `agent` column (e.g. after a restart or on another worker)"""
+        if conversation_id in self._routing:
+            return
+        last_agent = next(
+            (msg.get("agent") for msg in reversed(messages) if msg["role"] == "assistant" and msg.get("agent")),
+            None,
+        )
+        if last_agent:
+            self.remember_routing(conversation_id, last_agent, confidence=None)
+
+    def _needs_version_check(self, conversation_id: str) -> bool:
+        """Whether a cache hit must be confirmed against Supabase (see HISTORY_CACHE_MODE)"""
+        mode = settings.history_cache_mode
+        if mode == "version":
+            return True
+        if mode == "ttl":
+            return not self.history_cache.verified_within(conversation_id, settings.history_cache_ttl_seconds)
+        return False
+
+    async def _is_cache_current(self, conversation_id: str) -> bool:
+        """
+        Version check: no message newer than our cached ones exists in Supabase
+
+        Supabase may lag behind the cache (our own writes are still in flight),
+        which is fine; only a newer row means another worker wrote. Fails open.
+        """
+        try:
+            client = http_clients.supabase
+            response = await client.get(
+                f"{self.supabase_url}/rest/v1/messages",
+                headers={
+                    "apikey": self.supabase_key,
+                    "Authorization": f"Bearer {self.supabase_key}",
+                },
+                params={
+                    "conversation_id": f"eq.{conversation_id}",
+                    "select": "created_at",
+                    "order": "created_at.desc",
+                    "limit": 1,
+                },
+                timeout=10.0,
+            )
+            response.raise_for_status()
+            rows = response.json()
+
+        except Exception as e:
+            logger.error(f"History cache version check failed: {str(e)}")
+            return True
+
+        if not rows:
+            return True
+        newest = parse_timestamp(rows[0].get("created_at"))
+        cached = self.history_cache.last_created_at(conversation_id)
+        if newest is None:
+            return True
+        return cached is not None and newest <= cached
+
+    def record_message(
+        self,
+        conversation_id: str,
+        role: str,
+        content: str,
+        agent: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Build a message row and add it to the history cache
+
+        Args:
+            conversation_id: Conversation identifier
+            role: Message role ('user' or 'assistant')
+            content: Message content
+            agent: Which agent responded (for assistant messages)
+
+        Returns:
+            Row for the `messages` table (same keys for every message, for bulk inserts)
+        """
+        message_data = {
+            "conversation_id": conversation_id,
+            "role": role,
+            "content": content,
+            "agent": agent,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+
+        # Write-behind: the next turn reads this message from memory
+        if self.history_cache is not None:
+            self.history_cache.append(conversation_id, message_data)
+        return message_data
+
     async def save_message(
         self,
         conversation_id: str,
@@ -94,36 +314,35 @@ class ConversationService:
             True if successful, False otherwise
         """
         try:
-            message_data = {
-                "conversation_id": conversation_id,
-                "role": role,
-                "content": content,
-                "created_at": datetime.now(timezone.utc).isoformat(),
-            }
-
-            if agent:
-                message_data["agent"] = agent
-
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.supabase_url}/rest/v1/messages",
-                    headers={
-                        "apikey": self.supabase_key,
-                        "Authorization": f"Bearer {self.supabase_key}",
-                        "Content-Type": "application/json",
-                        "Prefer": "return=minimal",
-                    },
-                    json=message_data,
-                    timeout=10.0,
-                )
-                response.raise_for_status()
-                logger.info(f"Saved {role} message to conversation {conversation_id}")
-                return True
+            message_data = self.record_message(conversation_id, role, content, agent)
+
+            client = http_clients.supabase
+            response = await client.post(
+                f"{self.supabase_url}/rest/v1/messages",
+                headers={
+                    "apikey": self.supabase_key,
+                    "Authorization": f"Bearer {self.supabase_key}",
+                    "Content-Type": "application/json",
+                    "Prefer": "return=minimal",
+                },
+                json=message_data,
+                timeout=10.0,
+            )
+            response.raise_for_status()
+            logger.info(f"Saved {role} message to conversation {conversation_id}")
+            return True
 
         except Exception as e:
             logger.error(f"Failed to save message: {str(e)}")
+            # Keep the cache from serving a message Supabase does not have
+            if self.history_cache is not None:
+                self.history_cache.invalidate(conversation_id)
             return False
 
+    def is_known_conversation(self, conversation_id: str) -> bool:
+        """Whether this process already knows the conversation row exists"""
+        return conversation_id in self._known_conversations
+
     async def ensure_conversation_exists(
         self,
         conversation_id: str,
@@ -132,6 +351,9 @@ class ConversationService:
         """
         Ensure conversation exists in database, create if needed
 
+        Known conversations return immediately; otherwise a single idempotent
+        upsert is sent, shared by concurrent callers for the same conversation.
+
         Args:
             conversation_id: Conversation identifier
             user_id: User identifier
@@ -139,91 +361,63 @@ class ConversationService:
         Returns:
             True if conversation exists or was created successfully
         """
-        try:
-            # Try to get existing conversation
-            async with httpx.AsyncClient() as client:
-                get_response = await client.get(
-                    f"{self.supabase_url}/rest/v1/conversations",
-                    headers={
-                        "apikey": self.supabase_key,
-                        "Authorization": f"Bearer {self.supabase_key}",
-                    },
-                    params={"id": f"eq.{conversation_id}"},
-                    timeout=10.0,
-                )
+        if conversation_id in self._known_conversations:
+            self._known_conversations.move_to_end(conversation_id)
+            return True
+        return await asyncio.shield(self.start_conversation(conversation_id, user_id))
 
-                if get_response.status_code == 200 and get_response.json():
-                    logger.info(f"Conversation {conversation_id} already exists")
-                    return True
-
-                # Create new conversation
-                conversation_data = {
-                    "id": conversation_id,
-                    "user_id": user_id,
-                    "created_at": datetime.now(timezone.utc).isoformat(),
-                    "updated_at": datetime.now(timezone.utc).isoformat(),
-                }
-
-                create_response = await client.post(
-                    f"{self.supabase_url}/rest/v1/conversations",
-                    headers={
-                        "apikey": self.supabase_key,
-                        "Authorization": f"Bearer {self.supabase_key}",
-                        "Content-Type": "application/json",
-                        "Prefer": "return=minimal",
-                    },
-                    json=conversation_data,
-                    timeout=10.0,
-                )
-                create_response.raise_for_status()
-                logger.info(f"Created new conversation {conversation_id}")
-                return True
-
-        except Exception as e:
-            logger.error(f"Error ensuring conversation exists: {str(e)}")
-            return False
-
-    async def check_rate_limit(
-        self,
-        conversation_id: str,
-    ) -> Dict[str, Any]:
+    def start_conversation(self, conversation_id: str, user_id: str) -> asyncio.Future:
         """
-        Check if conversation is within rate limits
+        Start creating a conversation row without waiting for it
 
-        Args:
-            conversation_id: Conversation identifier
+        The upsert is held in `_creating` until done, so it is never an
+        orphaned task; later ensure_conversation_exists calls (the message
+        writer's) await the same one.
 
         Returns:
-            Dict with 'allowed' (bool) and 'remaining' (int) keys
+            Future resolving to True once the row exists
         """
+        pending = self._creating.get(conversation_id)
+        if pending is None:
+            pending = asyncio.ensure_future(self._upsert_conversation(conversation_id, user_id))
+            self._creating[conversation_id] = pending
+            pending.add_done_callback(lambda _: self._creating.pop(conversation_id, None))
+        return pending
+
+    async def _upsert_conversation(self, conversation_id: str, user_id: str) -> bool:
         try:
-            async with httpx.AsyncClient() as client:
+            now = datetime.now(timezone.utc).isoformat()
+            conversation_data = {
+                "id": conversation_id,
+                "user_id": user_id,
+                "created_at": now,
+                "updated_at": now,
+            }
+
+            client = http_clients.supabase
+            with span("ensure_conversation"):
                 response = await client.post(
-                    f"{self.supabase_url}/rest/v1/rpc/check_rate_limit",
+                    f"{self.supabase_url}/rest/v1/conversations",
                     headers={
                         "apikey": self.supabase_key,
                         "Authorization": f"Bearer {self.supabase_key}",
                         "Content-Type": "application/json",
+                        "Prefer": "resolution=ignore-duplicates,return=minimal",
                     },
-                    json={
-                        "p_conversation_id": conversation_id,
-                        "p_max_messages": settings.rate_limit_messages,
-                        "p_window_seconds": settings.rate_limit_window_seconds,
-                    },
+                    params={"on_conflict": "id"},
+                    json=conversation_data,
                     timeout=10.0,
                 )
                 response.raise_for_status()
-                result = response.json()
 
-                return {
-                    "allowed": result.get("allowed", True),
-                    "remaining": result.get("remaining", settings.rate_limit_messages),
-                }
+            self._known_conversations[conversation_id] = None
+            while len(self._known_conversations) > settings.conversation_cache_max_entries:
+                self._known_conversations.popitem(last=False)
+            return True
 
         except Exception as e:
-            logger.error(f"Rate limit check failed: {str(e)}")
-            # Fail open - allow the request
-            return {"allowed": True, "remaining": settings.rate_limit_messages}
+            logger.error(f"Error ensuring conversation exists: {str(e)}")
+            return False
 
 
 # Singleton instance
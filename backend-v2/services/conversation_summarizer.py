@@ -0,0 +1,239 @@
+"""
+Rolling conversation summaries: turns older than the history window, folded in the background
+"""
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from config.settings import settings
+from services.http_clients import http_clients
+from services.context_assembler import context_assembler
+from services.openrouter_client import openrouter_client
+from services.prompts import SUMMARY_HEADER, SUMMARY_PROMPT, render_static, system_message
+from services.metrics import span
+
+logger = logging.getLogger(__name__)
+
+# Each folded message is clipped so one long answer cannot crowd out the rest
+FOLDED_MESSAGE_TOKENS = 300
+
+# Messages saved per turn (user + assistant)
+TURN_MESSAGES = 2
+
+
+class ConversationSummarizer:
+    """
+    Keeps a running summary per conversation in `conversations.summary`
+
+    After a reply is sent, messages that have left the history window (and
+    are not yet summarised) are folded into the summary by the orchestrator
+    model; `summary_until` records the last folded message. Summaries (or
+    their absence) are cached in memory once read, until the next fold
+    re-reads them, and only read for conversations whose history fills
+    the window.
+    """
+
+    def __init__(self):
+        self.supabase_url = settings.supabase_url
+        self.supabase_key = settings.supabase_key
+        self.model = settings.conversation_summary_model or settings.orchestrator_model
+        self.static_block = render_static(SUMMARY_PROMPT, self.model)
+        # conversation_id -> {"summary", "until"}, or None for conversations without a summary yet
+        self._summaries: "OrderedDict[str, Optional[Dict[str, str]]]" = OrderedDict()
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+        self.runs = 0
+        self.folded = 0
+        self.failures = 0
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "apikey": self.supabase_key,
+            "Authorization": f"Bearer {self.supabase_key}",
+        }
+
+    def _remember(self, conversation_id: str, entry: Optional[Dict[str, str]]) -> None:
+        self._summaries[conversation_id] = entry
+        self._summaries.move_to_end(conversation_id)
+        while len(self._summaries) > settings.conversation_cache_max_entries:
+            self._summaries.popitem(last=False)
+
+    async def _entry(self, conversation_id: str, refresh: bool = False) -> Optional[Dict[str, str]]:
+        """Summary and last folded message time, from memory unless `refresh`"""
+        if not refresh and conversation_id in self._summaries:
+            self._summaries.move_to_end(conversation_id)
+            return self._summaries[conversation_id]
+
+        response = await http_clients.supabase.get(
+            f"{self.supabase_url}/rest/v1/conversations",
+            headers=self._headers(),
+            params={"id": f"eq.{conversation_id}", "select": "summary,summary_until"},
+            timeout=10.0,
+        )
+        response.raise_for_status()
+        rows = response.json()
+        entry = (
+            {"summary": rows[0]["summary"], "until": rows[0]["summary_until"]}
+            if rows and rows[0].get("summary")
+            else None
+        )
+        # Absence cached too: until the next fold, every full-window turn would read it again
+        self._remember(conversation_id, entry)
+        return entry
+
+    async def summary_message(self, conversation_id: str) -> Optional[Dict[str, str]]:
+        """
+        Running summary as a system message to put before the recent turns
+
+        Returns:
+            Message dict, or None if the conversation has no summary (or it cannot be read)
+        """
+        try:
+            entry = await self._entry(conversation_id)
+        except Exception as e:
+            logger.error(f"Failed to load summary for conversation {conversation_id}: {str(e)}")
+            return None
+        if entry is None:
+            return None
+        return {"role": "system", "content": SUMMARY_HEADER + entry["summary"]}
+
+    def schedule(self, conversation_id: str, history: List[Dict[str, str]]) -> None:
+        """
+        Summarise in the background if the conversation has outgrown the history window
+
+        Call once the turn's messages are queued; the work runs off the request path.
+
+        Args:
+            conversation_id: Conversation identifier
+            history: History loaded for this turn (a full window means older turns exist)
+        """
+        if len(history) < settings.max_history_messages or conversation_id in self._tasks:
+            return
+        task = asyncio.create_task(self._summarize(conversation_id))
+        self._tasks[conversation_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(conversation_id, None))
+
+    async def _summarize(self, conversation_id: str) -> None:
+        self.runs += 1
+        try:
+            with span("summarize", model=self.model):
+                while await self._fold_batch(conversation_id):
+                    pass
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"Failed to summarise conversation {conversation_id}: {str(e)}")
+
+    async def _fold_batch(self, conversation_id: str) -> bool:
+        """Fold the oldest unsummarised messages outside the window; True if more remain"""
+        # Fresh read: another worker may have folded some of these messages already
+        entry = await self._entry(conversation_id, refresh=True)
+        window_start = await self._window_start(conversation_id)
+        if window_start is None:
+            return False
+
+        filters = [("created_at", f"lte.{window_start}")]
+        if entry is not None:
+            filters.append(("created_at", f"gt.{entry['until']}"))
+        response = await http_clients.supabase.get(
+            f"{self.supabase_url}/rest/v1/messages",
+            headers=self._headers(),
+            params=[
+                ("conversation_id", f"eq.{conversation_id}"),
+                ("select", "role,content,created_at"),
+                *filters,
+                ("order", "created_at.asc"),
+                ("limit", str(settings.conversation_summary_batch_messages)),
+            ],
+            timeout=10.0,
+        )
+        response.raise_for_status()
+        messages = response.json()
+        if len(messages) < settings.conversation_summary_min_messages:
+            return False
+
+        summary = await self._generate(entry["summary"] if entry else None, messages)
+        until = messages[-1]["created_at"]
+        await self._store(conversation_id, summary, until)
+        self._remember(conversation_id, {"summary": summary, "until": until})
+        self.folded += len(messages)
+        logger.info(f"Folded {len(messages)} messages into the summary of conversation {conversation_id}")
+        return len(messages) == settings.conversation_summary_batch_messages
+
+    async def _window_start(self, conversation_id: str) -> Optional[str]:
+        """created_at of the newest message outside the next turn's history window (None if all fit)"""
+        response = await http_clients.supabase.get(
+            f"{self.supabase_url}/rest/v1/messages",
+            headers=self._headers(),
+            params={
+                "conversation_id": f"eq.{conversation_id}",
+                "select": "created_at",
+                "order": "created_at.desc",
+                # The turn just queued may not be written yet: folding it one turn
+                # early (a short overlap with the window) beats leaving a gap
+                "offset": max(0, settings.max_history_messages - TURN_MESSAGES),
+                "limit": 1,
+            },
+            timeout=10.0,
+        )
+        response.raise_for_status()
+        rows = response.json()
+        return rows[0]["created_at"] if rows else None
+
+    async def _generate(self, summary: Optional[str], messages: List[Dict[str, Any]]) -> str:
+        exchanges = "\n".join(
+            f"{msg['role']}: {context_assembler.tokens.truncate(msg['content'], FOLDED_MESSAGE_TOKENS)}"
+            for msg in messages
+        )
+        response = await openrouter_client.chat_completion(
+            messages=[
+                system_message(self.static_block),
+                {
+                    "role": "user",
+                    "content": f"RÉSUMÉ ACTUEL:\n{summary or 'Aucun'}\n\nNOUVEAUX ÉCHANGES:\n{exchanges}",
+                },
+            ],
+            model=self.model,
+            temperature=0.2,
+            max_tokens=settings.conversation_summary_max_tokens,
+        )
+        return response["choices"][0]["message"]["content"].strip()
+
+    async def _store(self, conversation_id: str, summary: str, until: str) -> None:
+        response = await http_clients.supabase.patch(
+            f"{self.supabase_url}/rest/v1/conversations",
+            headers={
+                **self._headers(),
+                "Content-Type": "application/json",
+                "Prefer": "return=minimal",
+            },
+            params={"id": f"eq.{conversation_id}"},
+            json={
+                "summary": summary,
+                "summary_until": until,
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+            },
+            timeout=10.0,
+        )
+        response.raise_for_status()
+
+    async def shutdown(self) -> None:
+        """Cancel summaries still running (they are retried on the next turn)"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._summaries),
+            "running": len(self._tasks),
+            "runs": self.runs,
+            "folded_messages": self.folded,
+            "failures": self.failures,
+        }
+
+
+# Singleton instance
+conversation_summarizer = ConversationSummarizer()
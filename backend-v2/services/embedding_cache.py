@@ -0,0 +1,194 @@
+"""
+Embedding cache: in-process LRU + TTL with optional memory-mapped disk store
+"""
+import hashlib
+import logging
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Normalise a query so near-verbatim repeats share a cache key"""
+    text = unicodedata.normalize("NFC", text)
+    return _WHITESPACE.sub(" ", text).strip().lower()
+
+
+def cache_key(text: str, model: str) -> bytes:
+    """16-byte digest of (model, normalised text)"""
+    return hashlib.blake2b(
+        f"{model}\0{normalize_text(text)}".encode("utf-8"),
+        digest_size=16,
+    ).digest()
+
+
+class DiskEmbeddingStore:
+    """
+    Fixed-size, direct-mapped embedding store in a memory-mapped file
+
+    Each key hashes to one slot; a colliding write simply replaces the
+    previous entry. The file can be shared by several uvicorn workers:
+    writers clear the slot key before writing the vector and set it last,
+    and readers re-check the key after copying, so a torn read is treated
+    as a miss.
+    """
+
+    def __init__(self, path: str, dimension: int, slots: int):
+        self.path = path
+        self.slots = slots
+        self.dtype = np.dtype([
+            ("key", "<u8", (2,)),
+            ("created", "<f8"),
+            ("vector", "<f4", (dimension,)),
+        ])
+        expected_size = self.dtype.itemsize * slots
+
+        mode = "r+"
+        if not os.path.exists(path) or os.path.getsize(path) != expected_size:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            mode = "w+"
+            logger.info(f"Creating embedding cache file {path} ({expected_size / 1e6:.1f} MB)")
+
+        self._table = np.memmap(path, dtype=self.dtype, mode=mode, shape=(slots,))
+
+    def _slot(self, key: bytes) -> Tuple[int, np.ndarray]:
+        words = np.frombuffer(key, dtype="<u8")
+        return int(words[0] % self.slots), words
+
+    def get(self, key: bytes, ttl_seconds: float) -> Optional[Tuple[np.ndarray, float]]:
+        """Vector and seconds it has left to live, or None"""
+        index, words = self._slot(key)
+        if not np.array_equal(self._table["key"][index], words):
+            return None
+        remaining = ttl_seconds - (time.time() - float(self._table["created"][index]))
+        if remaining <= 0:
+            return None
+        vector = np.array(self._table["vector"][index], dtype=np.float32)
+        # Writer may have replaced the slot while we copied
+        if not np.array_equal(self._table["key"][index], words):
+            return None
+        return vector, remaining
+
+    def put(self, key: bytes, vector: np.ndarray) -> None:
+        index, words = self._slot(key)
+        self._table["key"][index] = 0
+        self._table["vector"][index] = vector
+        self._table["created"][index] = time.time()
+        self._table["key"][index] = words
+
+    def flush(self) -> None:
+        self._table.flush()
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU + TTL cache of float32 embeddings keyed on (model, normalised text)
+
+    Disk hits keep the expiry of their original write. Disk store faults
+    are logged and counted, then treated as misses: the caller goes to the
+    API instead of failing.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        dimension: int,
+        disk_path: Optional[str] = None,
+        disk_slots: int = 65536,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[bytes, Tuple[float, np.ndarray]]" = OrderedDict()
+        self.disk: Optional[DiskEmbeddingStore] = None
+        if disk_path:
+            try:
+                self.disk = DiskEmbeddingStore(disk_path, dimension, disk_slots)
+            except Exception as e:
+                logger.error(f"Embedding disk cache unavailable, using memory only: {str(e)}")
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.errors = 0
+
+    def get(self, text: str, model: str) -> Optional[np.ndarray]:
+        """Cached embedding or None (counts a hit or a miss)"""
+        key = cache_key(text, model)
+        entry = self._entries.get(key)
+        now = time.monotonic()
+
+        if entry is not None:
+            expires_at, vector = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+            del self._entries[key]
+
+        if self.disk is not None:
+            try:
+                found = self.disk.get(key, self.ttl_seconds)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Embedding disk cache read failed: {str(e)}")
+                found = None
+            if found is not None:
+                vector, remaining = found
+                self._remember(key, vector, now + remaining)
+                self.disk_hits += 1
+                self.hits += 1
+                return vector
+
+        self.misses += 1
+        return None
+
+    def put(self, text: str, model: str, vector) -> np.ndarray:
+        """Store an embedding and return it as a float32 array"""
+        key = cache_key(text, model)
+        array = np.asarray(vector, dtype=np.float32)
+        self._remember(key, array, time.monotonic() + self.ttl_seconds)
+        if self.disk is not None:
+            try:
+                self.disk.put(key, array)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Embedding disk cache write failed: {str(e)}")
+        return array
+
+    def _remember(self, key: bytes, vector: np.ndarray, expires_at: float) -> None:
+        self._entries[key] = (expires_at, vector)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def flush(self) -> None:
+        """Persist the disk store (called on shutdown)"""
+        if self.disk is not None:
+            self.disk.flush()
+
+    def stats(self) -> Dict[str, float]:
+        """Counters for monitoring"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
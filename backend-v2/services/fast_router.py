@@ -0,0 +1,196 @@
+"""
+Fast local router: keyword lexicons + knowledge-base centroids before the LLM orchestrator
+"""
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
+
+from config.settings import settings
+from models.schemas import OrchestrationDecision
+from services.rerankers import tokenize
+from services.local_vector_index import local_vector_index
+
+logger = logging.getLogger(__name__)
+
+# Accent-folded terms from each agent's expertise list (see the orchestrator prompt),
+# matched as whole tokens (or consecutive tokens for phrases) so that everyday
+# words sharing a prefix ("système", "leader", "postuler") never match. Weight
+# reflects how specific a term is.
+LEXICONS: Dict[str, Dict[str, float]] = {
+    "audrey": {
+        "tunnel": 2.0, "tunnels": 2.0, "funnel": 2.0, "funnels": 2.0,
+        "automatiser": 2.0, "automatise": 2.0, "automatisee": 2.0, "automatises": 2.0,
+        "automatisation": 2.0, "automatisations": 2.0, "automation": 2.0, "automations": 2.0,
+        "email": 1.5, "emails": 1.5, "emailing": 1.5, "mail": 1.0, "mails": 1.0, "mailing": 1.5,
+        "newsletter": 1.5, "newsletters": 1.5, "sequence": 1.5, "sequences": 1.5,
+        "kajabi": 2.0, "zapier": 2.0, "activecampaign": 2.0, "systeme io": 2.0, "systemeio": 2.0,
+        "conversion": 1.5, "conversions": 1.5, "taux de conversion": 1.0,
+        "analytics": 2.0, "tracking": 2.0, "metrique": 1.5, "metriques": 1.5, "kpi": 1.5, "kpis": 1.5,
+        "landing": 1.5, "landing page": 1.0, "optin": 1.5, "opt in": 1.5, "lead": 1.0, "leads": 1.0,
+        "lead magnet": 1.0, "crm": 2.0, "webinaire": 1.0, "webinaires": 1.0, "webinar": 1.0,
+        "paiement": 1.0, "paiements": 1.0, "checkout": 1.5,
+        "vente": 1.0, "ventes": 1.0, "page de vente": 1.0,
+    },
+    "carole": {
+        "instagram": 2.0, "insta": 2.0, "reel": 2.0, "reels": 2.0, "story": 2.0, "stories": 2.0,
+        "post": 1.0, "posts": 1.0, "carrousel": 2.0, "carrousels": 2.0, "carousel": 2.0, "carousels": 2.0,
+        "contenu": 1.5, "contenus": 1.5, "viral": 1.5, "virale": 1.5, "viraux": 1.5,
+        "storytelling": 2.0, "copywriting": 1.5, "branding": 2.0, "marque": 1.0, "personal branding": 1.0,
+        "visuel": 1.5, "visuels": 1.5, "design": 1.5, "esthetique": 1.5,
+        "community": 1.5, "communaute": 1.5, "engagement": 1.5, "abonne": 1.5, "abonnes": 1.5,
+        "abonnee": 1.5, "abonnees": 1.5, "hook": 1.5, "hooks": 1.5, "accroche": 1.5, "accroches": 1.5,
+        "caption": 1.5, "captions": 1.5, "legende": 1.0, "legendes": 1.0,
+        "hashtag": 2.0, "hashtags": 2.0, "feed": 1.5, "editorial": 1.5, "ligne editoriale": 1.0,
+        "canva": 2.0, "tiktok": 1.5,
+    },
+}
+
+
+def lexical_scores(message: str) -> Dict[str, float]:
+    """Weighted count of distinct lexicon terms matched per agent (whole tokens or phrases)"""
+    tokens = tokenize(message)
+    terms = set(tokens)
+    for length in (2, 3):
+        terms.update(" ".join(tokens[i:i + length]) for i in range(len(tokens) - length + 1))
+    return {
+        agent: sum(weight for term, weight in lexicon.items() if term in terms)
+        for agent, lexicon in LEXICONS.items()
+    }
+
+
+class FastRouter:
+    """Decides clear-cut messages locally; returns None when the LLM should decide"""
+
+    def __init__(self):
+        # agent -> (local index version, centroid)
+        self._centroids: Dict[str, Tuple[int, np.ndarray]] = {}
+        self.local_decisions = 0
+        self.fallbacks = 0
+
+    def _centroid(self, agent: str) -> Optional[np.ndarray]:
+        """Unit-normalised mean embedding of the agent's own chunks (needs the local index)"""
+        if not local_vector_index.is_ready(agent):
+            return None
+        index = local_vector_index.indexes[agent]
+
+        cached = self._centroids.get(agent)
+        if cached and cached[0] == index.version:
+            return cached[1]
+
+        own = [i for i, owner in enumerate(index.owners) if owner == agent]
+        if not own:
+            return None
+        centroid = np.asarray(index.matrix[own], dtype=np.float32).mean(axis=0)
+        norm = np.linalg.norm(centroid)
+        if norm == 0:
+            return None
+        centroid /= norm
+        self._centroids[agent] = (index.version, centroid)
+        return centroid
+
+    def has_centroids(self) -> bool:
+        return self._centroid("audrey") is not None and self._centroid("carole") is not None
+
+    def centroid_margin(self, embedding: List[float]) -> Optional[float]:
+        """Audrey-minus-Carole centroid similarity, scaled to [-1, 1]"""
+        audrey, carole = self._centroid("audrey"), self._centroid("carole")
+        if audrey is None or carole is None:
+            return None
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return None
+        difference = float((audrey - carole) @ (query / norm))
+        return max(-1.0, min(1.0, difference / settings.fast_router_centroid_scale))
+
+    async def route(self, message: str, embed=None) -> Optional[Dict[str, Any]]:
+        """
+        Route a message locally when the signal is clear
+
+        Args:
+            message: Current user message
+            embed: Optional coroutine function returning the message embedding,
+                only awaited when the lexicon alone is not decisive
+
+        Returns:
+            Decision dict (OrchestrationDecision shape) or None to fall back to the LLM
+        """
+        scores = lexical_scores(message)
+        lexical = (scores["audrey"] - scores["carole"]) / (scores["audrey"] + scores["carole"] + 1.0)
+        # The lexicon alone decides only with enough evidence: one weak term is not a topic
+        decisive = (
+            abs(lexical) >= settings.fast_router_min_margin
+            and max(scores.values()) >= settings.fast_router_min_lexical_score
+        )
+        margin, signals = (lexical, "lexique") if decisive else (None, None)
+
+        # Only pay for the embedding when the lexicon is unsure and centroids exist
+        if not decisive and embed is not None and self.has_centroids():
+            try:
+                centroid = self.centroid_margin(await embed())
+            except Exception as e:
+                logger.error(f"Fast router centroid scoring failed: {str(e)}")
+                centroid = None
+            if centroid is not None:
+                weight = settings.fast_router_lexical_weight
+                margin = weight * lexical + (1 - weight) * centroid
+                signals = "lexique + centroïdes"
+
+        if margin is None or abs(margin) < settings.fast_router_min_margin:
+            self.fallbacks += 1
+            return None
+
+        agent = "audrey" if margin > 0 else "carole"
+        self.local_decisions += 1
+        decision = OrchestrationDecision(
+            agent=agent,
+            confidence=round(min(0.95, 0.7 + 0.25 * abs(margin)), 2),
+            primary_need="automatisation & tunnels" if agent == "audrey" else "création de contenu & Instagram",
+            reasoning=f"Routage local ({signals}, marge {abs(margin):.2f})",
+        )
+        return decision.model_dump()
+
+    def sticky_decision(
+        self,
+        message: str,
+        previous: Optional[Dict[str, Any]],
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Reuse the conversation's previous agent for a follow-up message
+
+        Args:
+            message: Current user message
+            previous: Last routing for the conversation (see ConversationService.last_routing)
+
+        Returns:
+            Decision dict (OrchestrationDecision shape) or None when routing should run
+        """
+        if not previous or previous["agent"] not in LEXICONS:
+            return None
+        if previous["sticky_turns"] >= settings.sticky_max_turns:
+            return None
+
+        confidence = previous["confidence"]
+        if confidence is not None and confidence < settings.sticky_min_confidence:
+            return None
+
+        # Cheap topic-shift check: the message clearly points at the other agent
+        agent = previous["agent"]
+        other = "carole" if agent == "audrey" else "audrey"
+        scores = lexical_scores(message)
+        if scores[other] - scores[agent] >= settings.sticky_topic_shift_margin:
+            logger.info(f"Topic shift towards {other} detected, re-routing")
+            return None
+
+        name = "Audrey" if agent == "audrey" else "Carole"
+        decision = OrchestrationDecision(
+            agent=agent,
+            confidence=confidence if confidence is not None else settings.sticky_min_confidence,
+            primary_need="suite de la conversation",
+            reasoning=f"Suite de la conversation avec {name} (routage conservé)",
+        )
+        return decision.model_dump()
+
+
+# Singleton instance
+fast_router = FastRouter()
@@ -0,0 +1,130 @@
+"""
+Write-behind cache of recent conversation messages (per-conversation ring buffers)
+"""
+import logging
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    """Parse a Supabase/ISO timestamp, None if missing or unparsable"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+class ConversationHistory:
+    """Last messages of one conversation, oldest first"""
+
+    def __init__(self, capacity: int, complete: bool):
+        self.messages: Deque[Dict[str, Any]] = deque(maxlen=capacity)
+        # True when the buffer holds the whole conversation (fewer messages than capacity)
+        self.complete = complete
+        self.size = 0
+        # When Supabase last confirmed nothing newer exists (monotonic)
+        self.verified_at = time.monotonic()
+
+    def append(self, message: Dict[str, Any]) -> int:
+        """Add a message, returning the change in cached characters"""
+        delta = len(message["content"])
+        if len(self.messages) == self.messages.maxlen:
+            delta -= len(self.messages[0]["content"])
+            self.complete = False
+        self.messages.append(message)
+        self.size += delta
+        return delta
+
+    @property
+    def last_created_at(self) -> Optional[datetime]:
+        return parse_timestamp(self.messages[-1].get("created_at")) if self.messages else None
+
+
+class HistoryCache:
+    """
+    LRU of per-conversation ring buffers, bounded by total message characters
+
+    Entries are created from a Supabase read and then kept current by this
+    process's own writes, so follow-up turns read history from memory.
+    """
+
+    def __init__(self, capacity: int, max_chars: int):
+        self.capacity = capacity
+        self.max_chars = max_chars
+        self._entries: "OrderedDict[str, ConversationHistory]" = OrderedDict()
+        self._chars = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def get(self, conversation_id: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+        """Last `limit` cached messages, or None if the cache cannot answer"""
+        entry = self._entries.get(conversation_id)
+        if entry is None or (len(entry.messages) < limit and not entry.complete):
+            self.misses += 1
+            return None
+        self._entries.move_to_end(conversation_id)
+        self.hits += 1
+        return list(entry.messages)[-limit:] if limit else []
+
+    def last_created_at(self, conversation_id: str) -> Optional[datetime]:
+        entry = self._entries.get(conversation_id)
+        return entry.last_created_at if entry else None
+
+    def verified_within(self, conversation_id: str, seconds: float) -> bool:
+        """Whether the entry was read or version-checked in the last `seconds`"""
+        entry = self._entries.get(conversation_id)
+        return entry is not None and time.monotonic() - entry.verified_at < seconds
+
+    def mark_verified(self, conversation_id: str) -> None:
+        entry = self._entries.get(conversation_id)
+        if entry is not None:
+            entry.verified_at = time.monotonic()
+
+    def fill(self, conversation_id: str, messages: List[Dict[str, Any]], limit: int) -> None:
+        """Replace a conversation's buffer with messages read from Supabase (oldest first)"""
+        self.invalidate(conversation_id)
+        entry = ConversationHistory(self.capacity, complete=len(messages) < limit)
+        for message in messages[-self.capacity:]:
+            entry.append(message)
+        self._entries[conversation_id] = entry
+        self._chars += entry.size
+        self._evict()
+
+    def append(self, conversation_id: str, message: Dict[str, Any]) -> None:
+        """Record a message written by this process (ignored for uncached conversations)"""
+        entry = self._entries.get(conversation_id)
+        if entry is None:
+            return
+        self._chars += entry.append(message)
+        self._entries.move_to_end(conversation_id)
+        self._evict()
+
+    def invalidate(self, conversation_id: str) -> None:
+        entry = self._entries.pop(conversation_id, None)
+        if entry is not None:
+            self._chars -= entry.size
+
+    def _evict(self) -> None:
+        while self._chars > self.max_chars and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            self._chars -= entry.size
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "conversations": len(self._entries),
+            "chars": self._chars,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,80 @@
+"""
+Shared pooled HTTP clients for upstream APIs (Supabase, OpenRouter)
+"""
+import logging
+from typing import Dict, Optional
+import httpx
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class HTTPClients:
+    """Long-lived httpx clients, one per upstream, with keep-alive pooling"""
+
+    def __init__(self):
+        self._clients: Dict[str, Optional[httpx.AsyncClient]] = {
+            "supabase": None,
+            "openrouter": None,
+        }
+        self._timeouts = {
+            "supabase": httpx.Timeout(10.0, connect=5.0),
+            "openrouter": httpx.Timeout(60.0, connect=10.0),
+        }
+
+    def _build(self, upstream: str) -> httpx.AsyncClient:
+        """Create a pooled client for an upstream"""
+        http2 = settings.http2_enabled and HTTP2_AVAILABLE
+        logger.info(f"Opening pooled HTTP client for {upstream} (http2={http2})")
+        return httpx.AsyncClient(
+            timeout=self._timeouts[upstream],
+            limits=httpx.Limits(
+                max_connections=settings.http_max_connections,
+                max_keepalive_connections=settings.http_max_keepalive_connections,
+                keepalive_expiry=settings.http_keepalive_expiry,
+            ),
+            http2=http2,
+        )
+
+    def _get(self, upstream: str) -> httpx.AsyncClient:
+        client = self._clients[upstream]
+        if client is None or client.is_closed:
+            # Lazily (re)open so scripts running outside the app lifespan still work
+            client = self._build(upstream)
+            self._clients[upstream] = client
+        return client
+
+    @property
+    def supabase(self) -> httpx.AsyncClient:
+        """Pooled client for Supabase REST/RPC calls"""
+        return self._get("supabase")
+
+    @property
+    def openrouter(self) -> httpx.AsyncClient:
+        """Pooled client for OpenRouter chat completions"""
+        return self._get("openrouter")
+
+    async def startup(self) -> None:
+        """Open all upstream clients (called from the FastAPI lifespan)"""
+        for upstream in self._clients:
+            self._get(upstream)
+
+    async def shutdown(self) -> None:
+        """Close all upstream clients and release pooled connections"""
+        for upstream, client in self._clients.items():
+            if client is not None and not client.is_closed:
+                await client.aclose()
+                logger.info(f"Closed pooled HTTP client for {upstream}")
+            self._clients[upstream] = None
+
+
+# Singleton instance
+http_clients = HTTPClients()
@@ -0,0 +1,495 @@
+"""
+Knowledge-base ingestion: streaming chunker, batched embeddings and bulk upsert per agent
+
+Documents are read block by block (PDF page by page), split by a generator
+into overlapping token-sized chunks, embedded in large batched calls with
+bounded concurrency and written with one `upsert_document_chunks` call per
+group of documents. Unchanged documents and chunks (same content hash) are
+neither re-embedded nor re-written; a chunk whose text is already stored at
+another position (text inserted above it) is moved and keeps its embedding.
+
+CLI usage (from backend-v2/):
+
+    python -m services.ingestion audrey path/to/docs [more paths] [--force]
+"""
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from config.settings import settings
+from services.http_clients import http_clients
+from services.context_assembler import context_assembler
+from services.rag_service import rag_service
+from services.metrics import span
+
+logger = logging.getLogger(__name__)
+
+try:
+    from pypdf import PdfReader
+
+    PDF_AVAILABLE = True
+except ImportError:
+    PDF_AVAILABLE = False
+
+SUPPORTED_SUFFIXES = (".md", ".markdown", ".txt", ".pdf")
+AGENT_OWNERS = ("audrey", "carole", "shared")
+
+_READ_BLOCK_CHARS = 64 * 1024
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+
+
+@dataclass
+class SourceDocument:
+    """A document to ingest; `blocks` returns a fresh iterator over its text"""
+
+    filename: str
+    blocks: Callable[[], Iterator[str]]
+
+
+@dataclass
+class Chunk:
+    index: int
+    content: str
+    content_hash: str
+
+
+@dataclass
+class IngestReport:
+    documents: int = 0
+    unchanged_documents: int = 0
+    chunks: int = 0
+    embedded_chunks: int = 0
+    unchanged_chunks: int = 0
+    failed_documents: List[str] = field(default_factory=list)
+    seconds: float = 0.0
+
+
+@dataclass
+class IngestJob:
+    id: str
+    agent: str
+    status: str = "running"  # running | done | failed
+    report: IngestReport = field(default_factory=IngestReport)
+    error: Optional[str] = None
+    started_at: str = field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    finished_at: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def read_blocks(path: str) -> Iterator[str]:
+    """Text of a file in blocks (PDF: one page at a time), never the whole file at once"""
+    if path.lower().endswith(".pdf"):
+        if not PDF_AVAILABLE:
+            raise RuntimeError("PDF ingestion needs pypdf (pip install -r requirements.txt)")
+        for page in PdfReader(path).pages:
+            yield (page.extract_text() or "") + "\n\n"
+        return
+
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for block in iter(lambda: f.read(_READ_BLOCK_CHARS), ""):
+            yield block
+
+
+def iter_paragraphs(blocks: Iterable[str]) -> Iterator[str]:
+    """Paragraphs (split on blank lines) from a stream of text blocks"""
+    buffer = ""
+    for block in blocks:
+        buffer += block
+        *complete, buffer = _PARAGRAPH_BREAK.split(buffer)
+        for paragraph in complete:
+            if paragraph.strip():
+                yield paragraph.strip()
+    if buffer.strip():
+        yield buffer.strip()
+
+
+def _pieces(paragraph: str, max_tokens: int) -> Iterator[Tuple[str, int]]:
+    """A paragraph as (text, tokens) pieces of at most `max_tokens` (whole sentences where possible)"""
+    tokens = context_assembler.tokens.count(paragraph)
+    if tokens <= max_tokens:
+        yield paragraph, tokens
+        return
+
+    group, group_tokens = "", 0
+    for sentence in _SENTENCE_END.split(paragraph):
+        candidate = f"{group} {sentence}" if group else sentence
+        candidate_tokens = context_assembler.tokens.count(candidate)
+        if candidate_tokens <= max_tokens:
+            group, group_tokens = candidate, candidate_tokens
+            continue
+        if group:
+            yield group, group_tokens
+        group, group_tokens = "", 0
+        while sentence:
+            # An unbroken run longer than the budget is cut at ~4 characters per token
+            piece = context_assembler.tokens.truncate(sentence, max_tokens) or sentence[:max_tokens * 4]
+            sentence = sentence[len(piece):].lstrip()
+            piece_tokens = context_assembler.tokens.count(piece)
+            if sentence:
+                yield piece, piece_tokens
+            else:
+                group, group_tokens = piece, piece_tokens
+    if group:
+        yield group, group_tokens
+
+
+def _overlap(pieces: List[Tuple[str, int]], max_tokens: int) -> List[Tuple[str, int]]:
+    """Trailing pieces (or, for a long last piece, its trailing sentences) within `max_tokens`"""
+    kept: List[Tuple[str, int]] = []
+    used = 0
+    for text, tokens in reversed(pieces):
+        if used + tokens <= max_tokens:
+            kept.insert(0, (text, tokens))
+            used += tokens
+            continue
+        sentences = _SENTENCE_END.split(text)
+        tail = ""
+        for sentence in reversed(sentences[1:]):
+            candidate = f"{sentence} {tail}".strip()
+            candidate_tokens = context_assembler.tokens.count(candidate)
+            if used + candidate_tokens > max_tokens:
+                break
+            tail, tail_tokens = candidate, candidate_tokens
+        if tail:
+            kept.insert(0, (tail, tail_tokens))
+        break
+    return kept
+
+
+def chunk_text(blocks: Iterable[str], chunk_tokens: int, overlap_tokens: int) -> Iterator[str]:
+    """
+    Overlapping chunks of about `chunk_tokens` tokens, built from paragraphs
+
+    Paragraphs are kept whole when they fit; each chunk starts with the last
+    paragraphs (or sentences) of the previous one, up to `overlap_tokens`.
+    """
+    current: List[Tuple[str, int]] = []
+    size = 0
+    fresh = False  # Whether `current` holds anything beyond the carried-over overlap
+    for paragraph in iter_paragraphs(blocks):
+        for piece, tokens in _pieces(paragraph, chunk_tokens):
+            if fresh and size + tokens > chunk_tokens:
+                yield "\n\n".join(text for text, _ in current)
+                current = _overlap(current, min(overlap_tokens, chunk_tokens - tokens))
+                size = sum(piece_tokens for _, piece_tokens in current)
+            current.append((piece, tokens))
+            size += tokens
+            fresh = True
+    if fresh:
+        yield "\n\n".join(text for text, _ in current)
+
+
+def documents_from_paths(paths: Iterable[str]) -> Iterator[SourceDocument]:
+    """Supported files under the given paths; filenames are relative to the directory given"""
+    for path in paths:
+        if os.path.isfile(path):
+            yield SourceDocument(os.path.basename(path), lambda path=path: read_blocks(path))
+            continue
+        for root, _, files in sorted(os.walk(path)):
+            for name in sorted(files):
+                if name.lower().endswith(SUPPORTED_SUFFIXES):
+                    full_path = os.path.join(root, name)
+                    yield SourceDocument(
+                        os.path.relpath(full_path, path),
+                        lambda full_path=full_path: read_blocks(full_path),
+                    )
+
+
+def _groups(documents: Iterable[SourceDocument], size: int) -> Iterator[List[SourceDocument]]:
+    group: List[SourceDocument] = []
+    for document in documents:
+        group.append(document)
+        if len(group) >= size:
+            yield group
+            group = []
+    if group:
+        yield group
+
+
+class IngestionService:
+    """Chunks, embeds and upserts documents into an agent's knowledge base"""
+
+    def __init__(self):
+        self.supabase_url = settings.supabase_url
+        self.supabase_key = settings.supabase_key
+        self.jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "apikey": self.supabase_key,
+            "Authorization": f"Bearer {self.supabase_key}",
+            "Content-Type": "application/json",
+        }
+
+    async def ingest(
+        self,
+        agent: str,
+        documents: Iterable[SourceDocument],
+        force: bool = False,
+        report: Optional[IngestReport] = None,
+    ) -> IngestReport:
+        """
+        Ingest documents into an agent's knowledge base
+
+        Args:
+            agent: Knowledge base owner ('audrey', 'carole' or 'shared')
+            documents: Documents to ingest (consumed lazily, one group at a time)
+            force: Re-embed and re-write even unchanged documents
+            report: Report to update in place (for progress of background jobs)
+
+        Returns:
+            Counts of processed, unchanged and embedded documents and chunks
+        """
+        if agent not in AGENT_OWNERS:
+            raise ValueError(f"Unknown agent '{agent}' (expected one of {', '.join(AGENT_OWNERS)})")
+
+        report = report or IngestReport()
+        started = time.perf_counter()
+        for group in _groups(documents, settings.ingest_group_documents):
+            try:
+                await self._ingest_group(agent, group, force, report)
+            except Exception as e:
+                # A failed hash lookup, embedding batch or upsert only loses this group
+                logger.error(f"Ingestion of {len(group)} documents for {agent} failed: {str(e)}")
+                report.failed_documents.extend(
+                    document.filename for document in group
+                    if document.filename not in report.failed_documents
+                )
+            report.seconds = round(time.perf_counter() - started, 3)
+            logger.info(
+                f"Ingestion for {agent}: {report.documents} documents, {report.embedded_chunks} chunks embedded, "
+                f"{report.unchanged_chunks} unchanged"
+            )
+        return report
+
+    async def _ingest_group(
+        self,
+        agent: str,
+        group: List[SourceDocument],
+        force: bool,
+        report: IngestReport,
+    ) -> None:
+        # Chunking is CPU-bound: keep it off the event loop
+        prepared: List[Tuple[str, str, List[Chunk]]] = []
+        for document in group:
+            try:
+                document_hash, chunks = await asyncio.to_thread(self._chunk, document)
+            except Exception as e:
+                logger.error(f"Failed to read {document.filename}: {str(e)}")
+                report.failed_documents.append(document.filename)
+                continue
+            prepared.append((document.filename, document_hash, chunks))
+
+        existing = {} if force else await self._existing_hashes(agent, [filename for filename, _, _ in prepared])
+
+        # Counted in the report only once the whole group is written
+        counts = IngestReport()
+        upserts = []
+        pending: List[Chunk] = []
+        for filename, document_hash, chunks in prepared:
+            counts.documents += 1
+            counts.chunks += len(chunks)
+            stored = existing.get(filename)
+            if stored and stored["hash"] == document_hash:
+                counts.unchanged_documents += 1
+                counts.unchanged_chunks += len(chunks)
+                continue
+
+            # Matched on content alone: an insertion shifts the positions of the chunks after it
+            stored_chunks = stored["chunks"] if stored else {}
+            stored_hashes = set(stored_chunks.values())
+            changed = [chunk for chunk in chunks if stored_chunks.get(chunk.index) != chunk.content_hash]
+            new = [chunk for chunk in changed if chunk.content_hash not in stored_hashes]
+            counts.unchanged_chunks += len(chunks) - len(new)
+            pending.extend(new)
+            upserts.append((filename, document_hash, len(chunks), changed))
+
+        if upserts:
+            await self._write(agent, upserts, pending)
+            counts.embedded_chunks = len(pending)
+
+        report.documents += counts.documents
+        report.unchanged_documents += counts.unchanged_documents
+        report.chunks += counts.chunks
+        report.embedded_chunks += counts.embedded_chunks
+        report.unchanged_chunks += counts.unchanged_chunks
+
+    async def _write(
+        self,
+        agent: str,
+        upserts: List[Tuple[str, str, int, List[Chunk]]],
+        pending: List[Chunk],
+    ) -> None:
+        """
+        Embed the new chunks and upsert the group's documents in one call
+
+        Moved chunks (text already stored at another position) are sent
+        without an embedding: upsert_document_chunks reuses the stored one.
+        """
+        embeddings = await self._embed([chunk.content for chunk in pending])
+        vectors = {id(chunk): vector for chunk, vector in zip(pending, embeddings)}
+
+        await self._upsert(agent, [
+            {
+                "filename": filename,
+                "content_hash": document_hash,
+                "chunk_count": chunk_count,
+                "chunks": [
+                    {
+                        "chunk_index": chunk.index,
+                        "content": chunk.content,
+                        "content_hash": chunk.content_hash,
+                        "embedding": vectors.get(id(chunk)),
+                    }
+                    for chunk in changed
+                ],
+            }
+            for filename, document_hash, chunk_count, changed in upserts
+        ])
+
+    @staticmethod
+    def _chunk(document: SourceDocument) -> Tuple[str, List[Chunk]]:
+        """Document hash and chunks, streaming the document's blocks once"""
+        digest = hashlib.sha256()
+
+        def hashed_blocks() -> Iterator[str]:
+            for block in document.blocks():
+                digest.update(block.encode("utf-8"))
+                yield block
+
+        chunks = [
+            Chunk(index, text, content_hash(text))
+            for index, text in enumerate(
+                chunk_text(hashed_blocks(), settings.ingest_chunk_tokens, settings.ingest_chunk_overlap_tokens)
+            )
+        ]
+        return digest.hexdigest(), chunks
+
+    async def _existing_hashes(self, agent: str, filenames: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Stored document hash and chunk hashes by filename"""
+        if not filenames:
+            return {}
+        response = await http_clients.supabase.post(
+            f"{self.supabase_url}/rest/v1/rpc/document_chunk_hashes",
+            headers=self._headers(),
+            json={"p_agent": agent, "p_filenames": filenames},
+            timeout=30.0,
+        )
+        response.raise_for_status()
+
+        existing: Dict[str, Dict[str, Any]] = {}
+        for row in response.json():
+            document = existing.setdefault(row["filename"], {"hash": row["document_hash"], "chunks": {}})
+            if row.get("chunk_index") is not None:
+                document["chunks"][row["chunk_index"]] = row["chunk_hash"]
+        return existing
+
+    async def _embed(self, texts: List[str]) -> List[List[float]]:
+        """Embeddings for many texts: large batches, at most INGEST_EMBEDDING_CONCURRENCY in flight"""
+        semaphore = asyncio.Semaphore(settings.ingest_embedding_concurrency)
+        size = settings.ingest_embedding_batch_size
+
+        async def embed_batch(batch: List[str]) -> List[List[float]]:
+            async with semaphore:
+                with span("ingest_embedding", model=settings.embedding_model):
+                    response = await rag_service.openai_client.embeddings.create(
+                        model=settings.embedding_model,
+                        input=batch,
+                    )
+            return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+        batches = await asyncio.gather(*[
+            embed_batch(texts[start:start + size]) for start in range(0, len(texts), size)
+        ])
+        return [vector for batch in batches for vector in batch]
+
+    async def _upsert(self, agent: str, documents: List[Dict[str, Any]]) -> None:
+        with span("ingest_upsert"):
+            response = await http_clients.supabase.post(
+                f"{self.supabase_url}/rest/v1/rpc/upsert_document_chunks",
+                headers=self._headers(),
+                json={"p_agent": agent, "p_documents": documents},
+                timeout=120.0,
+            )
+            response.raise_for_status()
+
+    def start_job(self, agent: str, documents: List[SourceDocument], force: bool = False) -> IngestJob:
+        """Run an ingestion in the background; poll `jobs[job.id]` for progress"""
+        job = IngestJob(id=str(uuid.uuid4()), agent=agent)
+        self.jobs[job.id] = job
+        while len(self.jobs) > settings.ingest_max_jobs:
+            self.jobs.popitem(last=False)
+
+        task = asyncio.create_task(self._run_job(job, documents, force))
+        self._tasks[job.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.id, None))
+        return job
+
+    async def _run_job(self, job: IngestJob, documents: List[SourceDocument], force: bool) -> None:
+        try:
+            await self.ingest(job.agent, documents, force, report=job.report)
+            job.status = "done"
+        except Exception as e:
+            logger.error(f"Ingestion job {job.id} failed: {str(e)}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = datetime.now(timezone.utc).isoformat()
+
+    async def shutdown(self) -> None:
+        """Cancel running jobs (unchanged chunks are skipped when they are re-submitted)"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# Singleton instance
+ingestion_service = IngestionService()
+
+
+async def _run_cli(agent: str, paths: List[str], force: bool) -> IngestReport:
+    await http_clients.startup()
+    try:
+        return await ingestion_service.ingest(agent, documents_from_paths(paths), force)
+    finally:
+        await http_clients.shutdown()
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Ingest documents into an agent's knowledge base")
+    parser.add_argument("agent", choices=AGENT_OWNERS)
+    parser.add_argument("paths", nargs="+", help="Files or directories (.md, .txt, .pdf)")
+    parser.add_argument("--force", action="store_true", help="Re-embed unchanged documents too")
+    args = parser.parse_args()
+
+    report = asyncio.run(_run_cli(args.agent, args.paths, args.force))
+    print(
+        f"{report.documents} documents ({report.unchanged_documents} unchanged), "
+        f"{report.chunks} chunks: {report.embedded_chunks} embedded, {report.unchanged_chunks} unchanged, "
+        f"{len(report.failed_documents)} failed in {report.seconds:.1f}s"
+    )
+    for filename in report.failed_documents:
+        print(f"  failed: {filename}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""
+Local BM25 inverted index over the agent knowledge bases, fused with vector search by reciprocal rank fusion
+"""
+import asyncio
+import logging
+import math
+import threading
+import time
+from array import array
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+from config.settings import settings
+from services.http_clients import http_clients
+from services.rerankers import tokenize
+
+logger = logging.getLogger(__name__)
+
+AGENTS = ("audrey", "carole")
+EPOCH_CURSOR = ("1970-01-01T00:00:00+00:00", "00000000-0000-0000-0000-000000000000")
+
+# Okapi BM25 parameters (same as the hybrid reranker)
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Term frequencies are stored as uint16
+_MAX_TF = 65535
+
+
+class InvertedIndex:
+    """
+    Memory-resident BM25 index for one agent
+
+    Each term maps to two flat arrays (row numbers as uint32, term frequencies
+    as uint16), so postings cost 6 bytes each and are scored with NumPy
+    without copying. Updated chunks are appended and their old row
+    tombstoned; postings are compacted once dead rows pass
+    LEXICAL_INDEX_COMPACT_RATIO.
+
+    Searches run in worker threads: a lock keeps them from reading arrays
+    that an update is resizing (exported buffers cannot be resized).
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        self.lengths = array("I")
+        self.alive = bytearray()
+        self.ids: List[str] = []
+        self.contents: List[str] = []
+        self.filenames: List[Optional[str]] = []
+        self.owners: List[Optional[str]] = []
+        self.row_of: Dict[str, int] = {}
+        self.live_rows = 0
+        self.live_length = 0
+        # Keyset cursor (updated_at, id) of the last row pulled from Supabase
+        self.cursor: Tuple[str, str] = EPOCH_CURSOR
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.live_rows
+
+    def upsert(self, rows: List[Dict[str, Any]]) -> None:
+        """Insert or replace chunks exported by Supabase"""
+        if not rows:
+            return
+        with self._lock:
+            self._upsert(rows)
+
+    def _upsert(self, rows: List[Dict[str, Any]]) -> None:
+        for row in rows:
+            previous = self.row_of.get(row["id"])
+            if previous is not None:
+                self._kill(previous)
+            tokens = tokenize(row["content"])
+            index = len(self.ids)
+            for term, tf in Counter(tokens).items():
+                postings = self.postings.get(term)
+                if postings is None:
+                    postings = self.postings[term] = (array("I"), array("H"))
+                postings[0].append(index)
+                postings[1].append(min(tf, _MAX_TF))
+
+            self.row_of[row["id"]] = index
+            self.ids.append(row["id"])
+            self.contents.append(row["content"])
+            self.filenames.append(row.get("filename"))
+            self.owners.append(row.get("agent_owner"))
+            self.lengths.append(len(tokens))
+            self.alive.append(1)
+            self.live_rows += 1
+            self.live_length += len(tokens)
+
+        last = rows[-1]
+        self.cursor = (last["updated_at"], last["id"])
+
+        dead = len(self.ids) - self.live_rows
+        if dead > settings.lexical_index_compact_ratio * len(self.ids):
+            self._compact()
+
+    def _kill(self, row: int) -> None:
+        self.alive[row] = 0
+        self.live_rows -= 1
+        self.live_length -= self.lengths[row]
+
+    def compact(self) -> None:
+        """Drop tombstoned rows from the postings and renumber the live ones"""
+        with self._lock:
+            self._compact()
+
+    def _compact(self) -> None:
+        alive = np.frombuffer(bytes(self.alive), dtype=np.uint8).astype(bool)
+        renumber = np.cumsum(alive, dtype=np.int64) - 1
+
+        postings: Dict[str, Tuple[array, array]] = {}
+        for term, (rows, frequencies) in self.postings.items():
+            rows_np = np.frombuffer(rows, dtype=np.uint32)
+            keep = alive[rows_np]
+            if not keep.any():
+                continue
+            new_rows, new_frequencies = array("I"), array("H")
+            new_rows.frombytes(renumber[rows_np[keep]].astype(np.uint32).tobytes())
+            new_frequencies.frombytes(np.frombuffer(frequencies, dtype=np.uint16)[keep].tobytes())
+            postings[term] = (new_rows, new_frequencies)
+            del rows_np
+
+        live = np.flatnonzero(alive).tolist()
+        self.postings = postings
+        self.lengths = array("I", (self.lengths[i] for i in live))
+        self.alive = bytearray(b"\x01" * len(live))
+        self.ids = [self.ids[i] for i in live]
+        self.contents = [self.contents[i] for i in live]
+        self.filenames = [self.filenames[i] for i in live]
+        self.owners = [self.owners[i] for i in live]
+        self.row_of = {chunk_id: i for i, chunk_id in enumerate(self.ids)}
+
+    def search(self, query: str, match_count: int) -> List[Dict[str, Any]]:
+        """Top-k BM25 matches, same result shape as match_documents_{agent} plus 'bm25'"""
+        with self._lock:
+            return self._search(query, match_count)
+
+    def _search(self, query: str, match_count: int) -> List[Dict[str, Any]]:
+        terms = [term for term in set(tokenize(query)) if term in self.postings]
+        if not terms or not self.live_rows:
+            return []
+
+        alive = np.frombuffer(self.alive, dtype=np.uint8)
+        lengths = np.frombuffer(self.lengths, dtype=np.uint32)
+        average_length = self.live_length / self.live_rows or 1.0
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+
+        for term in terms:
+            rows, frequencies = self.postings[term]
+            rows_np = np.frombuffer(rows, dtype=np.uint32)
+            live = alive[rows_np].astype(bool)
+            document_frequency = int(live.sum())
+            if not document_frequency:
+                continue
+            rows_np = rows_np[live]
+            tf = np.frombuffer(frequencies, dtype=np.uint16)[live].astype(np.float32)
+            idf = math.log(1 + (self.live_rows - document_frequency + 0.5) / (document_frequency + 0.5))
+            length_norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[rows_np] / average_length)
+            # Each row appears once per term, so fancy-index accumulation is exact
+            scores[rows_np] += idf * tf * (BM25_K1 + 1) / (tf + length_norm)
+
+        candidates = np.flatnonzero(scores > 0)
+        if candidates.size > match_count:
+            top = np.argpartition(scores[candidates], -match_count)[-match_count:]
+            candidates = candidates[top]
+        candidates = candidates[np.argsort(-scores[candidates])]
+
+        return [
+            {
+                "id": self.ids[i],
+                "content": self.contents[i],
+                "filename": self.filenames[i],
+                "agent_owner": self.owners[i],
+                "bm25": float(scores[i]),
+            }
+            for i in candidates
+        ]
+
+    def stats(self) -> Dict[str, int]:
+        postings = sum(len(rows) for rows, _ in self.postings.values())
+        return {
+            "chunks": self.live_rows,
+            "dead_rows": len(self.ids) - self.live_rows,
+            "terms": len(self.postings),
+            "postings": postings,
+            "postings_bytes": postings * 6,
+        }
+
+
+def reciprocal_rank_fusion(rankings: List[List[Dict[str, Any]]], k: int, limit: int) -> List[Dict[str, Any]]:
+    """
+    Merge ranked result lists by reciprocal rank fusion
+
+    Each chunk scores sum(1 / (k + rank)) over the lists it appears in
+    (rank starting at 1); the first list's fields win when a chunk is in
+    several lists, with fields only the others have merged in.
+
+    Args:
+        rankings: Result lists, each best first (chunks keyed by 'id', else content)
+        k: RRF constant (60 in the original paper; higher flattens rank differences)
+        limit: Number of fused results to return
+
+    Returns:
+        Fused chunks, best first, with an 'rrf_score' field
+    """
+    fused: Dict[str, Dict[str, Any]] = {}
+    for ranking in rankings:
+        for rank, chunk in enumerate(ranking, 1):
+            key = chunk.get("id") or chunk["content"]
+            entry = fused.get(key)
+            if entry is None:
+                entry = fused[key] = {**chunk, "rrf_score": 0.0}
+            else:
+                for field_name, value in chunk.items():
+                    entry.setdefault(field_name, value)
+            entry["rrf_score"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda chunk: chunk["rrf_score"], reverse=True)[:limit]
+
+
+class LexicalIndex:
+    """Per-agent inverted indexes, refreshed from Supabase in the background"""
+
+    def __init__(self):
+        self.supabase_url = settings.supabase_url
+        self.supabase_key = settings.supabase_key
+        self.indexes: Dict[str, InvertedIndex] = {}
+        self.last_full_load = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def is_ready(self, agent: str) -> bool:
+        return agent in self.indexes
+
+    def search(self, query: str, agent: str, match_count: int) -> List[Dict[str, Any]]:
+        return self.indexes[agent].search(query, match_count)
+
+    async def _fetch_page(self, agent: str, cursor: Tuple[str, str]) -> List[Dict[str, Any]]:
+        response = await http_clients.supabase.post(
+            f"{self.supabase_url}/rest/v1/rpc/export_document_chunk_texts",
+            headers={
+                "apikey": self.supabase_key,
+                "Authorization": f"Bearer {self.supabase_key}",
+                "Content-Type": "application/json",
+            },
+            json={
+                "agent_filter": agent,
+                "updated_since": cursor[0],
+                "after_id": cursor[1],
+                "page_size": settings.lexical_index_page_size,
+            },
+            timeout=60.0,
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def _pull(self, agent: str, index: InvertedIndex) -> int:
+        """Pull every chunk changed since the index cursor"""
+        pulled = 0
+        while True:
+            rows = await self._fetch_page(agent, index.cursor)
+            # Off the event loop: waits for searches in flight on this index
+            await asyncio.to_thread(index.upsert, rows)
+            pulled += len(rows)
+            if len(rows) < settings.lexical_index_page_size:
+                return pulled
+
+    async def full_load(self, agent: str) -> None:
+        """Rebuild an agent's index from scratch (also drops deleted chunks)"""
+        started = time.perf_counter()
+        index = InvertedIndex()
+        await self._pull(agent, index)
+        self.indexes[agent] = index
+        logger.info(
+            f"Lexical index for {agent}: {len(index)} chunks, {len(index.postings)} terms "
+            f"in {(time.perf_counter() - started) * 1000:.0f}ms"
+        )
+
+    async def refresh(self, agent: str) -> None:
+        """Incrementally apply chunks changed since the last pull"""
+        index = self.indexes.get(agent)
+        if index is None:
+            await self.full_load(agent)
+            return
+
+        pulled = await self._pull(agent, index)
+        if pulled:
+            logger.info(f"Lexical index for {agent}: refreshed {pulled} chunks")
+
+    async def startup(self) -> None:
+        """Start the refresh loop (the first pass loads every agent)"""
+        self.last_full_load = time.monotonic()
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    async def shutdown(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            full = time.monotonic() - self.last_full_load >= settings.lexical_index_full_reload_seconds
+            for agent in AGENTS:
+                try:
+                    if full:
+                        await self.full_load(agent)
+                    else:
+                        await self.refresh(agent)
+                except Exception as e:
+                    # Searches keep using the previous index, or vector search alone if none yet
+                    logger.error(f"Lexical index refresh failed for {agent}: {str(e)}")
+            if full:
+                self.last_full_load = time.monotonic()
+
+            await asyncio.sleep(settings.lexical_index_refresh_seconds)
+
+    def stats(self) -> Dict[str, int]:
+        totals: Counter = Counter()
+        for index in self.indexes.values():
+            totals.update(index.stats())
+        return {"agents_ready": len(self.indexes), **totals}
+
+
+# Singleton instance
+lexical_index = LexicalIndex()
@@ -0,0 +1,300 @@
+"""
+Local in-process replica of the agent knowledge bases for vector search
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+import time
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+
+from config.settings import settings
+from services.http_clients import http_clients
+
+logger = logging.getLogger(__name__)
+
+AGENTS = ("audrey", "carole")
+EPOCH_CURSOR = ("1970-01-01T00:00:00+00:00", "00000000-0000-0000-0000-000000000000")
+
+# Index versions, unique across AgentIndex instances (a full load replaces the instance)
+_versions = itertools.count(1)
+
+
+class AgentIndex:
+    """
+    Chunks and unit-normalised embeddings for one agent, as a contiguous float32 matrix
+
+    `matrix` is a view of the first len(ids) rows of a buffer whose capacity
+    doubles when full, so pulling a knowledge base page by page copies each
+    row a constant number of times on average instead of once per page.
+    """
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+        self._buffer = np.zeros((0, dimension), dtype=np.float32)
+        self.matrix = self._buffer
+        self.ids: List[str] = []
+        self.contents: List[str] = []
+        self.filenames: List[Optional[str]] = []
+        self.owners: List[Optional[str]] = []
+        self.row_of: Dict[str, int] = {}
+        # Keyset cursor (updated_at, id) of the last row pulled from Supabase
+        self.cursor: Tuple[str, str] = EPOCH_CURSOR
+        # Changes on every upsert, in place or not: key for data derived from the rows
+        self.version = next(_versions)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _reserve(self, rows: int) -> None:
+        """Writable buffer with room for `rows` rows, doubling its capacity when it grows"""
+        if rows <= len(self._buffer) and self._buffer.flags.writeable:
+            return
+        buffer = np.empty((max(rows, 2 * len(self._buffer)), self.dimension), dtype=np.float32)
+        buffer[:len(self.matrix)] = self.matrix
+        self._buffer = buffer
+        self.matrix = buffer[:len(self.matrix)]
+
+    def upsert(self, rows: List[Dict[str, Any]]) -> None:
+        """Insert or replace chunks exported by Supabase"""
+        if not rows:
+            return
+
+        vectors = np.asarray([row["embedding"] for row in rows], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1.0, norms)
+
+        # A snapshot loaded with mmap is read-only: _reserve copies it before any write
+        self._reserve(len(self.matrix))
+
+        new_rows = []
+        for row, vector in zip(rows, vectors):
+            index = self.row_of.get(row["id"])
+            if index is None:
+                self.row_of[row["id"]] = len(self.ids)
+                self.ids.append(row["id"])
+                self.contents.append(row["content"])
+                self.filenames.append(row.get("filename"))
+                self.owners.append(row.get("agent_owner"))
+                new_rows.append(vector)
+            else:
+                self.matrix[index] = vector
+                self.contents[index] = row["content"]
+                self.filenames[index] = row.get("filename")
+                self.owners[index] = row.get("agent_owner")
+
+        if new_rows:
+            start = len(self.matrix)
+            self._reserve(start + len(new_rows))
+            self._buffer[start:start + len(new_rows)] = new_rows
+            self.matrix = self._buffer[:start + len(new_rows)]
+
+        last = rows[-1]
+        self.cursor = (last["updated_at"], last["id"])
+        self.version = next(_versions)
+
+    def search(
+        self,
+        query_embedding: List[float],
+        match_threshold: float,
+        match_count: int,
+    ) -> List[Dict[str, Any]]:
+        """Top-k cosine search, same result shape as match_documents_{agent}"""
+        if not self.ids:
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+
+        similarities = self.matrix @ (query / norm)
+        candidates = np.flatnonzero(similarities > match_threshold)
+        if candidates.size > match_count:
+            top = np.argpartition(similarities[candidates], -match_count)[-match_count:]
+            candidates = candidates[top]
+        candidates = candidates[np.argsort(-similarities[candidates])]
+
+        return [
+            {
+                "id": self.ids[i],
+                "content": self.contents[i],
+                "similarity": float(similarities[i]),
+                "filename": self.filenames[i],
+                "agent_owner": self.owners[i],
+            }
+            for i in candidates
+        ]
+
+    def save(self, directory: str, agent: str) -> None:
+        """Write a snapshot (matrix as .npy, metadata as JSON) atomically"""
+        os.makedirs(directory, exist_ok=True)
+        matrix_path = os.path.join(directory, f"{agent}.npy")
+        meta_path = os.path.join(directory, f"{agent}.json")
+
+        with open(matrix_path + ".tmp", "wb") as f:
+            np.save(f, np.ascontiguousarray(self.matrix))
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({
+                "ids": self.ids,
+                "contents": self.contents,
+                "filenames": self.filenames,
+                "owners": self.owners,
+                "cursor": list(self.cursor),
+            }, f, ensure_ascii=False)
+
+        os.replace(matrix_path + ".tmp", matrix_path)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    @classmethod
+    def load(cls, directory: str, agent: str, dimension: int) -> Optional["AgentIndex"]:
+        """Load a snapshot, memory-mapping the matrix; None if absent or unusable"""
+        matrix_path = os.path.join(directory, f"{agent}.npy")
+        meta_path = os.path.join(directory, f"{agent}.json")
+        if not (os.path.exists(matrix_path) and os.path.exists(meta_path)):
+            return None
+
+        matrix = np.load(matrix_path, mmap_mode="r")
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+
+        if matrix.ndim != 2 or matrix.shape != (len(meta["ids"]), dimension):
+            logger.warning(f"Ignoring inconsistent local index snapshot for {agent}")
+            return None
+
+        index = cls(dimension)
+        index._buffer = index.matrix = matrix
+        index.ids = meta["ids"]
+        index.contents = meta["contents"]
+        index.filenames = meta["filenames"]
+        index.owners = meta["owners"]
+        index.row_of = {chunk_id: i for i, chunk_id in enumerate(index.ids)}
+        index.cursor = tuple(meta["cursor"])
+        return index
+
+
+class LocalVectorIndex:
+    """Per-agent in-memory vector indexes, refreshed from Supabase in the background"""
+
+    def __init__(self):
+        self.supabase_url = settings.supabase_url
+        self.supabase_key = settings.supabase_key
+        self.snapshot_dir = settings.local_index_snapshot_dir
+        self.indexes: Dict[str, AgentIndex] = {}
+        self.last_full_load = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def is_ready(self, agent: str) -> bool:
+        return agent in self.indexes
+
+    def search(
+        self,
+        query_embedding: List[float],
+        agent: str,
+        match_threshold: float,
+        match_count: int,
+    ) -> List[Dict[str, Any]]:
+        return self.indexes[agent].search(query_embedding, match_threshold, match_count)
+
+    async def _fetch_page(self, agent: str, cursor: Tuple[str, str]) -> List[Dict[str, Any]]:
+        response = await http_clients.supabase.post(
+            f"{self.supabase_url}/rest/v1/rpc/export_document_chunks",
+            headers={
+                "apikey": self.supabase_key,
+                "Authorization": f"Bearer {self.supabase_key}",
+                "Content-Type": "application/json",
+            },
+            json={
+                "agent_filter": agent,
+                "updated_since": cursor[0],
+                "after_id": cursor[1],
+                "page_size": settings.local_index_page_size,
+            },
+            timeout=60.0,
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def _pull(self, agent: str, index: AgentIndex) -> int:
+        """Pull every chunk changed since the index cursor"""
+        pulled = 0
+        while True:
+            rows = await self._fetch_page(agent, index.cursor)
+            index.upsert(rows)
+            pulled += len(rows)
+            if len(rows) < settings.local_index_page_size:
+                return pulled
+
+    async def full_load(self, agent: str) -> None:
+        """Rebuild an agent's index from scratch (also drops deleted chunks)"""
+        started = time.perf_counter()
+        index = AgentIndex(settings.embedding_dimension)
+        await self._pull(agent, index)
+        self.indexes[agent] = index
+        if self.snapshot_dir:
+            await asyncio.to_thread(index.save, self.snapshot_dir, agent)
+        logger.info(
+            f"Local index for {agent}: loaded {len(index)} chunks "
+            f"in {(time.perf_counter() - started) * 1000:.0f}ms"
+        )
+
+    async def refresh(self, agent: str) -> None:
+        """Incrementally apply chunks changed since the last pull"""
+        index = self.indexes.get(agent)
+        if index is None:
+            await self.full_load(agent)
+            return
+
+        pulled = await self._pull(agent, index)
+        if pulled:
+            logger.info(f"Local index for {agent}: refreshed {pulled} chunks")
+            if self.snapshot_dir:
+                await asyncio.to_thread(index.save, self.snapshot_dir, agent)
+
+    async def startup(self) -> None:
+        """Load snapshots (or Supabase) and start the refresh loop"""
+        for agent in AGENTS:
+            if self.snapshot_dir:
+                try:
+                    snapshot = AgentIndex.load(self.snapshot_dir, agent, settings.embedding_dimension)
+                    if snapshot is not None:
+                        self.indexes[agent] = snapshot
+                        logger.info(f"Local index for {agent}: {len(snapshot)} chunks from snapshot")
+                except Exception as e:
+                    logger.error(f"Failed to load local index snapshot for {agent}: {str(e)}")
+
+        # Agents without a snapshot get a full load on the first refresh
+        self.last_full_load = time.monotonic()
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    async def shutdown(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            full = time.monotonic() - self.last_full_load >= settings.local_index_full_reload_seconds
+            for agent in AGENTS:
+                try:
+                    if full:
+                        await self.full_load(agent)
+                    else:
+                        await self.refresh(agent)
+                except Exception as e:
+                    # Searches keep using the previous index, or Supabase if none yet
+                    logger.error(f"Local index refresh failed for {agent}: {str(e)}")
+            if full:
+                self.last_full_load = time.monotonic()
+
+            await asyncio.sleep(settings.local_index_refresh_seconds)
+
+
+# Singleton instance
+local_vector_index = LocalVectorIndex()
@@ -0,0 +1,318 @@
+"""
+Bounded write-behind queue persisting chat messages to Supabase in bulk inserts
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+import httpx
+
+from config.settings import settings
+from services.http_clients import http_clients
+from services.conversation_service import conversation_service
+from services.metrics import span
+
+logger = logging.getLogger(__name__)
+
+# (user_id, message row) - user_id is needed to create the conversation row first
+QueuedMessage = Tuple[str, Dict[str, Any]]
+
+
+def _percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))]
+
+
+class MessageWriter:
+    """
+    Batches messages from all conversations into bulk inserts on `messages`
+
+    The queue is bounded (enqueue waits when full). Batches that cannot be
+    written are appended to a local spill file and replayed by the writer
+    task after the next successful write, or every
+    MESSAGE_SPILL_REPLAY_SECONDS while idle; rows still rejected after
+    MESSAGE_SPILL_MAX_ATTEMPTS go to a dead-letter file next to it. The
+    queue is drained on shutdown.
+    """
+
+    def __init__(self):
+        self.supabase_url = settings.supabase_url
+        self.supabase_key = settings.supabase_key
+        self.spill_path = settings.message_spill_path
+        self.dead_letter_path = self.spill_path + ".dead" if self.spill_path else None
+        self.batch_size = settings.message_flush_batch_size
+        self.queue: "asyncio.Queue[QueuedMessage]" = asyncio.Queue(maxsize=settings.message_queue_max_size)
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+        self._last_replay = 0.0
+
+        self.batches = 0
+        self.written = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.dead_lettered = 0
+        self.failures = 0
+        self._latencies_ms: Deque[float] = deque(maxlen=1000)
+
+    async def enqueue(self, user_id: str, messages: List[Dict[str, Any]]) -> None:
+        """Queue message rows for insertion (waits while the queue is full)"""
+        items = [(user_id, message) for message in messages]
+        conversation_service.track_unwritten(messages)
+        if self._task is None:
+            # Not running (scripts, or after shutdown): write through
+            await self._flush(items)
+            return
+
+        for item in items:
+            await self.queue.put(item)
+        if self.queue.qsize() >= self.batch_size:
+            self._wake.set()
+
+    def _drain(self) -> List[QueuedMessage]:
+        batch = []
+        while len(batch) < self.batch_size and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+    async def _insert(self, items: List[QueuedMessage]) -> None:
+        """Create missing conversations, then insert all rows in one request"""
+        conversations = {message["conversation_id"]: user_id for user_id, message in items}
+        created = await asyncio.gather(*[
+            conversation_service.ensure_conversation_exists(conversation_id, user_id)
+            for conversation_id, user_id in conversations.items()
+            if not conversation_service.is_known_conversation(conversation_id)
+        ])
+        if not all(created):
+            raise RuntimeError("could not create conversation rows")
+
+        response = await http_clients.supabase.post(
+            f"{self.supabase_url}/rest/v1/messages",
+            headers={
+                "apikey": self.supabase_key,
+                "Authorization": f"Bearer {self.supabase_key}",
+                "Content-Type": "application/json",
+                "Prefer": "return=minimal",
+            },
+            json=[message for _, message in items],
+            timeout=30.0,
+        )
+        response.raise_for_status()
+
+    async def _flush(self, items: List[QueuedMessage]) -> bool:
+        """Insert a batch, spilling it on failure; True if written"""
+        started = time.perf_counter()
+        try:
+            with span("persist"):
+                await self._insert(items)
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"Failed to write {len(items)} messages: {str(e)}")
+            # Still unwritten: history reads keep seeing them until replayed. Attempts
+            # are only counted on replay, against the rows actually rejected
+            self._spill([
+                {"user_id": user_id, "message": message, "attempts": 0}
+                for user_id, message in items
+            ])
+            return False
+
+        conversation_service.mark_written([message for _, message in items])
+        self._latencies_ms.append((time.perf_counter() - started) * 1000)
+        self.batches += 1
+        self.written += len(items)
+        logger.info(f"Saved {len(items)} messages in one batch")
+        return True
+
+    @staticmethod
+    def _append(path: str, entries: List[Dict[str, Any]]) -> None:
+        with open(path, "a", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _spill(self, entries: List[Dict[str, Any]]) -> None:
+        """Append undelivered messages to the spill file (dropped, with an error, if none)"""
+        if not entries:
+            return
+        if not self.spill_path:
+            logger.error(f"No MESSAGE_SPILL_PATH configured, dropping {len(entries)} messages")
+            conversation_service.mark_written([entry["message"] for entry in entries])
+            return
+        try:
+            self._append(self.spill_path, entries)
+            self.spilled += len(entries)
+        except Exception as e:
+            logger.error(f"Failed to spill {len(entries)} messages: {str(e)}")
+
+    def _dead_letter(self, entries: List[Dict[str, Any]]) -> None:
+        """Set aside messages Supabase keeps rejecting, for manual inspection"""
+        if not entries:
+            return
+        conversation_service.mark_written([entry["message"] for entry in entries])
+        try:
+            self._append(self.dead_letter_path, entries)
+            self.dead_lettered += len(entries)
+            logger.error(f"Moved {len(entries)} messages to {self.dead_letter_path}")
+        except Exception as e:
+            logger.error(f"Failed to dead-letter {len(entries)} messages: {str(e)}")
+
+    def _has_spill(self) -> bool:
+        return bool(self.spill_path) and (
+            os.path.exists(self.spill_path) or os.path.exists(self.spill_path + ".replay")
+        )
+
+    @staticmethod
+    def _is_rejected(error: Exception) -> bool:
+        """Whether Supabase refused the rows themselves (retrying later will not help soon)"""
+        if not isinstance(error, httpx.HTTPStatusError):
+            return False
+        status = error.response.status_code
+        return 400 <= status < 500 and status not in (408, 429)
+
+    async def _replay_batch(
+        self,
+        batch: List[Dict[str, Any]],
+        written: List[Dict[str, Any]],
+        rejected: List[Dict[str, Any]],
+    ) -> None:
+        """
+        Insert spilled entries, bisecting a rejected batch (4xx) down to the rows refused
+
+        Args:
+            batch: Spill entries to insert
+            written: Collects the entries inserted
+            rejected: Collects the entries refused on their own
+
+        Raises:
+            Any failure other than a rejection (Supabase down again)
+        """
+        try:
+            await self._insert([(entry["user_id"], entry["message"]) for entry in batch])
+        except Exception as e:
+            if not self._is_rejected(e):
+                raise
+            if len(batch) == 1:
+                logger.error(f"Spilled message rejected: {str(e)}")
+                rejected.extend(batch)
+                return
+            middle = len(batch) // 2
+            await self._replay_batch(batch[:middle], written, rejected)
+            await self._replay_batch(batch[middle:], written, rejected)
+            return
+        conversation_service.mark_written([entry["message"] for entry in batch])
+        written.extend(batch)
+
+    async def _replay_spill(self) -> None:
+        """
+        Re-send spilled messages in batches (writer task only, so never concurrently)
+
+        A rejected batch (4xx) is split until the refused rows are isolated, so
+        a malformed row never holds back or dead-letters valid ones; each
+        refused row is counted an attempt and dead-lettered after
+        MESSAGE_SPILL_MAX_ATTEMPTS. Any other failure means Supabase is down
+        again: the rest is spilled back untouched.
+        """
+        replay_path = self.spill_path + ".replay"
+        if not os.path.exists(replay_path):
+            # Left over from an interrupted replay otherwise
+            os.replace(self.spill_path, replay_path)
+
+        with open(replay_path, encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+
+        replayed = 0
+        retry: List[Dict[str, Any]] = []
+        dead: List[Dict[str, Any]] = []
+        for start in range(0, len(entries), self.batch_size):
+            batch = entries[start:start + self.batch_size]
+            written: List[Dict[str, Any]] = []
+            rejected: List[Dict[str, Any]] = []
+            error: Optional[Exception] = None
+            try:
+                await self._replay_batch(batch, written, rejected)
+            except Exception as e:
+                error = e
+            replayed += len(written)
+            for entry in rejected:
+                entry["attempts"] = entry.get("attempts", 0) + 1
+                if entry["attempts"] >= settings.message_spill_max_attempts:
+                    dead.append(entry)
+                else:
+                    retry.append(entry)
+            if error is not None:
+                done = {id(entry) for entry in written + rejected}
+                rest = [entry for entry in entries[start:] if id(entry) not in done]
+                logger.error(f"Spill replay failed, keeping {len(rest)} messages: {str(error)}")
+                retry.extend(rest)
+                break
+
+        self._spill(retry)
+        self._dead_letter(dead)
+        os.remove(replay_path)
+        self.replayed += replayed
+        logger.info(f"Replayed {replayed} spilled messages")
+
+    async def _replay_if_spilled(self) -> None:
+        self._last_replay = time.monotonic()
+        if not self._has_spill():
+            return
+        try:
+            await self._replay_spill()
+        except Exception as e:
+            logger.error(f"Failed to replay spilled messages: {str(e)}")
+
+    async def startup(self) -> None:
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def shutdown(self) -> None:
+        """Write everything still queued, then stop the flush loop"""
+        if self._task:
+            self._stopping = True
+            self._wake.set()
+            await self._task
+            self._task = None
+
+    async def _run(self) -> None:
+        # Messages spilled (or mid-replay) before the last shutdown
+        await self._replay_if_spilled()
+        while True:
+            if self.queue.qsize() < self.batch_size and not self._stopping:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), settings.message_flush_interval_seconds)
+                except asyncio.TimeoutError:
+                    pass
+            self._wake.clear()
+
+            batch = self._drain()
+            if batch:
+                if await self._flush(batch):
+                    await self._replay_if_spilled()
+            elif self._stopping:
+                return
+            elif time.monotonic() - self._last_replay >= settings.message_spill_replay_seconds:
+                # Idle: no write will trigger a replay, so retry the spill on a timer
+                await self._replay_if_spilled()
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = list(self._latencies_ms)
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_max_size": self.queue.maxsize,
+            "batches": self.batches,
+            "written": self.written,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "dead_lettered": self.dead_lettered,
+            "failures": self.failures,
+            "flush_p50_ms": round(_percentile(latencies, 0.50), 1) if latencies else None,
+            "flush_p95_ms": round(_percentile(latencies, 0.95), 1) if latencies else None,
+        }
+
+
+# Singleton instance
+message_writer = MessageWriter()
@@ -0,0 +1,225 @@
+"""
+Lightweight tracing spans, latency histograms and Prometheus text exposition
+"""
+import bisect
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Log-spaced bucket bounds (seconds): 1ms to ~2min, 20% apart, so quantiles
+# estimated from the buckets stay within ~10% of the true value
+BUCKETS: Tuple[float, ...] = tuple(0.001 * 1.2 ** i for i in range(65))
+QUANTILES = (0.5, 0.95, 0.99)
+
+LabelValues = Tuple[str, ...]
+
+# Spans of the current request, oldest first (None outside a traced request)
+_current_trace: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "current_trace", default=None
+)
+
+
+class Histogram:
+    """Fixed-bucket histogram: O(log buckets) observe, no per-sample storage"""
+
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # Last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimated q-quantile (linear interpolation inside the bucket)"""
+        if not self.count:
+            return None
+        target = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= target and bucket_count:
+                lower = BUCKETS[i - 1] if i > 0 else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+                return lower + (upper - lower) * (target - cumulative) / bucket_count
+            cumulative += bucket_count
+        return BUCKETS[-1]
+
+
+class MetricFamily:
+    """A named metric with labelled series (histogram or counter)"""
+
+    def __init__(self, name: str, kind: str, help_text: str, labels: Tuple[str, ...]):
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.labels = labels
+        self.series: Dict[LabelValues, object] = {}
+
+
+class MetricsRegistry:
+    """Process-local registry rendered in Prometheus text format on /metrics"""
+
+    def __init__(self):
+        self._families: Dict[str, MetricFamily] = {}
+        self._gauges: Dict[str, Tuple[str, Callable[[], Dict[LabelValues, float]], Tuple[str, ...]]] = {}
+
+    def _family(self, name: str, kind: str, help_text: str, labels: Tuple[str, ...]) -> MetricFamily:
+        family = self._families.get(name)
+        if family is None:
+            family = MetricFamily(name, kind, help_text, labels)
+            self._families[name] = family
+        return family
+
+    def histogram(self, name: str, help_text: str, labels: Tuple[str, ...], values: LabelValues) -> Histogram:
+        family = self._family(name, "histogram", help_text, labels)
+        series = family.series.get(values)
+        if series is None:
+            series = family.series[values] = Histogram()
+        return series
+
+    def observe(self, name: str, help_text: str, labels: Tuple[str, ...], values: LabelValues, value: float) -> None:
+        self.histogram(name, help_text, labels, values).observe(value)
+
+    def inc(self, name: str, help_text: str, labels: Tuple[str, ...], values: LabelValues, amount: float = 1) -> None:
+        family = self._family(name, "counter", help_text, labels)
+        family.series[values] = family.series.get(values, 0) + amount
+
+    def gauge(
+        self,
+        name: str,
+        help_text: str,
+        labels: Tuple[str, ...],
+        collect: Callable[[], Dict[LabelValues, float]],
+    ) -> None:
+        """Register a gauge whose current values are collected at render time"""
+        self._gauges[name] = (help_text, collect, labels)
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines: List[str] = []
+        for family in self._families.values():
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for values, series in family.series.items():
+                labels = _labels(family.labels, values)
+                if family.kind == "counter":
+                    lines.append(f"{family.name}{_braces(labels)} {series:g}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(BUCKETS + (float("inf"),), series.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:.6g}"
+                    lines.append(f"{family.name}_bucket{_braces(labels + [_label('le', le)])} {cumulative}")
+                lines.append(f"{family.name}_sum{_braces(labels)} {series.sum:.6f}")
+                lines.append(f"{family.name}_count{_braces(labels)} {series.count}")
+
+            # Precomputed quantiles for dashboards that do not use histogram_quantile()
+            if family.kind == "histogram":
+                name = f"{family.name}_quantile"
+                lines.append(f"# HELP {name} Estimated quantiles of {family.name} since start")
+                lines.append(f"# TYPE {name} gauge")
+                for values, series in family.series.items():
+                    labels = _labels(family.labels, values)
+                    for q in QUANTILES:
+                        lines.append(f"{name}{_braces(labels + [_label('quantile', f'{q:g}')])} {series.quantile(q):.6f}")
+
+        for name, (help_text, collect, label_names) in self._gauges.items():
+            try:
+                samples = collect()
+            except Exception as e:
+                logger.error(f"Metrics collection failed for {name}: {str(e)}")
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for values, value in samples.items():
+                lines.append(f"{name}{_braces(_labels(label_names, values))} {value:g}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label(name: str, value: str) -> str:
+    return f'{name}="{_escape(value)}"'
+
+
+def _labels(names: Tuple[str, ...], values: LabelValues) -> List[str]:
+    return [_label(name, value) for name, value in zip(names, values)]
+
+
+def _braces(labels: List[str]) -> str:
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+# Singleton instance
+metrics = MetricsRegistry()
+
+STAGE_LABELS = ("stage", "agent", "model")
+
+
+@contextmanager
+def span(stage: str, agent: str = "", model: str = "") -> Iterator[None]:
+    """
+    Time a pipeline stage into chat_stage_duration_seconds (and the request trace)
+
+    Args:
+        stage: Stage name (e.g. 'load_history', 'rerank')
+        agent: Agent the stage ran for, if any
+        model: Model used by the stage, if any
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        metrics.inc("chat_stage_errors_total", "Pipeline stage failures", STAGE_LABELS, (stage, agent, model))
+        raise
+    finally:
+        observe_stage(stage, time.perf_counter() - started, agent, model)
+
+
+def observe_stage(stage: str, seconds: float, agent: str = "", model: str = "") -> None:
+    """Record a stage duration measured by the caller (see span)"""
+    metrics.observe(
+        "chat_stage_duration_seconds",
+        "Chat pipeline stage latency",
+        STAGE_LABELS,
+        (stage, agent, model),
+        seconds,
+    )
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.append((stage, seconds))
+
+
+def start_trace() -> List[Tuple[str, float]]:
+    """Collect the spans of the current request (tasks it starts inherit the trace)"""
+    trace: List[Tuple[str, float]] = []
+    _current_trace.set(trace)
+    return trace
+
+
+def format_trace(trace: List[Tuple[str, float]]) -> str:
+    return " ".join(f"{stage}={elapsed * 1000:.1f}ms" for stage, elapsed in trace)
+
+
+def record_usage(model: str, usage: Optional[Dict]) -> None:
+    """Record OpenRouter token usage (prompt, completion and cached prompt tokens)"""
+    if not usage:
+        return
+    labels = ("model", "kind")
+    help_text = "OpenRouter tokens by model"
+    metrics.inc("openrouter_tokens_total", help_text, labels, (model, "prompt"), usage.get("prompt_tokens") or 0)
+    metrics.inc("openrouter_tokens_total", help_text, labels, (model, "completion"), usage.get("completion_tokens") or 0)
+    cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+    if cached:
+        metrics.inc("openrouter_tokens_total", help_text, labels, (model, "cached"), cached)
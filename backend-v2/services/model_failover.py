@@ -0,0 +1,154 @@
+"""
+Per-model latency/error statistics, circuit breakers and hedging deadlines for OpenRouter
+"""
+import logging
+import random
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class ModelStats:
+    """Rolling window of recent call latencies and outcomes for one model"""
+
+    def __init__(self, window: int):
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+
+    def record(self, ok: bool, latency: Optional[float] = None) -> None:
+        self.outcomes.append(ok)
+        if ok and latency is not None:
+            self.latencies.append(latency)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if len(self.latencies) < settings.failover_min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))]
+
+    def error_rate(self) -> float:
+        return 1.0 - sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+
+class CircuitBreaker:
+    """
+    Opens after consecutive failures, then lets one probe through after a cooldown
+
+    closed -> open after `failure_threshold` consecutive failures;
+    open -> half_open once `cooldown_seconds` have passed (one probe at a time);
+    half_open -> closed on probe success, back to open on probe failure.
+    """
+
+    def __init__(self, failure_threshold: int, cooldown_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    def allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown_seconds:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.probing = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self.probing = False
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def abandon(self) -> None:
+        """A probe was cancelled before finishing (e.g. lost a hedge race)"""
+        self.probing = False
+
+
+class ModelFailover:
+    """Statistics and breakers per model, shared by all OpenRouter calls"""
+
+    def __init__(self):
+        self._stats: Dict[Tuple[str, str], ModelStats] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def stats(self, model: str, kind: str = "completion") -> ModelStats:
+        """Stats for a model; kind is 'completion' (full response) or 'first_token' (streams)"""
+        key = (model, kind)
+        if key not in self._stats:
+            self._stats[key] = ModelStats(settings.failover_stats_window)
+        return self._stats[key]
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        if model not in self._breakers:
+            self._breakers[model] = CircuitBreaker(
+                settings.circuit_breaker_failure_threshold,
+                settings.circuit_breaker_cooldown_seconds,
+            )
+        return self._breakers[model]
+
+    def allow(self, model: str) -> bool:
+        return self.breaker(model).allow()
+
+    def record_success(self, model: str, latency: float, kind: str = "completion") -> None:
+        self.stats(model, kind).record(True, latency)
+        self.breaker(model).record_success()
+
+    def record_failure(self, model: str, kind: str = "completion") -> None:
+        self.stats(model, kind).record(False)
+        breaker = self.breaker(model)
+        was_open = breaker.state == OPEN
+        breaker.record_failure()
+        if breaker.state == OPEN and not was_open:
+            logger.warning(f"Circuit opened for {model} after {breaker.consecutive_failures} failures")
+
+    def hedge_delay(self, model: str, kind: str = "completion") -> Optional[float]:
+        """Seconds to wait on `model` before hedging (None when hedging is disabled)"""
+        if not settings.failover_hedge_enabled:
+            return None
+        deadline = self.stats(model, kind).percentile(settings.failover_hedge_percentile)
+        if deadline is None:
+            return settings.failover_hedge_default_seconds
+        return max(settings.failover_hedge_min_seconds, deadline)
+
+    @staticmethod
+    def backoff(attempt: int, retry_after: Optional[str] = None) -> float:
+        """Full-jitter exponential backoff for 429s, honouring Retry-After (seconds) when given"""
+        ceiling = min(settings.openrouter_retry_max_seconds, settings.openrouter_retry_base_seconds * 2 ** attempt)
+        if retry_after:
+            try:
+                return min(settings.openrouter_retry_max_seconds, float(retry_after))
+            except ValueError:
+                pass
+        return random.uniform(0, ceiling)
+
+    def snapshot(self) -> Dict[str, Dict[str, Optional[float]]]:
+        """Circuit state (0 closed, 1 half-open, 2 open), error rate and p95 per model"""
+        return {
+            model: {
+                "circuit_state": float(STATE_VALUES[breaker.state]),
+                "error_rate": self.stats(model).error_rate(),
+                "p95_seconds": self.stats(model).percentile(0.95),
+            }
+            for model, breaker in self._breakers.items()
+        }
+
+
+# Singleton instance
+model_failover = ModelFailover()
@@ -1,15 +1,89 @@
 """
-OpenRouter client for LLM calls with automatic fallback support
+OpenRouter client for LLM calls with hedged requests and circuit-breaker failover
 """
+import asyncio
 import json
 import logging
-from typing import List, Dict, Any, Optional
+import time
+from typing import List, Dict, Any, Optional, AsyncIterator, Awaitable, Callable, TypeVar
 import httpx
 
 from config.settings import settings
+from services.http_clients import http_clients
+from services.metrics import metrics, span, record_usage
+from services.single_flight import SingleFlight
+from services.embedding_cache import normalize_text
+from services.context_assembler import MESSAGE_OVERHEAD_TOKENS, context_assembler
+from services.model_failover import model_failover
+from services.prompts import AGENT_PROMPTS, ORCHESTRATOR_PROMPT, render_static, system_message
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+
+def _retriable(error: Optional[BaseException]) -> bool:
+    """Failures another model may not share: 5xx, 429, timeouts and network errors"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500 or error.response.status_code == 429
+    return isinstance(error, httpx.RequestError)
+
+
+def _clip(text: str, max_tokens: int) -> str:
+    """Text cut to `max_tokens` tokens, with an ellipsis when it was cut"""
+    clipped = context_assembler.tokens.truncate(text, max_tokens)
+    return clipped if clipped == text else clipped.rstrip() + "..."
+
+
+def _count_failover(model: str, reason: str) -> None:
+    metrics.inc(
+        "openrouter_failovers_total",
+        "Requests sent to the fallback model (reason: hedge, error, circuit_open)",
+        ("model", "reason"),
+        (model, reason),
+    )
+
+
+def _discard_result(discard: Callable[[T], None]) -> Callable[["asyncio.Future[T]"], None]:
+    """Done-callback releasing the result of a call that lost the race, if it has one"""
+    def callback(task: "asyncio.Future[T]") -> None:
+        if not task.cancelled() and task.exception() is None:
+            discard(task.result())
+    return callback
+
+
+class _StreamRun:
+    """A stream consumed by its own task into a queue, so a hedge loser can be cancelled cleanly"""
+
+    _END = object()
+
+    def __init__(self, deltas: AsyncIterator[str]):
+        self.first: Optional[str] = None
+        self.queue: "asyncio.Queue[object]" = asyncio.Queue()
+        self.task = asyncio.ensure_future(self._pump(deltas))
+
+    async def _pump(self, deltas: AsyncIterator[str]) -> None:
+        try:
+            async for delta in deltas:
+                self.queue.put_nowait(delta)
+            self.queue.put_nowait(self._END)
+        except Exception as e:
+            self.queue.put_nowait(e)
+        finally:
+            await deltas.aclose()
+
+    async def next(self) -> Optional[str]:
+        """Next delta (None at the end of the stream); re-raises the stream's error"""
+        item = await self.queue.get()
+        if item is self._END:
+            return None
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    def cancel(self) -> None:
+        self.task.cancel()
+
 
 class OpenRouterClient:
     """Client for OpenRouter API with fallback logic"""
@@ -24,10 +98,30 @@ class OpenRouterClient:
             "fallback": settings.fallback_model,
         }
         self.timeout = httpx.Timeout(60.0, connect=10.0)
+        # Static system prefixes, rendered once and shared by every request
+        self.system_blocks = {
+            "orchestrator": render_static(ORCHESTRATOR_PROMPT, self.models["orchestrator"]),
+            **{agent: render_static(prompt, self.models[agent]) for agent, prompt in AGENT_PROMPTS.items()},
+        }
+        self.system_tokens = {
+            name: context_assembler.tokens.count(block["text"]) + MESSAGE_OVERHEAD_TOKENS
+            for name, block in self.system_blocks.items()
+        }
+        # Identical history-free requests in flight at the same time share one completion
+        self.completion_flight = SingleFlight("completion")
+
+    def _headers(self) -> Dict[str, str]:
+        """Request headers for OpenRouter API calls"""
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "HTTP-Referer": "https://lagencedescopines.com",
+            "X-Title": "L'Agence des Copines Chatbot v2",
+            "Content-Type": "application/json",
+        }
 
     async def chat_completion(
         self,
-        messages: List[Dict[str, str]],
+        messages: List[Dict[str, Any]],
         model: str,
         temperature: float = 0.7,
         max_tokens: int = 1000,
@@ -36,57 +130,307 @@ class OpenRouterClient:
         """
         Make chat completion request to OpenRouter
 
+        When the primary model is slower than its usual p95 the same request is
+        hedged on the fallback model and the first successful answer wins; a
+        primary whose circuit is open is skipped altogether.
+
         Args:
             messages: List of message dicts with 'role' and 'content'
             model: Model identifier (e.g., 'anthropic/claude-3.5-sonnet')
             temperature: Sampling temperature (0.0-1.0)
             max_tokens: Maximum tokens to generate
-            use_fallback: Whether to use fallback model on error
+            use_fallback: Whether to hedge / fail over to the fallback model
 
         Returns:
             Response dict with 'choices' containing generated text
         """
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "HTTP-Referer": "https://lagencedescopines.com",
-            "X-Title": "L'Agence des Copines Chatbot v2",
-            "Content-Type": "application/json",
+        payload = {
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            # Usage accounting: token counts including cached prompt tokens
+            "usage": {"include": True},
         }
+        fallback = self.models["fallback"]
+
+        if not use_fallback or model == fallback:
+            return await self._post_completion(model, payload)
+        if not model_failover.allow(model):
+            logger.warning(f"Circuit open for {model}, using fallback model {fallback}")
+            _count_failover(model, "circuit_open")
+            return await self._post_completion(fallback, payload)
+
+        return await self._hedged(
+            lambda candidate: self._post_completion(candidate, payload),
+            model,
+            fallback,
+            model_failover.hedge_delay(model),
+        )
+
+    async def _post_completion(self, model: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        One completion call on `model`, retrying 429s with jittered backoff
+
+        The outcome feeds the model's latency stats and circuit breaker; a call
+        cancelled because it lost a hedge race counts as neither.
+        """
+        payload = {**payload, "model": model}
+        started = time.perf_counter()
+        try:
+            with span("openrouter", model=model):
+                for attempt in range(settings.openrouter_max_retries + 1):
+                    response = await http_clients.openrouter.post(
+                        f"{self.base_url}/chat/completions",
+                        headers=self._headers(),
+                        json=payload,
+                        timeout=self.timeout,
+                    )
+                    if response.status_code == 429 and attempt < settings.openrouter_max_retries:
+                        await self._backoff(model, attempt, response.headers.get("retry-after"))
+                        continue
+                    response.raise_for_status()
+                    break
+
+        except asyncio.CancelledError:
+            model_failover.breaker(model).abandon()
+            raise
+
+        except httpx.HTTPStatusError as e:
+            logger.error(f"OpenRouter API error with {model}: {e.response.status_code} - {e.response.text}")
+            self._record_failure(model, e)
+            raise
+
+        except httpx.RequestError as e:
+            logger.error(f"Network error calling OpenRouter with {model}: {str(e)}")
+            self._record_failure(model, e)
+            raise
+
+        model_failover.record_success(model, time.perf_counter() - started)
+        result = response.json()
+        record_usage(model, result.get("usage"))
+        return result
+
+    async def _hedged(
+        self,
+        call: Callable[[str], Awaitable[T]],
+        model: str,
+        fallback: str,
+        hedge_after: Optional[float],
+        discard: Optional[Callable[[T], None]] = None,
+    ) -> T:
+        """
+        Run call(model); past `hedge_after` seconds also run call(fallback)
+
+        Returns the first successful result and cancels the other call. A
+        retriable failure (5xx, 429, timeout, network) of the primary before
+        the deadline goes straight to the fallback instead of waiting for it.
+
+        Args:
+            call: Starts the request on the given model
+            model: Primary model
+            fallback: Model to hedge or fail over to
+            hedge_after: Seconds before hedging (None: never hedge, only fail over)
+            discard: Releases a successful result that lost the race (e.g. an open stream)
+        """
+        tasks = {asyncio.ensure_future(call(model)): model}
+        fallback_started = hedged = False
+        error: Optional[BaseException] = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done and model_failover.allow(fallback):
+                logger.info(f"{model} slower than {hedge_after:.1f}s, hedging with {fallback}")
+                _count_failover(model, "hedge")
+                tasks[asyncio.ensure_future(call(fallback))] = fallback
+                fallback_started = hedged = True
+
+            while tasks:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                winner = None
+                for task in done:
+                    candidate = tasks.pop(task)
+                    if task.exception() is not None:
+                        error = task.exception()
+                    elif winner is None:
+                        winner = (task.result(), candidate)
+                    elif discard:
+                        discard(task.result())
+                if winner:
+                    result, candidate = winner
+                    if hedged and candidate == fallback:
+                        metrics.inc(
+                            "openrouter_hedge_wins_total",
+                            "Hedged requests answered first by the fallback model",
+                            ("model",),
+                            (model,),
+                        )
+                    return result
+
+                if not tasks and not fallback_started and _retriable(error) and model_failover.allow(fallback):
+                    logger.info(f"Retrying with fallback model: {fallback}")
+                    _count_failover(model, "error")
+                    tasks[asyncio.ensure_future(call(fallback))] = fallback
+                    fallback_started = True
+
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+                if discard:
+                    # A call that completed before (or despite) the cancel still holds its result
+                    task.add_done_callback(_discard_result(discard))
+
+    async def _backoff(self, model: str, attempt: int, retry_after: Optional[str]) -> None:
+        delay = model_failover.backoff(attempt, retry_after)
+        logger.warning(f"OpenRouter rate limited {model}, retrying in {delay:.2f}s")
+        metrics.inc("openrouter_retries_total", "OpenRouter calls retried after a 429", ("model",), (model,))
+        await asyncio.sleep(delay)
+
+    @staticmethod
+    def _record_failure(model: str, error: Exception, kind: str = "completion") -> None:
+        """Count provider-side failures against the model; plain 4xx say nothing about its health"""
+        if _retriable(error):
+            model_failover.record_failure(model, kind)
+        else:
+            model_failover.breaker(model).abandon()
+
+    async def chat_completion_stream(
+        self,
+        messages: List[Dict[str, Any]],
+        model: str,
+        temperature: float = 0.7,
+        max_tokens: int = 1000,
+        use_fallback: bool = True,
+    ) -> AsyncIterator[str]:
+        """
+        Stream a chat completion from OpenRouter (``stream: true``)
 
+        Failover and hedging apply until the first delta (deadline from the
+        model's time-to-first-token p95); after that the stream is committed.
+
+        Args:
+            messages: List of message dicts with 'role' and 'content'
+            model: Model identifier (e.g., 'anthropic/claude-3.5-sonnet')
+            temperature: Sampling temperature (0.0-1.0)
+            max_tokens: Maximum tokens to generate
+            use_fallback: Whether to hedge / fail over to the fallback model before the first delta
+
+        Yields:
+            Text deltas as they arrive from the model
+        """
         payload = {
-            "model": model,
             "messages": messages,
             "temperature": temperature,
             "max_tokens": max_tokens,
+            "stream": True,
+            "usage": {"include": True},
         }
+        fallback = self.models["fallback"]
+
+        if use_fallback and model != fallback and not model_failover.allow(model):
+            logger.warning(f"Circuit open for {model}, streaming from fallback model {fallback}")
+            _count_failover(model, "circuit_open")
+            model, use_fallback = fallback, False
+
+        if not use_fallback or model == fallback:
+            async for delta in self._stream(model, payload):
+                yield delta
+            return
+
+        run = await self._hedged(
+            lambda candidate: self._start_stream(candidate, payload),
+            model,
+            fallback,
+            model_failover.hedge_delay(model, "first_token"),
+            discard=_StreamRun.cancel,
+        )
+        try:
+            delta = run.first
+            while delta is not None:
+                yield delta
+                delta = await run.next()
+        finally:
+            run.cancel()
+
+    async def _start_stream(self, model: str, payload: Dict[str, Any]) -> "_StreamRun":
+        """Open a stream on `model` and wait for its first delta"""
+        run = _StreamRun(self._stream(model, payload))
+        try:
+            run.first = await run.next()
+        except BaseException:
+            run.cancel()
+            raise
+        return run
 
+    async def _stream(self, model: str, payload: Dict[str, Any]) -> AsyncIterator[str]:
+        """Text deltas of one streamed call on `model` (429s before the first delta are retried)"""
+        payload = {**payload, "model": model}
+        started = time.perf_counter()
+        first_token = False
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
+            for attempt in range(settings.openrouter_max_retries + 1):
+                async with http_clients.openrouter.stream(
+                    "POST",
                     f"{self.base_url}/chat/completions",
-                    headers=headers,
+                    headers=self._headers(),
                     json=payload,
-                )
-                response.raise_for_status()
-                return response.json()
+                    timeout=self.timeout,
+                ) as response:
+                    retry_after = response.headers.get("retry-after")
+                    if response.status_code != 429 or attempt == settings.openrouter_max_retries:
+                        if response.is_error:
+                            await response.aread()
+                        response.raise_for_status()
+
+                        async for line in response.aiter_lines():
+                            # SSE frames: "data: {...}", keep-alive comments start with ":"
+                            if not line.startswith("data:"):
+                                continue
+                            data = line[len("data:"):].strip()
+                            if data == "[DONE]":
+                                break
+
+                            try:
+                                chunk = json.loads(data)
+                            except json.JSONDecodeError:
+                                logger.warning(f"Skipping malformed stream chunk from {model}: {data[:100]}")
+                                continue
+
+                            if "error" in chunk:
+                                raise RuntimeError(f"OpenRouter stream error with {model}: {chunk['error']}")
+
+                            # Token usage arrives on the final chunk
+                            record_usage(model, chunk.get("usage"))
+
+                            choices = chunk.get("choices") or []
+                            delta = choices[0].get("delta", {}).get("content") if choices else None
+                            if delta:
+                                if not first_token:
+                                    first_token = True
+                                    model_failover.record_success(
+                                        model, time.perf_counter() - started, "first_token"
+                                    )
+                                yield delta
+                        return
+                await self._backoff(model, attempt, retry_after)
+
+        except asyncio.CancelledError:
+            if not first_token:
+                model_failover.breaker(model).abandon()
+            raise
 
         except httpx.HTTPStatusError as e:
-            logger.error(f"OpenRouter API error with {model}: {e.response.status_code} - {e.response.text}")
-
-            # Retry with fallback model if enabled and error is server-side
-            if use_fallback and e.response.status_code >= 500 and model != self.models["fallback"]:
-                logger.info(f"Retrying with fallback model: {self.models['fallback']}")
-                return await self.chat_completion(
-                    messages=messages,
-                    model=self.models["fallback"],
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                    use_fallback=False,  # Prevent infinite recursion
-                )
+            logger.error(f"OpenRouter stream error with {model}: {e.response.status_code} - {e.response.text}")
+            self._record_failure(model, e, "first_token")
             raise
 
         except httpx.RequestError as e:
-            logger.error(f"Network error calling OpenRouter: {str(e)}")
+            logger.error(f"Network error streaming from OpenRouter with {model}: {str(e)}")
+            self._record_failure(model, e, "first_token")
+            raise
+
+        except RuntimeError as e:
+            logger.error(str(e))
+            model_failover.record_failure(model, "first_token")
             raise
 
     async def orchestrate(self, user_message: str, history: List[Dict[str, str]]) -> Dict[str, Any]:
@@ -100,48 +444,24 @@ class OpenRouterClient:
         Returns:
             Decision dict with 'agent', 'confidence', 'primary_need', 'reasoning'
         """
-        system_prompt = """Tu es l'orchestrateur intelligent pour L'Agence des Copines.
-Tu analyses la demande de l'utilisateur et décides qui est le mieux placé pour répondre.
-
-👩‍💼 AUDREY - Experte Automation & Tunnels de Vente:
-- Funnels de vente et automatisation marketing
-- Email marketing et séquences automatisées
-- Outils techniques: Kajabi, Zapier, ActiveCampaign, Systeme.io
-- Stratégies de conversion et optimisation
-- Analytics, tracking, et métriques de performance
-
-🎨 CAROLE - Experte Création & Instagram:
-- Stratégie Instagram (reels, stories, posts, carrousels)
-- Création de contenu engageant et viral
-- Storytelling et copywriting authentique
-- Branding et identité visuelle cohérente
-- Community management et engagement
-- Design et esthétique
-
-ANALYSE:
-1. Lis le message de l'utilisateur
-2. Regarde l'historique de conversation pour contexte
-3. Identifie le besoin principal
-
-DÉCISION:
-Retourne UNIQUEMENT un JSON strictement formaté (pas de texte avant ou après):
-{
-  "agent": "audrey" | "carole" | "escalate",
-  "confidence": 0.0-1.0,
-  "primary_need": "description courte du besoin principal",
-  "reasoning": "explication de ta décision en 1 phrase"
-}
-
-Si incertain (confidence < 0.7), choisis "escalate"."""
+        if history:
+            return await self._orchestrate(user_message, history)
+        # Shared by identical first messages in flight; copied since callers annotate it
+        decision = await self.completion_flight.run(
+            ("orchestrator", normalize_text(user_message)),
+            lambda: self._orchestrate(user_message, history),
+        )
+        return dict(decision)
 
+    async def _orchestrate(self, user_message: str, history: List[Dict[str, str]]) -> Dict[str, Any]:
         # Format history for context
         history_text = "\n".join([
-            f"{msg['role']}: {msg['content'][:100]}..."
+            f"{msg['role']}: {_clip(msg['content'], settings.context_orchestrator_message_tokens)}"
             for msg in history[-5:]  # Last 5 messages for context
         ]) if history else "Pas d'historique"
 
         messages = [
-            {"role": "system", "content": system_prompt},
+            system_message(self.system_blocks["orchestrator"]),
             {"role": "user", "content": f"MESSAGE UTILISATEUR: {user_message}\n\nHISTORIQUE RÉCENT:\n{history_text}"}
         ]
 
@@ -168,6 +488,38 @@ Si incertain (confidence < 0.7), choisis "escalate"."""
                 "reasoning": "Impossible de parser la réponse de l'orchestrateur"
             }
 
+    def _agent_messages(
+        self,
+        agent: str,
+        rag_context: str,
+        user_message: str,
+        history: List[Dict[str, str]],
+    ) -> List[Dict[str, Any]]:
+        """
+        Assemble cached persona prefix, retrieved context, recent history and current message
+
+        History (running summary first, if any) gets whatever the model's
+        token budget leaves after the system prompt, context and current
+        message; oldest turns go first.
+        """
+        current = {"role": "user", "content": user_message}
+        history_budget = context_assembler.history_budget(
+            self.models[agent],
+            self.system_tokens[agent],
+            context_assembler.tokens.count_cached(rag_context),
+            context_assembler.message_tokens(current),
+        )
+
+        messages = [system_message(self.system_blocks[agent], rag_context)]
+
+        # Add history
+        messages.extend(context_assembler.fit_history(history, history_budget, settings.max_history_messages))
+
+        # Add current message
+        messages.append(current)
+
+        return messages
+
     async def audrey_response(
         self,
         user_message: str,
@@ -185,57 +537,7 @@ Si incertain (confidence < 0.7), choisis "escalate"."""
         Returns:
             Audrey's response text
         """
-        system_prompt = f"""Tu es Audrey, experte en automatisation marketing et tunnels de vente pour L'Agence des Copines.
-
-TA PERSONNALITÉ:
-- Structurée, claire, et pédagogue
-- Tu simplifies le technique pour les non-techniques
-- Tu donnes des étapes concrètes à suivre
-- Tu utilises des métaphores simples pour expliquer
-- Ton style: professionnel mais chaleureux et accessible
-
-TON EXPERTISE:
-- Tunnels de vente (funnels) et automatisation marketing
-- Email marketing et séquences automatisées
-- Outils techniques: Kajabi, Zapier, ActiveCampaign, Systeme.io
-- Systèmes de conversion et optimisation
-- Analytics, tracking, et métriques de performance
-- Automatisation de processus marketing
-
-CONTEXTE UTILISATEUR:
-- Professionnels du bien-être (coachs, thérapeutes, praticiens)
-- Solopreneurs qui veulent automatiser leur acquisition clients
-- Souvent novices en technique
-- Veulent des processus clairs step-by-step
-
-TON RÔLE:
-1. Décompose les problèmes techniques en étapes simples
-2. Explique le "pourquoi" avant le "comment"
-3. Donne des templates et frameworks actionnables
-4. Rassure sur la faisabilité technique
-5. Propose des quick wins rapides à implémenter
-
-RESSOURCES DISPONIBLES (BASE DE CONNAISSANCES):
-{rag_context}
-
-RÉPONDS EN FRANÇAIS avec le ton d'Audrey. Maximum 250 mots. Sois pratique et actionnable."""
-
-        messages = [{"role": "system", "content": system_prompt}]
-
-        # Add history
-        messages.extend(history[-settings.max_history_messages:])
-
-        # Add current message
-        messages.append({"role": "user", "content": user_message})
-
-        response = await self.chat_completion(
-            messages=messages,
-            model=self.models["audrey"],
-            temperature=settings.agent_temperature,
-            max_tokens=settings.agent_max_tokens,
-        )
-
-        return response["choices"][0]["message"]["content"]
+        return await self._agent_response("audrey", user_message, history, rag_context)
 
     async def carole_response(
         self,
@@ -254,59 +556,65 @@ RÉPONDS EN FRANÇAIS avec le ton d'Audrey. Maximum 250 mots. Sois pratique et a
         Returns:
             Carole's response text
         """
-        system_prompt = f"""Tu es Carole, experte en création de contenu Instagram pour L'Agence des Copines.
-
-TA PERSONNALITÉ:
-- Créative, inspirante, et chaleureuse
-- Tu parles avec enthousiasme de stratégie de contenu
-- Tu utilises des emojis naturellement (🎨✨📸💡)
-- Tu donnes des exemples concrets et visuels
-- Ton style: friendly, motivant, et énergisant
-
-TON EXPERTISE:
-- Stratégie Instagram (reels, stories, posts, carrousels)
-- Création de contenu engageant et viral
-- Storytelling authentique et captivant
-- Branding et cohérence visuelle
-- Planification éditoriale et calendrier de contenu
-- Hooks et copywriting accrocheurs
-- Community management et engagement
-
-CONTEXTE UTILISATEUR:
-- Professionnels du bien-être (coachs, thérapeutes, praticiens)
-- Solopreneurs qui veulent développer leur présence Instagram
-- Besoin de créer du contenu régulier et impactant
-- Veulent se démarquer avec authenticité
-
-TON RÔLE:
-1. Comprends le besoin créatif spécifique
-2. Donne des conseils actionnables immédiatement
-3. Propose des idées créatives et exemples concrets
-4. Encourage et motive avec enthousiasme
-5. Inspire à passer à l'action avec confiance
-
-RESSOURCES DISPONIBLES (BASE DE CONNAISSANCES):
-{rag_context}
-
-RÉPONDS EN FRANÇAIS avec le ton de Carole. Maximum 250 mots. Sois inspirante et créative! ✨"""
-
-        messages = [{"role": "system", "content": system_prompt}]
+        return await self._agent_response("carole", user_message, history, rag_context)
 
-        # Add history
-        messages.extend(history[-settings.max_history_messages:])
+    async def _agent_response(
+        self,
+        agent: str,
+        user_message: str,
+        history: List[Dict[str, str]],
+        rag_context: str,
+    ) -> str:
+        """Agent completion; history-free ones are shared by identical concurrent requests"""
+        async def generate() -> str:
+            response = await self.chat_completion(
+                messages=self._agent_messages(
+                    agent=agent,
+                    rag_context=rag_context,
+                    user_message=user_message,
+                    history=history,
+                ),
+                model=self.models[agent],
+                temperature=settings.agent_temperature,
+                max_tokens=settings.agent_max_tokens,
+            )
+            return response["choices"][0]["message"]["content"]
+
+        if history:
+            return await generate()
+        return await self.completion_flight.run((agent, normalize_text(user_message), rag_context), generate)
+
+    def stream_agent_response(
+        self,
+        agent: str,
+        user_message: str,
+        history: List[Dict[str, str]],
+        rag_context: str,
+    ) -> AsyncIterator[str]:
+        """
+        Stream a response from Audrey or Carole token by token
 
-        # Add current message
-        messages.append({"role": "user", "content": user_message})
+        Args:
+            agent: Which agent responds ('audrey' or 'carole')
+            user_message: Current user message
+            history: Recent conversation history
+            rag_context: Retrieved context from the agent's knowledge base
 
-        response = await self.chat_completion(
-            messages=messages,
-            model=self.models["carole"],
+        Returns:
+            Async iterator of text deltas
+        """
+        return self.chat_completion_stream(
+            messages=self._agent_messages(
+                agent=agent,
+                rag_context=rag_context,
+                user_message=user_message,
+                history=history,
+            ),
+            model=self.models[agent],
             temperature=settings.agent_temperature,
             max_tokens=settings.agent_max_tokens,
         )
 
-        return response["choices"][0]["message"]["content"]
-
 
 # Singleton instance
 openrouter_client = OpenRouterClient()
@@ -1,18 +1,63 @@
 """
 RAG (Retrieval Augmented Generation) service with dual agent knowledge bases
 """
+import asyncio
 import logging
-from typing import List, Dict, Any, Literal
+from typing import List, Dict, Any, Literal, Optional, Union
 import httpx
 from openai import AsyncOpenAI
 import cohere
 
 from config.settings import settings
+from services.http_clients import http_clients
+from services.embedding_cache import EmbeddingCache, normalize_text
+from services.local_vector_index import local_vector_index
+from services.lexical_index import lexical_index, reciprocal_rank_fusion
+from services.adaptive_retrieval import adaptive_retrieval, SKIP, TRIM
+from services.rerankers import build_reranker, HybridReranker
+from services.metrics import span
+from services.context_assembler import context_assembler
+from services.single_flight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
 AgentType = Literal["audrey", "carole"]
 
+# Context returned when retrieval fails, so generation can still proceed
+RAG_ERROR_CONTEXT = "Erreur lors de la récupération du contexte."
+
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+
+# Display labels used when formatting each agent's retrieved context
+AGENT_LABELS = {
+    "audrey": {"name": "Audrey", "icon": "📚", "kb": "d'Audrey"},
+    "carole": {"name": "Carole", "icon": "🎨", "kb": "de Carole"},
+}
+
+# Context returned when no chunk matched: answers built on it are not grounded
+NO_CONTEXT = {
+    agent: f"Pas de contexte spécifique trouvé dans la base de connaissances {labels['kb']}."
+    for agent, labels in AGENT_LABELS.items()
+}
+
+
+def is_grounded(rag_context: str) -> bool:
+    """True if the context carries retrieved chunks (not a retrieval error or no-match fallback)"""
+    return bool(rag_context) and rag_context != RAG_ERROR_CONTEXT and rag_context not in NO_CONTEXT.values()
+
+
+class QueryContext:
+    """
+    Per-request retrieval state
+
+    Holds the query and its embedding so the vector is computed at most once
+    per request and reused across agents, re-asks and speculative searches.
+    """
+
+    def __init__(self, query: str):
+        self.query = query
+        self.embedding_task: Optional[asyncio.Future] = None
+
 
 class RAGService:
     """Service for RAG operations with separate knowledge bases per agent"""
@@ -20,12 +65,30 @@ class RAGService:
     def __init__(self):
         self.openai_client = AsyncOpenAI(api_key=settings.openai_api_key)
         self.cohere_client = cohere.AsyncClient(api_key=settings.cohere_api_key)
+        self.reranker = build_reranker(self.cohere_client)
+        # Used when the configured reranker fails: real lexical + vector scores
+        self.fallback_reranker = HybridReranker(alpha=settings.rerank_hybrid_alpha)
         self.supabase_url = settings.supabase_url
         self.supabase_key = settings.supabase_key
+        self.embedding_cache = (
+            EmbeddingCache(
+                max_entries=settings.embedding_cache_max_entries,
+                ttl_seconds=settings.embedding_cache_ttl_seconds,
+                dimension=settings.embedding_dimension,
+                disk_path=settings.embedding_cache_path,
+                disk_slots=settings.embedding_cache_disk_slots,
+            )
+            if settings.embedding_cache_enabled
+            else None
+        )
+        # Identical queries in flight at the same time share one embedding, search and rerank
+        self.embedding_flight = SingleFlight("embedding")
+        self.retrieval_flight = SingleFlight("retrieval")
+        self.rerank_flight = SingleFlight("rerank")
 
     async def generate_embedding(self, text: str) -> List[float]:
         """
-        Generate embedding vector for text using OpenAI
+        Generate embedding vector for text using OpenAI (served from cache when possible)
 
         Args:
             text: Text to embed
@@ -33,12 +96,27 @@ class RAGService:
         Returns:
             List of floats representing the embedding vector
         """
+        if self.embedding_cache is not None:
+            cached = self.embedding_cache.get(text, settings.embedding_model)
+            if cached is not None:
+                return cached.tolist()
+
+        return await self.embedding_flight.run(
+            (settings.embedding_model, normalize_text(text)),
+            lambda: self._embed(text),
+        )
+
+    async def _embed(self, text: str) -> List[float]:
         try:
-            response = await self.openai_client.embeddings.create(
-                model=settings.embedding_model,
-                input=text,
-            )
-            return response.data[0].embedding
+            with span("embedding", model=settings.embedding_model):
+                response = await self.openai_client.embeddings.create(
+                    model=settings.embedding_model,
+                    input=text,
+                )
+            embedding = response.data[0].embedding
+            if self.embedding_cache is not None:
+                self.embedding_cache.put(text, settings.embedding_model, embedding)
+            return embedding
 
         except Exception as e:
             logger.error(f"Failed to generate embedding: {str(e)}")
@@ -52,7 +130,7 @@ class RAGService:
         match_count: int = None,
     ) -> List[Dict[str, Any]]:
         """
-        Perform vector similarity search in Supabase filtered by agent
+        Perform vector similarity search filtered by agent (local index or Supabase)
 
         Args:
             query_embedding: Query vector
@@ -66,12 +144,20 @@ class RAGService:
         threshold = match_threshold or settings.rag_similarity_threshold
         count = match_count or settings.rag_initial_results
 
+        # Local replica answers in-process when loaded; Supabase stays the fallback
+        if settings.local_index_enabled and local_vector_index.is_ready(agent):
+            try:
+                with span("vector_search_local", agent=agent):
+                    return local_vector_index.search(query_embedding, agent, threshold, count)
+            except Exception as e:
+                logger.error(f"Local vector search failed, falling back to Supabase: {str(e)}")
+
         # Determine which Supabase function to call based on agent
         function_name = f"match_documents_{agent}"
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
+            with span("vector_search", agent=agent):
+                response = await http_clients.supabase.post(
                     f"{self.supabase_url}/rest/v1/rpc/{function_name}",
                     headers={
                         "apikey": self.supabase_key,
@@ -86,8 +172,8 @@ class RAGService:
                     },
                     timeout=30.0,
                 )
-                response.raise_for_status()
-                return response.json()
+            response.raise_for_status()
+            return response.json()
 
         except httpx.HTTPStatusError as e:
             logger.error(f"Supabase vector search failed: {e.response.status_code} - {e.response.text}")
@@ -96,19 +182,97 @@ class RAGService:
             logger.error(f"Vector search error: {str(e)}")
             raise
 
+    async def retrieve(self, context: QueryContext, agent: AgentType) -> List[Dict[str, Any]]:
+        """
+        First-stage candidates for an agent: vector search, fused with BM25 in hybrid mode
+
+        With RAG_HYBRID_ENABLED and the agent's lexical index loaded, the BM25
+        lookup runs in a worker thread while the embedding and vector search
+        are in flight, and both rankings are merged by reciprocal rank
+        fusion. Exact terms (tool names, jargon) then surface even below the
+        similarity threshold, and the lexical results alone are used if
+        vector search fails.
+
+        Args:
+            context: Per-request query context (embedding shared across agents)
+            agent: Which agent's knowledge base to search ('audrey' or 'carole')
+
+        Returns:
+            Candidate chunks, best first (shared with identical concurrent queries: read-only)
+        """
+        return await self.retrieval_flight.run(
+            (agent, normalize_text(context.query)),
+            lambda: self._retrieve(context, agent),
+        )
+
+    async def _retrieve(self, context: QueryContext, agent: AgentType) -> List[Dict[str, Any]]:
+        if not (settings.rag_hybrid_enabled and lexical_index.is_ready(agent)):
+            return await self._vector_candidates(context, agent)
+
+        vector_task = asyncio.ensure_future(self._vector_candidates(context, agent))
+        try:
+            with span("lexical_search", agent=agent):
+                # CPU-bound scoring: kept off the event loop so the vector task proceeds meanwhile
+                lexical = await asyncio.to_thread(
+                    lexical_index.search, context.query, agent, settings.rag_hybrid_lexical_results
+                )
+        except asyncio.CancelledError:
+            vector_task.cancel()
+            raise
+        except Exception as e:
+            logger.error(f"Lexical search failed for {agent}: {str(e)}")
+            lexical = []
+
+        try:
+            vector = await vector_task
+        except Exception as e:
+            if not lexical:
+                raise
+            logger.error(f"Vector search failed for {agent}, using lexical results only: {str(e)}")
+            vector = []
+
+        fused = reciprocal_rank_fusion(
+            [vector, lexical],
+            k=settings.rag_hybrid_rrf_k,
+            limit=settings.rag_hybrid_rerank_candidates,
+        )
+        logger.info(
+            f"Hybrid retrieval for {agent}: {len(vector)} vector + {len(lexical)} lexical -> {len(fused)} candidates"
+        )
+        return fused
+
+    async def _vector_candidates(self, context: QueryContext, agent: AgentType) -> List[Dict[str, Any]]:
+        """Vector search; with RAG_ADAPTIVE_ENABLED, a small first page widened only when flat"""
+        embedding = await self.embed_query(context)
+        if not settings.rag_adaptive_enabled:
+            return await self.vector_search(query_embedding=embedding, agent=agent)
+
+        count = settings.rag_adaptive_initial_results
+        chunks = await self.vector_search(query_embedding=embedding, agent=agent, match_count=count)
+        if adaptive_retrieval.should_widen(agent, [chunk.get("similarity", 0.0) for chunk in chunks], count):
+            logger.info(f"Flat similarity distribution for {agent}: widening to {settings.rag_adaptive_max_results}")
+            chunks = await self.vector_search(
+                query_embedding=embedding,
+                agent=agent,
+                match_count=settings.rag_adaptive_max_results,
+            )
+        return chunks
+
     async def rerank_documents(
         self,
         query: str,
         documents: List[str],
         top_n: int = None,
+        similarities: Optional[List[float]] = None,
     ) -> List[Dict[str, Any]]:
         """
-        Rerank documents using Cohere's multilingual reranker
+        Rerank documents with the configured reranker (Cohere by default)
 
         Args:
             query: Original query text
             documents: List of document texts to rerank
             top_n: Number of top results to return
+            similarities: Vector similarity of each document, if known
 
         Returns:
             List of reranked documents with scores
@@ -116,138 +280,141 @@ class RAGService:
         top_n = top_n or settings.rag_rerank_top_n
 
         try:
-            response = await self.cohere_client.rerank(
-                model=settings.rerank_model,
-                query=query,
-                documents=documents,
-                top_n=top_n,
-            )
-
-            # Format results
-            reranked = []
-            for result in response.results:
-                reranked.append({
-                    "text": documents[result.index],
-                    "score": result.relevance_score,
-                    "index": result.index,
-                })
-
-            return reranked
+            return await self.reranker.rerank(query, documents, similarities, top_n)
 
         except Exception as e:
-            logger.error(f"Reranking failed: {str(e)}")
-            # Fallback: return top N documents without reranking
-            logger.warning("Falling back to non-reranked results")
-            return [
-                {"text": doc, "score": 1.0 - (i * 0.1), "index": i}
-                for i, doc in enumerate(documents[:top_n])
-            ]
+            logger.error(f"Reranking failed ({self.reranker.name}): {str(e)}")
+            logger.warning("Falling back to local hybrid reranking")
+            return await self.fallback_reranker.rerank(query, documents, similarities, top_n)
 
-    async def rag_audrey(self, query: str) -> str:
+    async def build_context(
+        self,
+        query: str,
+        agent: AgentType,
+        chunks: List[Dict[str, Any]],
+    ) -> str:
         """
-        Complete RAG pipeline for Audrey's knowledge base
+        Rerank retrieved chunks and format them as agent context
 
         Args:
             query: User's query text
+            agent: Which agent the context is for ('audrey' or 'carole')
+            chunks: First-stage candidates for that agent (see retrieve)
 
         Returns:
-            Formatted context string for Audrey
+            Formatted context string for the agent
         """
-        logger.info(f"Running RAG pipeline for Audrey with query: {query[:100]}...")
+        candidates = tuple(chunk.get("id") or chunk["content"] for chunk in chunks)
+        return await self.rerank_flight.run(
+            (agent, normalize_text(query), candidates),
+            lambda: self._build_context(query, agent, chunks),
+        )
 
-        try:
-            # Step 1: Generate embedding
-            embedding = await self.generate_embedding(query)
-
-            # Step 2: Vector search filtered for Audrey
-            chunks = await self.vector_search(
-                query_embedding=embedding,
-                agent="audrey",
-            )
-
-            if not chunks:
-                logger.warning("No relevant documents found for Audrey")
-                return "Pas de contexte spécifique trouvé dans la base de connaissances d'Audrey."
-
-            # Step 3: Rerank with Cohere
+    async def _build_context(
+        self,
+        query: str,
+        agent: AgentType,
+        chunks: List[Dict[str, Any]],
+    ) -> str:
+        labels = AGENT_LABELS[agent]
+
+        if not chunks:
+            logger.warning(f"No relevant documents found for {labels['name']}")
+            return NO_CONTEXT[agent]
+
+        # Adaptive depth: no rerank for a clear winner, only the head of the ranking otherwise
+        plan = None
+        if settings.rag_adaptive_enabled:
+            plan = adaptive_retrieval.plan(agent, [chunk.get("similarity") for chunk in chunks])
+            if plan.decision == TRIM:
+                chunks = sorted(chunks, key=lambda chunk: chunk["similarity"], reverse=True)[:plan.depth]
+
+        # Rerank
+        if plan is not None and plan.decision == SKIP:
+            order = sorted(range(len(chunks)), key=lambda i: chunks[i]["similarity"], reverse=True)
+            reranked = [
+                {"text": chunks[i]["content"], "score": chunks[i]["similarity"], "index": i}
+                for i in order[:settings.rag_rerank_top_n]
+            ]
+        else:
             document_texts = [chunk["content"] for chunk in chunks]
-            reranked = await self.rerank_documents(
-                query=query,
-                documents=document_texts,
-            )
-
-            # Step 4: Format context
-            context_parts = []
-            for i, result in enumerate(reranked, 1):
-                # Find original chunk to get metadata
-                original_chunk = chunks[result["index"]]
-                context_parts.append(
-                    f"📚 Source {i}: {original_chunk.get('filename', 'Document')}\n"
-                    f"Pertinence: {result['score']:.2f}\n"
-                    f"{result['text']}"
+            with span("rerank", agent=agent, model=self.reranker.name):
+                reranked = await self.rerank_documents(
+                    query=query,
+                    documents=document_texts,
+                    similarities=[chunk.get("similarity", 0.0) for chunk in chunks],
                 )
 
-            formatted_context = "\n\n---\n\n".join(context_parts)
-            logger.info(f"RAG Audrey: Retrieved {len(reranked)} relevant chunks")
+        # Format context
+        context_parts = []
+        for i, result in enumerate(reranked, 1):
+            # Find original chunk to get metadata
+            original_chunk = chunks[result["index"]]
+            context_parts.append(
+                f"{labels['icon']} Source {i}: {original_chunk.get('filename', 'Document')}\n"
+                f"Pertinence: {result['score']:.2f}\n"
+                f"{result['text']}"
+            )
 
-            return formatted_context
+        # Best-ranked sources first, within the context token budget
+        context_parts = context_assembler.fit_parts(context_parts, settings.context_rag_max_tokens, CONTEXT_SEPARATOR)
+        formatted_context = CONTEXT_SEPARATOR.join(context_parts)
+        logger.info(f"RAG {labels['name']}: Retrieved {len(reranked)} relevant chunks, {len(context_parts)} in context")
 
-        except Exception as e:
-            logger.error(f"RAG pipeline failed for Audrey: {str(e)}")
-            return "Erreur lors de la récupération du contexte."
+        return formatted_context
 
-    async def rag_carole(self, query: str) -> str:
+    async def embed_query(self, context: QueryContext) -> List[float]:
         """
-        Complete RAG pipeline for Carole's knowledge base
+        Embedding for the request's query, generated on first use and shared after
 
         Args:
-            query: User's query text
+            context: Per-request query context
 
         Returns:
-            Formatted context string for Carole
+            Query embedding vector
         """
-        logger.info(f"Running RAG pipeline for Carole with query: {query[:100]}...")
+        if context.embedding_task is None:
+            context.embedding_task = asyncio.ensure_future(self.generate_embedding(context.query))
+        # Shield so one cancelled consumer never cancels the shared embedding
+        return await asyncio.shield(context.embedding_task)
 
-        try:
-            # Step 1: Generate embedding
-            embedding = await self.generate_embedding(query)
+    async def rag_pipeline(
+        self,
+        query: Union[str, QueryContext],
+        agent: AgentType,
+    ) -> str:
+        """
+        Complete RAG pipeline for an agent's knowledge base
 
-            # Step 2: Vector search filtered for Carole
-            chunks = await self.vector_search(
-                query_embedding=embedding,
-                agent="carole",
-            )
+        Args:
+            query: User's query text, or the request's QueryContext to reuse its embedding
+            agent: Which agent's knowledge base to search ('audrey' or 'carole')
 
-            if not chunks:
-                logger.warning("No relevant documents found for Carole")
-                return "Pas de contexte spécifique trouvé dans la base de connaissances de Carole."
+        Returns:
+            Formatted context string for the agent
+        """
+        context = query if isinstance(query, QueryContext) else QueryContext(query)
+        name = AGENT_LABELS[agent]["name"]
+        logger.info(f"Running RAG pipeline for {name} with query: {context.query[:100]}...")
 
-            # Step 3: Rerank with Cohere
-            document_texts = [chunk["content"] for chunk in chunks]
-            reranked = await self.rerank_documents(
-                query=query,
-                documents=document_texts,
-            )
+        try:
+            # Step 1-2: Embedding (once per request) and vector search, fused with BM25 in hybrid mode
+            chunks = await self.retrieve(context, agent)
 
-            # Step 4: Format context
-            context_parts = []
-            for i, result in enumerate(reranked, 1):
-                # Find original chunk to get metadata
-                original_chunk = chunks[result["index"]]
-                context_parts.append(
-                    f"🎨 Source {i}: {original_chunk.get('filename', 'Document')}\n"
-                    f"Pertinence: {result['score']:.2f}\n"
-                    f"{result['text']}"
-                )
+            # Step 3-4: Rerank and format
+            return await self.build_context(context.query, agent, chunks)
 
-            formatted_context = "\n\n---\n\n".join(context_parts)
-            logger.info(f"RAG Carole: Retrieved {len(reranked)} relevant chunks")
+        except Exception as e:
+            logger.error(f"RAG pipeline failed for {name}: {str(e)}")
+            return RAG_ERROR_CONTEXT
 
-            return formatted_context
+    async def rag_audrey(self, query: Union[str, QueryContext]) -> str:
+        """Complete RAG pipeline for Audrey's knowledge base"""
+        return await self.rag_pipeline(query, "audrey")
 
-        except Exception as e:
-            logger.error(f"RAG pipeline failed for Carole: {str(e)}")
-            return "Erreur lors de la récupération du contexte."
+    async def rag_carole(self, query: Union[str, QueryContext]) -> str:
+        """Complete RAG pipeline for Carole's knowledge base"""
+        return await self.rag_pipeline(query, "carole")
 
 
 # Singleton instance
@@ -0,0 +1,202 @@
+"""
+In-process token-bucket rate limiter with periodic Supabase reconciliation
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from config.settings import settings
+from services.http_clients import http_clients
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucketLimiter:
+    """
+    Token buckets keyed by string, O(1) state per active key
+
+    Each bucket holds up to `capacity` tokens and refills continuously over
+    `window_seconds`. A bucket idle for a whole window is full again, so it
+    is simply dropped; keys are kept in LRU order to find those cheaply.
+    """
+
+    def __init__(self, capacity: int, window_seconds: float):
+        self.capacity = capacity
+        self.refill_rate = capacity / window_seconds
+        self.window_seconds = window_seconds
+        # key -> [tokens, last_refill_monotonic]
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+
+    def _bucket(self, key: str, now: float) -> List[float]:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [float(self.capacity), now]
+            self._buckets[key] = bucket
+        else:
+            bucket[0] = min(self.capacity, bucket[0] + (now - bucket[1]) * self.refill_rate)
+            bucket[1] = now
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def tokens(self, key: str, now: Optional[float] = None) -> float:
+        """Tokens currently available for a key (without consuming)"""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return float(self.capacity)
+        now = now if now is not None else time.monotonic()
+        return min(self.capacity, bucket[0] + (now - bucket[1]) * self.refill_rate)
+
+    def consume(self, key: str, now: float) -> None:
+        self._bucket(key, now)[0] -= 1.0
+
+    def debit(self, key: str, amount: float, now: float) -> None:
+        """Remove tokens used elsewhere (other workers); never below an empty bucket"""
+        bucket = self._bucket(key, now)
+        bucket[0] = max(0.0, bucket[0] - amount)
+
+    def evict_idle(self, now: float) -> int:
+        """Drop buckets idle for a full window (they would be full anyway)"""
+        evicted = 0
+        while self._buckets:
+            key, bucket = next(iter(self._buckets.items()))
+            if now - bucket[1] < self.window_seconds:
+                break
+            del self._buckets[key]
+            evicted += 1
+        return evicted
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._buckets
+
+
+class RateLimiter:
+    """
+    Per-conversation and per-user limits answered in-process
+
+    Idle buckets are evicted as requests come in, whether or not Supabase
+    is reachable, and unreported usage is only kept for keys that still
+    have a bucket, so memory stays proportional to the active keys.
+    """
+
+    def __init__(self):
+        self.supabase_url = settings.supabase_url
+        self.supabase_key = settings.supabase_key
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.conversations = TokenBucketLimiter(
+            settings.rate_limit_messages, settings.rate_limit_window_seconds
+        )
+        self.users = TokenBucketLimiter(
+            settings.rate_limit_user_messages, settings.rate_limit_window_seconds
+        )
+        # Local usage not yet reported to Supabase, and the server cursor of the last sync
+        self._pending: Dict[str, int] = {}
+        self._synced_until: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def acquire(self, conversation_id: str, user_id: Optional[str] = None) -> Tuple[bool, int]:
+        """
+        Take one message from the conversation (and user) buckets if both allow it
+
+        Returns:
+            Tuple of (allowed, remaining messages for the conversation)
+        """
+        now = time.monotonic()
+        # Amortised O(1): stops at the first bucket used within the window
+        self.conversations.evict_idle(now)
+        self.users.evict_idle(now)
+
+        conversation_key = f"conv:{conversation_id}"
+        user_key = f"user:{user_id}" if user_id else None
+
+        available = self.conversations.tokens(conversation_key, now)
+        if user_key:
+            available = min(available, self.users.tokens(user_key, now))
+        if available < 1.0:
+            return False, 0
+
+        self.conversations.consume(conversation_key, now)
+        if user_key:
+            self.users.consume(user_key, now)
+        if settings.rate_limit_sync_seconds > 0:
+            self._pending[conversation_key] = self._pending.get(conversation_key, 0) + 1
+            if user_key:
+                self._pending[user_key] = self._pending.get(user_key, 0) + 1
+
+        return True, int(self.conversations.tokens(conversation_key, now))
+
+    def remaining(self, conversation_id: str) -> int:
+        """Messages a conversation can still send right now (does not consume)"""
+        return int(self.conversations.tokens(f"conv:{conversation_id}"))
+
+    def _limiter_for(self, key: str) -> TokenBucketLimiter:
+        return self.users if key.startswith("user:") else self.conversations
+
+    async def sync(self) -> None:
+        """Report local usage in one batch and debit usage reported by other workers"""
+        pending, self._pending = self._pending, {}
+        try:
+            response = await http_clients.supabase.post(
+                f"{self.supabase_url}/rest/v1/rpc/sync_rate_limits",
+                headers={
+                    "apikey": self.supabase_key,
+                    "Authorization": f"Bearer {self.supabase_key}",
+                    "Content-Type": "application/json",
+                },
+                json={
+                    "p_worker_id": self.worker_id,
+                    "p_counts": pending,
+                    "p_since": self._synced_until,
+                },
+                timeout=10.0,
+            )
+            response.raise_for_status()
+            result = response.json()
+
+        except Exception as e:
+            # Keep the counts for the next attempt; limits stay enforced locally meanwhile.
+            # Keys evicted since were idle a whole window: their usage no longer limits anyone
+            for key, count in pending.items():
+                if key in self._limiter_for(key):
+                    self._pending[key] = self._pending.get(key, 0) + count
+            logger.warning(f"Rate limit sync failed: {str(e)}")
+            return
+
+        now = time.monotonic()
+        for key, count in (result.get("remote") or {}).items():
+            self._limiter_for(key).debit(key, count, now)
+        self._synced_until = result.get("synced_until", self._synced_until)
+
+        self.conversations.evict_idle(now)
+        self.users.evict_idle(now)
+
+    async def startup(self) -> None:
+        if settings.rate_limit_sync_seconds > 0:
+            self._task = asyncio.create_task(self._sync_loop())
+
+    async def shutdown(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            # Report what this worker consumed since the last sync
+            if self._pending:
+                await self.sync()
+
+    async def _sync_loop(self) -> None:
+        while True:
+            await asyncio.sleep(settings.rate_limit_sync_seconds)
+            await self.sync()
+
+
+# Singleton instance
+rate_limiter = RateLimiter()
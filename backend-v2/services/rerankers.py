@@ -0,0 +1,200 @@
+"""
+Pluggable rerankers for RAG candidates (Cohere, local BM25 hybrid, decisive-skip)
+"""
+import logging
+import math
+import re
+import unicodedata
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import List, Dict, Any, Optional
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+# Very common French/English words that carry no retrieval signal
+STOPWORDS = frozenset("""
+a au aux avec ce ces comment dans de des du elle en et est il ils je la le les leur
+mais me mes mon ne nous on ou par pas pour qu que qui sa se ses son sur ta te tes
+ton tu un une vos votre vous y d l j c s n m t
+the an and or of to in on for is are how what with my your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, accent-folded word tokens without stopwords"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return [token for token in _TOKEN.findall(text) if token not in STOPWORDS]
+
+
+def bm25_scores(
+    query_tokens: List[str],
+    documents_tokens: List[List[str]],
+    k1: float = 1.5,
+    b: float = 0.75,
+) -> List[float]:
+    """
+    Okapi BM25 of a query against a small document set
+
+    Document frequencies come from the set itself, which is what we want
+    when rescoring a handful of retrieved candidates.
+    """
+    n = len(documents_tokens)
+    if n == 0:
+        return []
+
+    avg_length = sum(len(tokens) for tokens in documents_tokens) / n or 1.0
+    document_frequency = Counter()
+    for tokens in documents_tokens:
+        document_frequency.update(set(tokens))
+
+    query_terms = set(query_tokens)
+    scores = []
+    for tokens in documents_tokens:
+        frequencies = Counter(tokens)
+        length_norm = k1 * (1 - b + b * len(tokens) / avg_length)
+        score = 0.0
+        for term in query_terms:
+            tf = frequencies.get(term)
+            if not tf:
+                continue
+            idf = math.log(1 + (n - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+            score += idf * tf * (k1 + 1) / (tf + length_norm)
+        scores.append(score)
+    return scores
+
+
+def _min_max(values: List[float]) -> List[float]:
+    low, high = min(values), max(values)
+    if high == low:
+        return [1.0 if high > 0 else 0.0 for _ in values]
+    return [(value - low) / (high - low) for value in values]
+
+
+def clear_head(similarities: Optional[List[float]], min_similarity: float, min_margin: float) -> bool:
+    """Whether the top similarity is high and far enough ahead of the runner-up to skip reranking"""
+    if not similarities:
+        return False
+    ranked = sorted(similarities, reverse=True)
+    runner_up = ranked[1] if len(ranked) > 1 else 0.0
+    return ranked[0] >= min_similarity and ranked[0] - runner_up >= min_margin
+
+
+def _by_score(documents: List[str], scores: List[float], top_n: int) -> List[Dict[str, Any]]:
+    order = sorted(range(len(documents)), key=lambda i: scores[i], reverse=True)[:top_n]
+    return [{"text": documents[i], "score": scores[i], "index": i} for i in order]
+
+
+class Reranker(ABC):
+    """Reorders retrieved candidates; results are dicts with 'text', 'score', 'index'"""
+
+    name = "base"
+
+    @abstractmethod
+    async def rerank(
+        self,
+        query: str,
+        documents: List[str],
+        similarities: Optional[List[float]],
+        top_n: int,
+    ) -> List[Dict[str, Any]]:
+        """Best `top_n` documents for the query, best first"""
+
+
+class CohereReranker(Reranker):
+    """Cohere multilingual cross-encoder reranking (network call)"""
+
+    name = "cohere"
+
+    def __init__(self, client):
+        self.client = client
+
+    async def rerank(self, query, documents, similarities, top_n):
+        response = await self.client.rerank(
+            model=settings.rerank_model,
+            query=query,
+            documents=documents,
+            top_n=top_n,
+        )
+        return [
+            {
+                "text": documents[result.index],
+                "score": result.relevance_score,
+                "index": result.index,
+            }
+            for result in response.results
+        ]
+
+
+class HybridReranker(Reranker):
+    """CPU-only BM25 over the candidates, fused with their vector similarity"""
+
+    name = "hybrid"
+
+    def __init__(self, alpha: float = 0.5):
+        # Weight of vector similarity vs. BM25 (both min-max normalised)
+        self.alpha = alpha
+
+    async def rerank(self, query, documents, similarities, top_n):
+        if not documents:
+            return []
+
+        lexical = _min_max(bm25_scores(tokenize(query), [tokenize(doc) for doc in documents]))
+        if similarities:
+            vector = _min_max(similarities)
+            # Keep the raw similarity scale so scores stay comparable across queries
+            top_similarity = max(similarities)
+            scores = [
+                top_similarity * (self.alpha * similarity + (1 - self.alpha) * lexical_score)
+                for similarity, lexical_score in zip(vector, lexical)
+            ]
+        else:
+            scores = lexical
+
+        return _by_score(documents, scores, top_n)
+
+
+class DecisiveSkipReranker(Reranker):
+    """Skips the inner reranker when the vector ranking already has a clear winner"""
+
+    name = "skip"
+
+    def __init__(self, inner: Reranker, min_top_similarity: float, min_margin: float):
+        self.inner = inner
+        self.min_top_similarity = min_top_similarity
+        self.min_margin = min_margin
+        self.skipped = 0
+        self.delegated = 0
+
+    def is_decisive(self, similarities: Optional[List[float]]) -> bool:
+        return clear_head(similarities, self.min_top_similarity, self.min_margin)
+
+    async def rerank(self, query, documents, similarities, top_n):
+        if self.is_decisive(similarities):
+            self.skipped += 1
+            return _by_score(documents, similarities, top_n)
+        self.delegated += 1
+        return await self.inner.rerank(query, documents, similarities, top_n)
+
+
+def build_reranker(cohere_client) -> Reranker:
+    """Reranker configured by RERANK_BACKEND and RERANK_SKIP_* settings"""
+    if settings.rerank_backend == "hybrid":
+        reranker: Reranker = HybridReranker(alpha=settings.rerank_hybrid_alpha)
+    elif settings.rerank_backend == "cohere":
+        reranker = CohereReranker(cohere_client)
+    else:
+        raise ValueError(f"Unknown rerank backend: {settings.rerank_backend}")
+
+    # Adaptive retrieval already decides skips (same rule and thresholds), per agent
+    if settings.rerank_skip_enabled and not settings.rag_adaptive_enabled:
+        reranker = DecisiveSkipReranker(
+            inner=reranker,
+            min_top_similarity=settings.rerank_skip_min_similarity,
+            min_margin=settings.rerank_skip_min_margin,
+        )
+    return reranker
@@ -0,0 +1,128 @@
+"""
+Semantic response cache: reuse an agent's answer for a near-identical question
+"""
+import logging
+import time
+from typing import Dict, List, Optional
+import numpy as np
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticPartition:
+    """Cached (question embedding, answer) pairs for one agent"""
+
+    def __init__(self, max_entries: int, dimension: int):
+        self.max_entries = max_entries
+        # Unit-normalised question embeddings, one row per slot
+        self.matrix = np.zeros((max_entries, dimension), dtype=np.float32)
+        self.expires_at = np.full(max_entries, -np.inf)
+        self.answers: List[Optional[str]] = [None] * max_entries
+        # Ring pointer: once full, the oldest slot is overwritten first
+        self._next = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, query: np.ndarray, max_distance: float) -> Optional[str]:
+        live = self.expires_at > time.monotonic()
+        if not live.any():
+            self.misses += 1
+            return None
+
+        similarities = self.matrix @ query
+        similarities[~live] = -np.inf
+        best = int(np.argmax(similarities))
+
+        if 1.0 - similarities[best] <= max_distance:
+            self.hits += 1
+            return self.answers[best]
+
+        self.misses += 1
+        return None
+
+    def store(self, query: np.ndarray, answer: str, ttl_seconds: float) -> None:
+        slot = self._next
+        self.matrix[slot] = query
+        self.expires_at[slot] = time.monotonic() + ttl_seconds
+        self.answers[slot] = answer
+        self._next = (slot + 1) % self.max_entries
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": int((self.expires_at > time.monotonic()).sum()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class SemanticCache:
+    """Per-agent nearest-neighbour cache of answers keyed on question embeddings"""
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        max_distance: float,
+        dimension: int,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        self.partitions = {
+            agent: SemanticPartition(max_entries, dimension)
+            for agent in ("audrey", "carole")
+        }
+
+    @staticmethod
+    def _normalise(embedding) -> Optional[np.ndarray]:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return None
+        return vector / norm
+
+    def lookup(self, agent: str, embedding) -> Optional[str]:
+        """
+        Cached answer for a question within max cosine distance, if any
+
+        Args:
+            agent: Agent the question was routed to
+            embedding: Question embedding
+
+        Returns:
+            Cached answer text or None
+        """
+        partition = self.partitions.get(agent)
+        query = self._normalise(embedding)
+        if partition is None or query is None:
+            return None
+
+        answer = partition.lookup(query, self.max_distance)
+        if answer is not None:
+            logger.info(f"Semantic cache hit for {agent}")
+        return answer
+
+    def store(self, agent: str, embedding, answer: str) -> None:
+        """Remember an answer for a question embedding"""
+        partition = self.partitions.get(agent)
+        query = self._normalise(embedding)
+        if partition is None or query is None:
+            return
+        partition.store(query, answer, self.ttl_seconds)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Per-agent counters for monitoring"""
+        return {agent: partition.stats() for agent, partition in self.partitions.items()}
+
+
+# Singleton instance
+semantic_cache = SemanticCache(
+    max_entries=settings.semantic_cache_max_entries,
+    ttl_seconds=settings.semantic_cache_ttl_seconds,
+    max_distance=settings.semantic_cache_max_distance,
+    dimension=settings.embedding_dimension,
+)
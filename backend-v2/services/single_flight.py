@@ -0,0 +1,114 @@
+"""
+Single-flight coalescing: concurrent identical calls share one in-flight result
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+from config.settings import settings
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Every SingleFlight by kind, for /health and /metrics
+FLIGHTS: Dict[str, "SingleFlight"] = {}
+
+
+class _Flight:
+    __slots__ = ("future", "waiters")
+
+    def __init__(self, future: asyncio.Future):
+        self.future = future
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time; callers arriving meanwhile await its result
+
+    Each caller awaits the shared call through a shield, so one caller being
+    cancelled (client gone, speculative branch dropped) does not cancel it
+    for the others; once the last waiting caller is gone the shared call is
+    cancelled too. Results are shared objects: callers must treat them as
+    read-only. Failures propagate to every caller and are not remembered;
+    the next call starts afresh.
+    """
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self._in_flight: Dict[Hashable, _Flight] = {}
+        self.calls = 0
+        self.coalesced = 0
+        FLIGHTS[kind] = self
+
+    async def run(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        """
+        Result of `call()`, shared with concurrent callers using the same key
+
+        Args:
+            key: Identity of the call (everything its result depends on)
+            call: Starts the call; only invoked if no identical call is in flight
+
+        Returns:
+            The (possibly shared) result
+        """
+        if not settings.request_coalescing_enabled:
+            return await call()
+
+        flight = self._in_flight.get(key)
+        if flight is None:
+            self.calls += 1
+            future = asyncio.ensure_future(call())
+            flight = self._in_flight[key] = _Flight(future)
+            future.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.coalesced += 1
+            metrics.inc(
+                "coalesced_calls_total",
+                "Upstream calls saved by attaching to an identical in-flight call",
+                ("kind",),
+                (self.kind,),
+            )
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.future)
+        except asyncio.CancelledError:
+            task = asyncio.current_task()
+            if not flight.future.cancelled() or (task is not None and task.cancelling()):
+                raise
+            # The shared call was cancelled from inside (e.g. its request's embedding
+            # was cancelled), not this caller: run our own
+            return await call()
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.future.done():
+                # Nobody wants the result any more: stop the upstream work
+                self._forget(key, flight.future)
+                flight.future.cancel()
+
+    def _forget(self, key: Hashable, future: asyncio.Future) -> None:
+        flight = self._in_flight.get(key)
+        if flight is not None and flight.future is future:
+            del self._in_flight[key]
+
+    def _finished(self, key: Hashable, future: asyncio.Future) -> None:
+        self._forget(key, future)
+        # Mark the outcome retrieved: callers that gave up would leave it unobserved
+        if not future.cancelled():
+            future.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.calls + self.coalesced
+        return {
+            "in_flight": len(self._in_flight),
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "coalesced_rate": round(self.coalesced / total, 4) if total else 0.0,
+        }
+
+
+def coalescing_stats() -> Dict[str, Dict[str, Any]]:
+    return {kind: flight.stats() for kind, flight in FLIGHTS.items()}
@@ -0,0 +1,89 @@
+"""
+Speculative retrieval: embed the query and search both agents' knowledge
+bases while the orchestrator is still deciding
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, List, Any, Optional
+
+from services.rag_service import rag_service, AgentType, QueryContext, RAG_ERROR_CONTEXT
+
+logger = logging.getLogger(__name__)
+
+AGENTS: List[AgentType] = ["audrey", "carole"]
+
+
+class SpeculativeRetrieval:
+    """Embedding + first-stage retrieval for both agents, started before routing is known"""
+
+    def __init__(self, context: QueryContext):
+        self.context = context
+        self.started_at = time.perf_counter()
+        self.saved_ms: Optional[float] = None
+        self._finished_at: Dict[str, float] = {}
+        self._searches = {
+            agent: asyncio.create_task(self._search(agent))
+            for agent in AGENTS
+        }
+
+    async def _search(self, agent: AgentType) -> List[Dict[str, Any]]:
+        chunks = await rag_service.retrieve(self.context, agent)
+        self._finished_at[agent] = time.perf_counter()
+        return chunks
+
+    def cancel(self, keep: Optional[str] = None) -> None:
+        """
+        Cancel speculative branches
+
+        Args:
+            keep: Agent whose branch should keep running (None cancels everything)
+        """
+        for agent, task in self._searches.items():
+            if agent != keep:
+                task.cancel()
+                task.add_done_callback(_discard_result)
+        embedding_task = self.context.embedding_task
+        if keep is None and embedding_task is not None:
+            embedding_task.cancel()
+            embedding_task.add_done_callback(_discard_result)
+
+    async def resolve(self, agent: AgentType) -> str:
+        """
+        Keep the winning branch, discard the other and build the agent context
+
+        Args:
+            agent: Agent chosen by the orchestrator
+
+        Returns:
+            Formatted context string for the agent
+        """
+        decided_at = time.perf_counter()
+        self.cancel(keep=agent)
+
+        try:
+            chunks = await self._searches[agent]
+        except Exception as e:
+            logger.error(f"Speculative retrieval failed for {agent}: {str(e)}")
+            return RAG_ERROR_CONTEXT
+
+        # Latency saved = retrieval time that overlapped with routing instead of following it
+        retrieval_time = self._finished_at[agent] - self.started_at
+        waited = time.perf_counter() - decided_at
+        self.saved_ms = max(0.0, retrieval_time - waited) * 1000
+        logger.info(
+            f"Speculative RAG for {agent}: retrieval {retrieval_time * 1000:.0f}ms, "
+            f"waited {waited * 1000:.0f}ms after routing, saved {self.saved_ms:.0f}ms"
+        )
+
+        try:
+            return await rag_service.build_context(self.context.query, agent, chunks)
+        except Exception as e:
+            logger.error(f"RAG pipeline failed for {agent}: {str(e)}")
+            return RAG_ERROR_CONTEXT
+
+
+def _discard_result(task: asyncio.Task) -> None:
+    """Retrieve a discarded task's outcome so asyncio does not log it as never retrieved"""
+    if not task.cancelled():
+        task.exception()
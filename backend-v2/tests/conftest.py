@@ -0,0 +1,44 @@
+"""
+Shared fixtures: Supabase and OpenRouter answered by an in-process mock transport
+"""
+import json
+import os
+from typing import Callable, List, Optional
+
+import httpx
+import pytest
+
+# Before any service singleton reads its settings
+os.environ.setdefault("SUPABASE_URL", "http://supabase.test")
+
+from services.http_clients import http_clients  # noqa: E402
+
+
+class MockUpstream:
+    """Records requests and answers them with `respond` (201 with an empty list by default)"""
+
+    def __init__(self):
+        self.requests: List[httpx.Request] = []
+        self.respond: Optional[Callable[[httpx.Request], httpx.Response]] = None
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if self.respond is not None:
+            return self.respond(request)
+        return httpx.Response(201, json=[])
+
+    def bodies(self, path: str) -> List:
+        return [json.loads(request.content) for request in self.requests if request.url.path == path]
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    mock = MockUpstream()
+    monkeypatch.setattr(
+        http_clients,
+        "_build",
+        lambda upstream: httpx.AsyncClient(transport=httpx.MockTransport(mock.handler)),
+    )
+    http_clients._clients = {upstream: None for upstream in http_clients._clients}
+    yield mock
+    http_clients._clients = {upstream: None for upstream in http_clients._clients}
@@ -0,0 +1,74 @@
+import json
+
+import httpx
+import pytest
+
+from config.settings import settings
+from services.ingestion import IngestionService, SourceDocument
+
+
+class DocumentsStore:
+    """`document_chunk_hashes` / `upsert_document_chunks` over an in-memory {filename: chunks} store"""
+
+    def __init__(self):
+        self.documents = {}
+
+    def respond(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        if request.url.path == "/rest/v1/rpc/document_chunk_hashes":
+            return httpx.Response(200, json=[
+                {"filename": filename, "document_hash": document["hash"], "chunk_index": index, "chunk_hash": chunk_hash}
+                for filename in body["p_filenames"] if filename in self.documents
+                for document in [self.documents[filename]]
+                for index, chunk_hash in document["chunks"].items()
+            ])
+        for doc in body["p_documents"]:
+            document = self.documents.setdefault(doc["filename"], {"chunks": {}})
+            stored_hashes = set(document["chunks"].values())
+            for chunk in doc["chunks"]:
+                # Like the RPC: a null embedding reuses the one stored for the same content
+                assert chunk["embedding"] is not None or chunk["content_hash"] in stored_hashes
+            document["hash"] = doc["content_hash"]
+            for chunk in doc["chunks"]:
+                document["chunks"][chunk["chunk_index"]] = chunk["content_hash"]
+            for index in [index for index in document["chunks"] if index >= doc["chunk_count"]]:
+                del document["chunks"][index]
+        return httpx.Response(200, json={})
+
+
+@pytest.fixture
+def service(upstream, monkeypatch):
+    store = DocumentsStore()
+    upstream.respond = store.respond
+    monkeypatch.setattr(settings, "ingest_chunk_tokens", 30)
+    monkeypatch.setattr(settings, "ingest_chunk_overlap_tokens", 0)
+
+    service = IngestionService()
+    service.embedded = []
+
+    async def embed(texts):
+        service.embedded.extend(texts)
+        return [[0.0] * 4 for _ in texts]
+
+    monkeypatch.setattr(service, "_embed", embed)
+    return service
+
+
+def _document(paragraphs):
+    text = "\n\n".join(paragraphs)
+    return SourceDocument("guide.md", lambda: iter([text]))
+
+
+async def test_insertion_at_the_top_only_embeds_the_new_chunk(service):
+    paragraphs = [f"Paragraphe {i}: " + "conseil pratique " * 4 for i in range(6)]
+    first = await service.ingest("audrey", [_document(paragraphs)])
+    assert first.embedded_chunks == first.chunks == 6
+
+    service.embedded.clear()
+    second = await service.ingest("audrey", [_document(["Introduction: " + "bienvenue " * 6] + paragraphs)])
+
+    # Every stored chunk shifted by one position but kept its embedding
+    assert second.chunks == 7
+    assert second.embedded_chunks == 1
+    assert second.unchanged_chunks == 6
+    assert service.embedded == ["Introduction: " + ("bienvenue " * 6).strip()]
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import os
+import uuid
+
+import httpx
+import pytest
+
+from config.settings import settings
+from services.conversation_service import conversation_service
+from services.message_writer import MessageWriter
+
+
+class MessagesTable:
+    """`messages` endpoint that can be down, slow, or reject rows with given contents"""
+
+    def __init__(self):
+        self.down = False
+        self.rejected = set()
+        self.delay = 0.0
+        self.rows = []
+
+    async def respond(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path != "/rest/v1/messages":
+            return httpx.Response(201, json=[])
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.down:
+            return httpx.Response(503)
+        rows = json.loads(request.content)
+        if any(row["content"] in self.rejected for row in rows):
+            return httpx.Response(400, json={"message": "invalid input"})
+        self.rows.extend(row["content"] for row in rows)
+        return httpx.Response(201)
+
+
+def _message(conversation_id: str, content: str) -> dict:
+    return {
+        "conversation_id": conversation_id,
+        "role": "user",
+        "content": content,
+        "created_at": "2025-01-01T00:00:00+00:00",
+    }
+
+
+def _read(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.fixture
+def table(upstream):
+    table = MessagesTable()
+    upstream.respond = table.respond
+    return table
+
+
+@pytest.fixture
+def writer(monkeypatch, tmp_path, table):
+    monkeypatch.setattr(settings, "message_spill_path", str(tmp_path / "spill.jsonl"))
+    monkeypatch.setattr(settings, "message_flush_batch_size", 2)
+    monkeypatch.setattr(settings, "message_flush_interval_seconds", 0.01)
+    monkeypatch.setattr(settings, "message_spill_max_attempts", 2)
+    return MessageWriter()
+
+
+async def test_failed_batch_is_spilled_and_replayed_after_next_success(writer, table):
+    conversation_id = str(uuid.uuid4())
+    table.down = True
+    await writer.enqueue("user", [_message(conversation_id, "first")])
+
+    assert [entry["message"]["content"] for entry in _read(writer.spill_path)] == ["first"]
+    # Spilled, not written: the next turn's history still includes it
+    assert [m["content"] for m in conversation_service._with_unwritten(conversation_id, [])] == ["first"]
+
+    table.down = False
+    await writer.startup()
+    await writer.enqueue("user", [_message(conversation_id, "second")])
+    await writer.shutdown()
+
+    assert sorted(table.rows) == ["first", "second"]
+    assert not os.path.exists(writer.spill_path)
+    assert not os.path.exists(writer.spill_path + ".replay")
+    assert writer.replayed == 1
+    assert conversation_service._with_unwritten(conversation_id, []) == []
+
+
+async def test_replay_concurrent_with_flushes_inserts_each_message_once(writer, table):
+    conversation_id = str(uuid.uuid4())
+    table.down = True
+    await writer.enqueue("user", [_message(conversation_id, f"spilled {i}") for i in range(5)])
+    table.down = False
+    table.delay = 0.02
+
+    await writer.startup()
+    for i in range(6):
+        await writer.enqueue("user", [_message(conversation_id, f"live {i}")])
+        await asyncio.sleep(0.01)
+    await writer.shutdown()
+
+    assert sorted(table.rows) == sorted([f"spilled {i}" for i in range(5)] + [f"live {i}" for i in range(6)])
+    assert writer.replayed == 5
+    assert not os.path.exists(writer.spill_path)
+    assert not os.path.exists(writer.spill_path + ".replay")
+
+
+async def test_rejected_row_is_isolated_and_dead_lettered_alone(writer, table):
+    conversation_id = str(uuid.uuid4())
+    table.down = True
+    # Batches of 2: the first one holds the bad row
+    await writer.enqueue("user", [_message(conversation_id, content) for content in ("bad", "a", "b")])
+    table.down = False
+    table.rejected = {"bad"}
+
+    await writer.startup()
+    await writer.shutdown()
+    # The rejected batch was split: its valid row went through, only the bad one is retried
+    assert sorted(table.rows) == ["a", "b"]
+    assert [(entry["message"]["content"], entry["attempts"]) for entry in _read(writer.spill_path)] == [("bad", 1)]
+
+    await writer.startup()
+    await writer.shutdown()
+    assert not os.path.exists(writer.spill_path)
+    assert [entry["message"]["content"] for entry in _read(writer.dead_letter_path)] == ["bad"]
+    assert writer.dead_lettered == 1
+    assert conversation_service._with_unwritten(conversation_id, []) == []
+
+
+async def test_spill_is_replayed_periodically_while_idle(writer, table, monkeypatch):
+    monkeypatch.setattr(settings, "message_spill_replay_seconds", 0.05)
+    conversation_id = str(uuid.uuid4())
+    table.down = True
+    await writer.startup()
+    await writer.enqueue("user", [_message(conversation_id, "m0"), _message(conversation_id, "m1")])
+    await asyncio.sleep(0.03)
+    assert os.path.exists(writer.spill_path)
+
+    # Supabase is back but nothing new is written
+    table.down = False
+    await asyncio.sleep(0.15)
+    assert sorted(table.rows) == ["m0", "m1"]
+    assert not os.path.exists(writer.spill_path)
+    await writer.shutdown()
+
+
+async def test_outage_during_replay_keeps_remaining_rows_for_later(writer, table):
+    conversation_id = str(uuid.uuid4())
+    table.down = True
+    await writer.enqueue("user", [_message(conversation_id, f"m{i}") for i in range(4)])
+
+    await writer.startup()
+    await writer.shutdown()
+
+    assert table.rows == []
+    entries = _read(writer.spill_path)
+    assert sorted(entry["message"]["content"] for entry in entries) == ["m0", "m1", "m2", "m3"]
+    # Outages never count towards dead-lettering
+    assert [entry["attempts"] for entry in entries] == [0, 0, 0, 0]
+    assert not os.path.exists(writer.dead_letter_path)
@@ -0,0 +1,133 @@
+import pytest
+
+from config.settings import settings
+from services import model_failover as model_failover_module
+from services.model_failover import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, ModelFailover
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(model_failover_module.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker(failure_threshold=3, cooldown_seconds=30)
+
+
+def _open(breaker: CircuitBreaker) -> None:
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+
+def test_opens_after_consecutive_failures_only(breaker):
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_half_open_lets_a_single_probe_through_after_cooldown(breaker, clock):
+    _open(breaker)
+    clock.now += 29
+    assert not breaker.allow()
+
+    clock.now += 1
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    # Concurrent callers wait for the probe's outcome
+    assert not breaker.allow()
+
+
+def test_probe_success_closes_the_circuit(breaker, clock):
+    _open(breaker)
+    clock.now += 30
+    assert breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.consecutive_failures == 0
+    assert breaker.allow() and breaker.allow()
+
+
+def test_probe_failure_reopens_for_a_new_cooldown(breaker, clock):
+    _open(breaker)
+    clock.now += 30
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+
+
+def test_abandoned_probe_frees_the_slot(breaker, clock):
+    _open(breaker)
+    clock.now += 30
+    assert breaker.allow()
+
+    breaker.abandon()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+
+
+def test_failover_tracks_breakers_per_model(monkeypatch, clock):
+    monkeypatch.setattr(settings, "circuit_breaker_failure_threshold", 2)
+    failover = ModelFailover()
+
+    failover.record_failure("primary")
+    failover.record_failure("primary")
+    failover.record_success("fallback", latency=0.5)
+
+    assert not failover.allow("primary")
+    assert failover.allow("fallback")
+    snapshot = failover.snapshot()
+    assert snapshot["primary"]["circuit_state"] == 2.0
+    assert snapshot["primary"]["error_rate"] == 1.0
+    assert snapshot["fallback"]["circuit_state"] == 0.0
+
+
+def test_hedge_delay_uses_latency_percentile_once_known(monkeypatch):
+    monkeypatch.setattr(settings, "failover_hedge_enabled", True)
+    monkeypatch.setattr(settings, "failover_min_samples", 5)
+    monkeypatch.setattr(settings, "failover_hedge_percentile", 0.95)
+    monkeypatch.setattr(settings, "failover_hedge_min_seconds", 1.0)
+    monkeypatch.setattr(settings, "failover_hedge_default_seconds", 15.0)
+    failover = ModelFailover()
+
+    assert failover.hedge_delay("m") == 15.0
+    for latency in (2.0, 2.0, 3.0, 3.0, 4.0):
+        failover.record_success("m", latency)
+    assert failover.hedge_delay("m") == 4.0
+
+    monkeypatch.setattr(settings, "failover_hedge_enabled", False)
+    assert failover.hedge_delay("m") is None
+
+
+def test_backoff_honours_retry_after_within_the_cap(monkeypatch):
+    monkeypatch.setattr(settings, "openrouter_retry_base_seconds", 0.5)
+    monkeypatch.setattr(settings, "openrouter_retry_max_seconds", 8.0)
+
+    assert ModelFailover.backoff(0, retry_after="3") == 3.0
+    assert ModelFailover.backoff(0, retry_after="120") == 8.0
+    assert 0.0 <= ModelFailover.backoff(10) <= 8.0
+    assert 0.0 <= ModelFailover.backoff(1, retry_after="soon") <= 1.0
@@ -0,0 +1,41 @@
+import asyncio
+
+from services.openrouter_client import OpenRouterClient
+
+
+async def test_hedge_loser_completing_after_the_winner_is_released():
+    released = []
+
+    async def call(model: str) -> str:
+        if model == "primary":
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                # Finished despite the cancel (e.g. its stream opened in the same tick)
+                return "primary stream"
+        return "fallback stream"
+
+    result = await OpenRouterClient()._hedged(call, "primary", "fallback", hedge_after=0.01, discard=released.append)
+    await asyncio.sleep(0.01)
+
+    assert result == "fallback stream"
+    assert released == ["primary stream"]
+
+
+async def test_cancelled_hedge_releases_calls_that_already_completed():
+    released = []
+    started = asyncio.Event()
+
+    async def call(model: str) -> str:
+        started.set()
+        return f"{model} stream"
+
+    client = OpenRouterClient()
+    hedged = asyncio.ensure_future(client._hedged(call, "primary", "fallback", hedge_after=1, discard=released.append))
+    await started.wait()
+    # The call is done but _hedged has not seen it yet when its caller goes away
+    hedged.cancel()
+    await asyncio.gather(hedged, return_exceptions=True)
+    await asyncio.sleep(0.01)
+
+    assert released == ["primary stream"]
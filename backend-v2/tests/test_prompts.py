@@ -0,0 +1,25 @@
+from config.settings import settings
+from services.prompts import AGENT_PROMPTS, ORCHESTRATOR_PROMPT, render_static
+
+SONNET = "anthropic/claude-3.5-sonnet"
+HAIKU = "anthropic/claude-3-haiku"
+
+
+def test_short_static_prefixes_get_no_cache_breakpoint():
+    # ~300-token personas are below every provider minimum: a breakpoint would never hit
+    assert "cache_control" not in render_static(ORCHESTRATOR_PROMPT, HAIKU)
+    for prompt in AGENT_PROMPTS.values():
+        assert "cache_control" not in render_static(prompt, SONNET)
+
+
+def test_breakpoint_follows_the_model_minimum():
+    prefix = "Consigne statique. " * 400  # ~1200 tokens
+
+    assert render_static(prefix, SONNET)["cache_control"] == {"type": "ephemeral"}
+    assert "cache_control" not in render_static(prefix, HAIKU)
+    assert "cache_control" in render_static(prefix * 2, HAIKU)
+
+
+def test_caching_disabled_sends_no_breakpoint(monkeypatch):
+    monkeypatch.setattr(settings, "prompt_caching_enabled", False)
+    assert "cache_control" not in render_static("Consigne statique. " * 1000, SONNET)
@@ -0,0 +1,111 @@
+import httpx
+import pytest
+
+from config.settings import settings
+from services import rate_limiter as rate_limiter_module
+from services.rate_limiter import RateLimiter, TokenBucketLimiter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limiter_module.time, "monotonic", clock)
+    return clock
+
+
+def test_bucket_refills_continuously_up_to_capacity():
+    limiter = TokenBucketLimiter(capacity=10, window_seconds=60)
+    for _ in range(10):
+        limiter.consume("k", now=0.0)
+    assert limiter.tokens("k", now=0.0) == 0.0
+    # One token every 6 seconds
+    assert limiter.tokens("k", now=30.0) == pytest.approx(5.0)
+    assert limiter.tokens("k", now=600.0) == 10.0
+
+
+def test_debit_never_goes_below_empty():
+    limiter = TokenBucketLimiter(capacity=10, window_seconds=60)
+    limiter.debit("k", 25, now=0.0)
+    assert limiter.tokens("k", now=0.0) == 0.0
+
+
+def test_evict_idle_drops_only_buckets_idle_for_a_window():
+    limiter = TokenBucketLimiter(capacity=10, window_seconds=60)
+    limiter.consume("old", now=0.0)
+    limiter.consume("recent", now=30.0)
+    assert limiter.evict_idle(now=70.0) == 1
+    assert "old" not in limiter
+    assert "recent" in limiter
+    # An evicted bucket is indistinguishable from a full one
+    assert limiter.tokens("old", now=70.0) == 10.0
+
+
+def test_acquire_enforces_conversation_and_user_limits(monkeypatch, clock):
+    monkeypatch.setattr(settings, "rate_limit_messages", 2)
+    monkeypatch.setattr(settings, "rate_limit_user_messages", 3)
+    limiter = RateLimiter()
+
+    assert limiter.acquire("c1", "u") == (True, 1)
+    assert limiter.acquire("c1", "u") == (True, 0)
+    assert limiter.acquire("c1", "u") == (False, 0)
+    assert limiter.acquire("c2", "u")[0] is True
+    # User bucket now empty, even for a fresh conversation
+    assert limiter.acquire("c3", "u") == (False, 0)
+
+
+def test_idle_keys_are_evicted_without_any_sync(monkeypatch, clock):
+    monkeypatch.setattr(settings, "rate_limit_sync_seconds", 0)
+    limiter = RateLimiter()
+    for i in range(100):
+        limiter.acquire(f"c{i}", f"u{i}")
+    assert len(limiter.conversations) == 100
+    assert limiter._pending == {}
+
+    clock.now += settings.rate_limit_window_seconds
+    limiter.acquire("fresh", "user")
+    assert len(limiter.conversations) == 1
+    assert len(limiter.users) == 1
+
+
+async def test_failed_syncs_keep_pending_counts_bounded(monkeypatch, clock, upstream):
+    monkeypatch.setattr(settings, "rate_limit_sync_seconds", 5.0)
+    upstream.respond = lambda request: httpx.Response(503)
+    limiter = RateLimiter()
+
+    for i in range(50):
+        limiter.acquire(f"c{i}", f"u{i}")
+    await limiter.sync()
+    assert len(limiter._pending) == 100
+
+    # Supabase still down a window later: stale usage is dropped with its bucket
+    clock.now += settings.rate_limit_window_seconds
+    limiter.acquire("c-new", "u-new")
+    await limiter.sync()
+    assert limiter._pending == {"conv:c-new": 1, "user:u-new": 1}
+    assert len(limiter.conversations) == 1
+
+
+async def test_sync_reports_usage_and_debits_remote_counts(monkeypatch, clock, upstream):
+    monkeypatch.setattr(settings, "rate_limit_sync_seconds", 5.0)
+    monkeypatch.setattr(settings, "rate_limit_messages", 10)
+    upstream.respond = lambda request: httpx.Response(
+        200, json={"remote": {"conv:c1": 7}, "synced_until": "2025-01-01T00:00:00Z"}
+    )
+    limiter = RateLimiter()
+
+    limiter.acquire("c1", "u")
+    await limiter.sync()
+
+    body = upstream.bodies("/rest/v1/rpc/sync_rate_limits")[0]
+    assert body["p_counts"] == {"conv:c1": 1, "user:u": 1}
+    assert limiter._pending == {}
+    assert limiter.remaining("c1") == 2
+    assert limiter._synced_until == "2025-01-01T00:00:00Z"
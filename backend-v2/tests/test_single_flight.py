@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+from config.settings import settings
+from services.single_flight import SingleFlight
+
+
+class Upstream:
+    """Counts calls; each one takes `delay` seconds unless cancelled"""
+
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.calls = 0
+        self.cancelled = 0
+
+    async def __call__(self):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return ["result"]
+
+
+@pytest.fixture(autouse=True)
+def coalescing_enabled(monkeypatch):
+    monkeypatch.setattr(settings, "request_coalescing_enabled", True)
+
+
+async def test_concurrent_identical_calls_share_one_result():
+    flight, upstream = SingleFlight("test_share"), Upstream()
+    results = await asyncio.gather(*[flight.run("k", upstream) for _ in range(10)])
+
+    assert upstream.calls == 1
+    assert all(result is results[0] for result in results)
+    assert flight.stats() == {"in_flight": 0, "calls": 1, "coalesced": 9, "coalesced_rate": 0.9}
+
+
+async def test_different_keys_and_later_calls_are_not_shared():
+    flight, upstream = SingleFlight("test_keys"), Upstream(delay=0)
+    await asyncio.gather(flight.run("a", upstream), flight.run("b", upstream))
+    await flight.run("a", upstream)
+    assert upstream.calls == 3
+
+
+async def test_disabled_never_coalesces(monkeypatch):
+    monkeypatch.setattr(settings, "request_coalescing_enabled", False)
+    flight, upstream = SingleFlight("test_disabled"), Upstream(delay=0.01)
+    await asyncio.gather(*[flight.run("k", upstream) for _ in range(3)])
+    assert upstream.calls == 3
+
+
+async def test_failure_reaches_every_caller_and_is_not_remembered():
+    flight = SingleFlight("test_failure")
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream down")
+
+    results = await asyncio.gather(*[flight.run("k", failing) for _ in range(3)], return_exceptions=True)
+    assert all(isinstance(result, ValueError) for result in results)
+    assert await flight.run("k", Upstream(delay=0)) == ["result"]
+
+
+async def test_cancelled_caller_does_not_cancel_the_others():
+    flight, upstream = SingleFlight("test_one_cancelled"), Upstream()
+    first = asyncio.ensure_future(flight.run("k", upstream))
+    second = asyncio.ensure_future(flight.run("k", upstream))
+    await asyncio.sleep(0.01)
+
+    first.cancel()
+    assert await second == ["result"]
+    assert first.cancelled()
+    assert (upstream.calls, upstream.cancelled) == (1, 0)
+
+
+async def test_shared_call_is_cancelled_when_its_last_caller_leaves():
+    flight, upstream = SingleFlight("test_all_cancelled"), Upstream(delay=1.0)
+    callers = [asyncio.ensure_future(flight.run("k", upstream)) for _ in range(2)]
+    await asyncio.sleep(0.01)
+
+    for caller in callers:
+        caller.cancel()
+    await asyncio.gather(*callers, return_exceptions=True)
+    await asyncio.sleep(0)
+
+    assert upstream.cancelled == 1
+    assert flight.stats()["in_flight"] == 0
+    # A new caller starts afresh instead of joining the cancelled call
+    upstream.delay = 0
+    assert await flight.run("k", upstream) == ["result"]
+    assert upstream.calls == 2
+
+
+async def test_caller_reruns_when_the_shared_call_is_cancelled_from_inside():
+    flight = SingleFlight("test_inner_cancel")
+    inner = {}
+
+    async def cancellable():
+        inner["task"] = asyncio.current_task()
+        await asyncio.sleep(1.0)
+
+    leader = asyncio.ensure_future(flight.run("k", cancellable))
+    await asyncio.sleep(0.01)
+    follower = asyncio.ensure_future(flight.run("k", Upstream(delay=0)))
+    await asyncio.sleep(0.01)
+
+    inner["task"].cancel()
+    # Neither caller was cancelled: the follower runs its own call instead of failing
+    assert await follower == ["result"]
+    leader.cancel()
+    await asyncio.gather(leader, return_exceptions=True)